@@ -4,7 +4,10 @@ All user‑facing strings have been translated from French to English.
 """
 
 from flask import (
+    Blueprint,
+    abort,
     Flask,
+    current_app,
     render_template,
     request,
     redirect,
@@ -12,46 +15,173 @@ from flask import (
     session,
     flash,
     jsonify,
+    make_response,
+    Response,
+    stream_with_context,
+    g,
+    has_request_context,
+    before_render_template,
+    template_rendered,
 )
-from werkzeug.security import check_password_hash, generate_password_hash
 from datetime import timedelta, datetime, date
 from flask_mail import Mail, Message
+from requests.adapters import HTTPAdapter
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
+from werkzeug.http import is_resource_modified
+import atexit
+import base64
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
 import os
 import re
+import threading
+import time
 import uuid
+from functools import partial, wraps
 import requests
-import psycopg2
-from openai import OpenAI
 from dotenv import load_dotenv
 
+from markupsafe import escape
+
+import db
+import hashing
+import logging_config
+import metrics
+import partitions
+from assets import MANIFEST as ASSET_MANIFEST, Assets
+from chat_context import HistoryCache, ROLE_BY_SENDER, build_messages, is_current
+from feedback_feed import FeedbackFeed
+from jobs import JobQueue
+from llm_gateway import GatewayError
+from memory import MemoryStore
+from model_router import ModelRouter
+from response_cache import LocalBackend, ResponseCache
+from rate_limit import SlidingWindowLimiter, backend_from_env as rate_limit_backend
+from session_store import ServerSessionInterface
+from summarizer import SessionSummarizer
+from transfer import CONTENT_TYPES as EXPORT_CONTENT_TYPES, export_slots, export_stream
+from turn_store import TurnWriter
+
 # ----------------------------- Configuration -----------------------------
 
 load_dotenv()
+logging_config.configure()
+log = logging.getLogger("cogi")
 
-app = Flask(__name__)
-app.secret_key = "supersecretkey"
-app.permanent_session_lifetime = timedelta(minutes=10)
-
-# Together AI API
-api_key = os.environ.get("TOGETHER_API_KEY", "").strip()
-if not api_key:
-    raise ValueError("TOGETHER_API_KEY is missing")
-client = OpenAI(api_key=api_key, base_url="https://api.together.xyz/v1")
-
-# Mail configuration (Mailtrap sandbox)
-app.config.update(
-    MAIL_SERVER="sandbox.smtp.mailtrap.io",
-    MAIL_PORT=587,
-    MAIL_USE_TLS=True,
-    MAIL_USERNAME=os.environ.get("EMAIL_USER"),
-    MAIL_PASSWORD=os.environ.get("EMAIL_PASS"),
-)
-mail = Mail(app)
+# Routes and request hooks live on this blueprint; create_app() builds the
+# Flask app, its model client and the per-app services around it.
+bp = Blueprint("main", __name__)
+mail = Mail()  # bound to the app in create_app()
+response_cache = ResponseCache.from_env()
+
+
+# Per-request timings: registered first so every other hook is measured.
+# Streamed bodies are produced after the response headers, so their time is
+# not part of the request histogram or the Server-Timing header.
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.begin_request()
+
+
+@bp.after_app_request
+def record_request_timings(response):
+    timings = metrics.end_request()
+    started = g.pop("request_started", None)
+    if timings is None or started is None:
+        return response
+    total = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.HTTP_REQUEST_SECONDS.observe(total, endpoint=endpoint, method=request.method, status=response.status_code)
+    metrics.REQUEST_DB_QUERIES.observe(timings["db_queries"], endpoint=endpoint)
+    metrics.REQUEST_DB_SECONDS.observe(timings["db"], endpoint=endpoint)
+    response.headers["Server-Timing"] = metrics.server_timing(timings, total)
+    return response
+
+
+def _render_started(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+    started = g.pop("render_started", None)
+    if started is not None:
+        metrics.add_time("render", time.perf_counter() - started)
+
+
+# Outgoing HTTP (reCAPTCHA) reuses pooled keep-alive connections.
+RECAPTCHA_VERIFY_URL = "https://www.google.com/recaptcha/api/siteverify"
+RECAPTCHA_TIMEOUT = (2, 3)  # (connect, read) seconds
+http = requests.Session()
+http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# E-mail is sent by background workers (see jobs.py).
+jobs = JobQueue.from_env()
 
-s = URLSafeTimedSerializer(app.secret_key)
 MAX_ATTEMPTS = 5
 
+# Failed logins and reset requests are counted in sliding windows, per
+# account and per client IP (see rate_limit.py).
+LOGIN_WINDOW = int(os.environ.get("LOGIN_WINDOW", 900))
+_limiter_backend = rate_limit_backend()
+login_account_limiter = SlidingWindowLimiter(MAX_ATTEMPTS, LOGIN_WINDOW, _limiter_backend)
+login_ip_limiter = SlidingWindowLimiter(
+    int(os.environ.get("LOGIN_IP_LIMIT", 20)), LOGIN_WINDOW, _limiter_backend
+)
+reset_account_limiter = SlidingWindowLimiter(3, 3600, _limiter_backend)
+reset_ip_limiter = SlidingWindowLimiter(10, 3600, _limiter_backend)
+
+# Long-term memory: user messages are embedded by job workers as they are
+# written, and recalled across sessions when a prompt is built.
+memory = MemoryStore.from_env(jobs)
+turn_writer = TurnWriter.from_env(on_written=memory.remember)
+
+SYSTEM_PROMPT = "You are a helpful mental‑health assistant."
+FALLBACK_REPLY = "⚠️ I couldn't generate a response right now."
+SAVE_FAILED_NOTICE = "⚠️ This reply could not be saved and will not appear in your history."
+CHAT_PAGE_SIZE = int(os.environ.get("CHAT_PAGE_SIZE", 50))
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGES = 25
+
+# Short-lived cache of user rows, shared by all requests of this process.
+profile_cache = LocalBackend(
+    max_entries=int(os.environ.get("PROFILE_CACHE_SIZE", 4096)),
+    ttl=float(os.environ.get("PROFILE_CACHE_TTL", 30)),
+)
+history_cache = HistoryCache()
+feedback_feed = FeedbackFeed.from_env()
+
+# Archived sessions are read back from their archive files by a job worker;
+# the chat page shows a "restoring" notice meanwhile (see partitions.py).
+_restoring = set()
+_restoring_lock = threading.Lock()
+
+
+def _templates_fingerprint():
+    """(content hash, newest mtime) of the templates and asset manifest, part of every page validator."""
+    digest = hashlib.sha1()
+    newest = 0.0
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+    paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder))]
+    # Pages embed fingerprinted asset URLs, so a rebuild must change their validators too.
+    manifest = os.path.join(assets.dist, ASSET_MANIFEST)
+    if os.path.exists(manifest):
+        paths.append(manifest)
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(os.path.basename(path).encode("utf-8") + f.read())
+        newest = max(newest, os.path.getmtime(path))
+    return digest.hexdigest()[:12], datetime.utcfromtimestamp(int(newest))
+
+
+# Fingerprinted, precompressed static files (see assets.py).
+assets = Assets()
+TEMPLATE_VERSION, TEMPLATES_MODIFIED = _templates_fingerprint()
+
 # ----------------------------- Utility Functions -----------------------------
 
 def is_strong_password(password: str) -> bool:
@@ -61,127 +191,414 @@ def is_strong_password(password: str) -> bool:
     )
 
 
-def get_db_connection():
-    return psycopg2.connect(
-        dbname="cogi_db", user="mac", password="cogi123", host="localhost", port="5432"
-    )
+def verify_captcha(recaptcha_response: str) -> bool:
+    """Check a reCAPTCHA token; network errors and timeouts count as failure."""
+    started = time.perf_counter()
+    try:
+        result = http.post(
+            RECAPTCHA_VERIFY_URL,
+            data={"secret": os.environ.get("RECAPTCHA_SECRET"), "response": recaptcha_response},
+            timeout=RECAPTCHA_TIMEOUT,
+        ).json()
+    except (requests.RequestException, ValueError) as exc:
+        metrics.CAPTCHA_SECONDS.observe(time.perf_counter() - started, outcome="error")
+        log.warning("CAPTCHA verification error: %s", exc)
+        return False
+    success = bool(result.get("success"))
+    metrics.CAPTCHA_SECONDS.observe(time.perf_counter() - started, outcome="ok" if success else "rejected")
+    return success
 
 
-def get_user_by_email(email: str):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT email, password, first_name, last_name, confirmed, attempts FROM users WHERE email = %s",
-        (email.lower(),),
-    )
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
+def restore_archived_session(session_id: str) -> None:
+    try:
+        partitions.restore_session(session_id)
+        history_cache.discard(session_id)
+    finally:
+        with _restoring_lock:
+            _restoring.discard(session_id)
+
+
+def request_restore(session_id: str) -> None:
+    """Queue a restore of ``session_id`` unless this process already has one pending."""
+    with _restoring_lock:
+        if session_id in _restoring:
+            return
+        _restoring.add(session_id)
+    jobs.enqueue("restore_session", session_id=session_id)
+
+
+def send_email(app: Flask, subject: str, recipient: str, body: str) -> None:
+    """Job handler (bound to an app in create_app): deliver one plain-text e-mail."""
+    with app.app_context():
+        msg = Message(subject, sender=app.config["MAIL_USERNAME"], recipients=[recipient])
+        msg.body = body
+        started = time.perf_counter()
+        try:
+            mail.send(msg)
+        except Exception:
+            metrics.MAIL_SECONDS.observe(time.perf_counter() - started, outcome="error")
+            raise
+        metrics.MAIL_SECONDS.observe(time.perf_counter() - started, outcome="ok")
+
+
+def serializer() -> URLSafeTimedSerializer:
+    """Signs e-mail confirmation and password-reset tokens."""
+    return URLSafeTimedSerializer(current_app.secret_key)
+
+
+def llm_router() -> ModelRouter:
+    return current_app.extensions["llm_router"]
+
+
+def get_user_by_email(email: str, use_cache: bool = True):
+    """Fetch a user row as a dict (None if unknown).
+
+    Results are memoized for the current request and kept in a short-TTL
+    process cache; pass ``use_cache=False`` to force a fresh read (e.g. when
+    checking credentials).
+    """
+    email = email.lower()
+    memo = g.setdefault("user_profiles", {}) if has_request_context() else {}
+    if use_cache:
+        if email in memo:
+            return memo[email]
+        cached = profile_cache.get(email)
+        if cached is not None:
+            memo[email] = cached
+            return cached
+
+    with db.cursor() as cur:
+        cur.execute(
+            "SELECT email, password, first_name, last_name, confirmed, locked_until FROM users WHERE email = %s",
+            (email,),
+        )
+        result = cur.fetchone()
+    user = None
     if result:
-        return {
+        user = {
             "email": result[0],
             "password": result[1],
             "first_name": result[2],
             "last_name": result[3],
             "confirmed": result[4],
-            "attempts": result[5],
+            "locked_until": result[5],
         }
-    return None
+        profile_cache.set(email, user)
+    memo[email] = user
+    return user
+
+
+def invalidate_user(email: str) -> None:
+    """Drop cached copies of a user row after writing to it."""
+    email = email.lower()
+    profile_cache.delete(email)
+    if has_request_context():
+        g.setdefault("user_profiles", {}).pop(email, None)
 
 
 def save_user(data: dict) -> bool:
     """Insert a new user. Returns False if email already exists or on error."""
 
     email = data.get("email", "").lower()
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    cur.execute("SELECT 1 FROM users WHERE email = %s", (email,))
-    if cur.fetchone():
-        cur.close()
-        conn.close()
+    password_hash = hashing.hash_password(data.get("password"))
+    try:
+        with db.cursor() as cur:
+            cur.execute("SELECT 1 FROM users WHERE email = %s", (email,))
+            if cur.fetchone():
+                return False
+
+            cur.execute(
+                """
+                INSERT INTO users (email, password, first_name, last_name, gender, dob, confirmed, attempts)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                (
+                    email,
+                    password_hash,
+                    data.get("first_name"),
+                    data.get("last_name"),
+                    data.get("gender"),
+                    data.get("dob") or None,
+                    False,
+                    0,
+                ),
+            )
+        return True
+    except Exception as exc:
+        log.error("Error saving user: %s", exc)
         return False
 
-    try:
+
+def save_turn(email: str, session_id: str, user_message: str, bot_reply: str, durable: bool = False) -> None:
+    """Persist a user message and the bot's reply together (see turn_store.py)."""
+    log.debug("Saving turn", extra={"session_id": session_id})
+    at = turn_writer.save(email, session_id, user_message, bot_reply, durable=durable)
+    history_cache.append(session_id, "user", user_message, at)
+    history_cache.append(session_id, "assistant", bot_reply, at)
+
+
+def conditional_page(validator: str, last_modified, render):
+    """Serve a page with ETag / Last-Modified validators.
+
+    ``validator`` must change whenever the page content does (templates are
+    covered separately). A client whose copy is current gets a 304 and
+    ``render`` is not called. Pages with pending flash messages are always
+    rendered.
+    """
+    if session.get("_flashes"):
+        return make_response(render())
+    etag = hashlib.sha1(f"{TEMPLATE_VERSION}:{validator}".encode("utf-8")).hexdigest()
+    if last_modified is not None:
+        last_modified = max(last_modified.replace(tzinfo=None), TEMPLATES_MODIFIED)
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response(render())
+    else:
+        response = Response(status=304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Revalidate on every visit; the page differs per visitor.
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = f"{ts.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    """Return (timestamp, id) from an opaque page cursor; raises ValueError if malformed."""
+    ts, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+    return datetime.fromisoformat(ts), int(row_id)
+
+
+def fetch_history_page(cur, email: str, session_id: str, before=None, limit: int = CHAT_PAGE_SIZE):
+    """Return one page of a session's messages, oldest first, plus the cursor of the next older page.
+
+    Pages are keyset-paginated on (timestamp, id); ``before`` is a cursor
+    from a previous page, or None for the newest messages.
+    """
+    if before:
+        ts, row_id = decode_cursor(before)
         cur.execute(
             """
-            INSERT INTO users (email, password, first_name, last_name, gender, dob, confirmed, attempts)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            SELECT id, message, sender, timestamp
+            FROM conversations
+            WHERE user_email = %s AND session_id = %s AND (timestamp, id) < (%s, %s)
+              AND timestamp >= (SELECT COALESCE(MIN(created_at), '-infinity') FROM chat_sessions WHERE id = %s)
+            ORDER BY timestamp DESC, id DESC
+            LIMIT %s
             """,
-            (
-                email,
-                generate_password_hash(data.get("password"), method="pbkdf2:sha256"),
-                data.get("first_name"),
-                data.get("last_name"),
-                data.get("gender"),
-                data.get("dob") or None,
-                False,
-                0,
-            ),
+            (email, session_id, ts, row_id, session_id, limit + 1),
         )
-        conn.commit()
-        return True
+    else:
+        cur.execute(
+            """
+            SELECT id, message, sender, timestamp
+            FROM conversations
+            WHERE user_email = %s AND session_id = %s AND timestamp >= (SELECT COALESCE(MIN(created_at), '-infinity') FROM chat_sessions WHERE id = %s)
+            ORDER BY timestamp DESC, id DESC
+            LIMIT %s
+            """,
+            (email, session_id, session_id, limit + 1),
+        )
+    rows = cur.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][3], rows[-1][0])
+    rows.reverse()
+    return [(message, sender, ts) for _, message, sender, ts in rows], next_cursor
+
+
+def search_messages(email: str, query: str, page: int = 1) -> list:
+    """Ranked full-text search over one user's messages, with highlighted snippets.
+
+    Matches are ranked in an inner query; snippets (the expensive part) are
+    only built for the rows of the requested page.
+    """
+    with db.cursor() as cur:
+        cur.execute(
+            """
+            SELECT hit.id, hit.session_id, hit.sender, hit.timestamp, s.title,
+                   ts_headline('english', hit.message, hit.q,
+                               'StartSel=⟦, StopSel=⟧, MaxFragments=2, MaxWords=20, MinWords=5')
+            FROM (
+                SELECT c.id, c.session_id, c.sender, c.timestamp, c.message, q.q,
+                       ts_rank(c.search_vector, q.q) AS rank
+                FROM conversations c
+                CROSS JOIN websearch_to_tsquery('english', %s) AS q(q)
+                WHERE c.user_email = %s AND c.search_vector @@ q.q
+                ORDER BY rank DESC, c.id DESC
+                LIMIT %s OFFSET %s
+            ) AS hit
+            LEFT JOIN chat_sessions s ON s.id = hit.session_id
+            ORDER BY hit.rank DESC, hit.id DESC
+            """,
+            (query, email, SEARCH_PAGE_SIZE, (page - 1) * SEARCH_PAGE_SIZE),
+        )
+        rows = cur.fetchall()
+    return [
+        {
+            "session_id": str(session_id),
+            "title": title,
+            "sender": sender,
+            "time": ts.strftime("%d/%m %H:%M"),
+            # Escape the message text, then turn the markers into <mark> tags.
+            "snippet": str(escape(snippet)).replace("⟦", "<mark>").replace("⟧", "</mark>"),
+        }
+        for _, session_id, sender, ts, title, snippet in rows
+    ]
+
+
+def get_recent_turns(email: str, session_id: str):
+    """Return (summary, turns) for a session, served from cache while it is current.
+
+    ``turns`` are the (role, content) pairs written after the summary, oldest
+    first. Other workers write to the same sessions, so the cached copy is
+    checked against the session's version before it is used.
+    """
+    with db.cursor() as cur:
+        cur.execute(
+            """
+            SELECT s.last_message_at, COALESCE(cs.summarized_through_id, 0)
+            FROM chat_sessions s
+            LEFT JOIN conversation_summaries cs ON cs.session_id = s.id
+            WHERE s.id = %s
+            """,
+            (session_id,),
+        )
+        version = cur.fetchone()
+        version = tuple(version) if version else None
+        cached = history_cache.get(session_id)
+        if cached is not None and is_current(cached[2], version):
+            return cached[0], cached[1]
+
+        cur.execute(
+            "SELECT summary, summarized_through_id FROM conversation_summaries WHERE session_id = %s",
+            (session_id,),
+        )
+        row = cur.fetchone()
+        summary, through_id = row if row else (None, 0)
+        cur.execute(
+            """
+            SELECT sender, message
+            FROM conversations
+            WHERE user_email = %s AND session_id = %s AND id > %s
+              AND timestamp >= (SELECT COALESCE(MIN(created_at), '-infinity') FROM chat_sessions WHERE id = %s)
+            ORDER BY timestamp DESC, id DESC
+            LIMIT %s
+            """,
+            (email, session_id, through_id, session_id, history_cache.max_turns),
+        )
+        rows = cur.fetchall()
+    turns = [(ROLE_BY_SENDER[sender], message) for sender, message in reversed(rows)]
+    history_cache.load(session_id, turns, summary, version)
+    return summary, turns
+
+
+def build_prompt(email: str, session_id: str, user_message: str) -> list:
+    summary, turns = get_recent_turns(email, session_id)
+    current_app.extensions["summarizer"].schedule(session_id, len(turns))
+    try:
+        memories = memory.recall(email, user_message, exclude_session=session_id)
     except Exception as exc:
-        print("❌ Error saving user:", exc)
-        conn.rollback()
-        return False
-    finally:
-        cur.close()
-        conn.close()
-
-
-def save_message(email: str, message: str, sender: str, session_id: str) -> None:
-    print(f"[DB] Saving message: {sender} | {message} | Session: {session_id}")
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO conversations (user_email, message, sender, session_id)
-        VALUES (%s, %s, %s, %s)
-        """,
-        (email, message, sender, session_id),
+        log.error("Error recalling memories: %s", exc)
+        memories = []
+    return build_messages(SYSTEM_PROMPT, turns, user_message, summary=summary, memories=memories)
+
+
+def summarize_turns(llm: ModelRouter, previous_summary, turns) -> str:
+    """Ask the model to fold older turns into the running session summary."""
+    transcript = "\n".join(f"{sender}: {message}" for sender, message in turns)
+    return llm.complete(
+        [
+            {
+                "role": "system",
+                "content": "Summarize this conversation between a user and a mental‑health assistant "
+                "in under 150 words. Keep facts about the user, their feelings and any advice given.",
+            },
+            {
+                "role": "user",
+                "content": f"Summary so far: {previous_summary or '(none)'}\n\nNew turns:\n{transcript}",
+            },
+        ],
+        max_tokens=200,
+        temperature=0.3,
     )
-    conn.commit()
-    cur.close()
-    conn.close()
 
 
-def generate_bot_response(user_message: str) -> str:
+def cache_key(messages: list):
+    """Response-cache key; replies are cached under the default endpoint's model and temperature."""
+    default = llm_router().default
+    return response_cache.key_for(messages, default.model, default.params["temperature"])
+
+
+def complete_chat(messages: list) -> str:
+    """Reply to a prompt, serving bare opening messages from the response cache."""
+    key = cache_key(messages)
+    if key:
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+    router = llm_router()
+    served_by = []
+    reply = router.complete(messages, on_route=served_by.append)
+    # A hedge or fallback reply came from another model: do not file it under the default's key.
+    if key and served_by[0] is router.default:
+        response_cache.set(key, reply)
+    return reply
+
+
+def generate_bot_response(messages: list) -> str:
     try:
-        response = client.chat.completions.create(
-            model="mistralai/Mistral-7B-Instruct-v0.1",
-            messages=[
-                {"role": "system", "content": "You are a helpful mental‑health assistant."},
-                {"role": "user", "content": user_message},
-            ],
-            max_tokens=200,
-            temperature=0.7,
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as exc:
-        print("AI API error:", exc)
-        return "⚠️ I couldn't generate a response right now."
+        return complete_chat(messages)
+    except GatewayError as exc:
+        log.warning("AI API error: %s", exc)
+        return FALLBACK_REPLY
+
+
+def stream_bot_response(messages: list):
+    """Iterate over the reply as text deltas as soon as the model produces them."""
+    key = cache_key(messages)
+    if key:
+        cached = response_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    router = llm_router()
+    served_by = []
+    parts = []
+    for delta in router.stream(messages, on_route=served_by.append):
+        parts.append(delta)
+        yield delta
+    if key and served_by and served_by[0] is router.default:
+        response_cache.set(key, "".join(parts).strip())
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 # ----------------------------- Routes -----------------------------
 
-@app.route("/")
+@bp.route("/")
 def index():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT name, message, submitted_at FROM feedback ORDER BY id DESC LIMIT 10")
-    feedbacks = [
-        {"name": row[0], "message": row[1], "submitted_at": row[2]} for row in cur.fetchall()
-    ]
-    cur.close()
-    conn.close()
-    return render_template("index.html", feedbacks=feedbacks)
+    latest_id, latest_at = feedback_feed.version()
+    return conditional_page(
+        f"index:{session.get('user', '')}:{latest_id}",
+        latest_at,
+        lambda: render_template("index.html", feedbacks=feedback_feed.latest()),
+    )
 
 
-@app.route("/chat", methods=["GET", "POST"])
+@bp.route("/chat", methods=["GET", "POST"])
 def chat():
     if "user" not in session:
         flash("Session expired, please log in again.", "danger")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     email = session["user"]
     user_data = get_user_by_email(email)
@@ -197,47 +614,33 @@ def chat():
     if request.method == "POST":
         user_message = request.form.get("message")
         if user_message:
-            bot_reply = generate_bot_response(user_message)
-            save_message(email, user_message, "user", current_session_id)
-            save_message(email, bot_reply, "bot", current_session_id)
-
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        SELECT session_id, MIN(timestamp) AS timestamp
-        FROM conversations
-        WHERE user_email = %s
-        GROUP BY session_id
-        ORDER BY timestamp DESC
-        """,
-        (email,),
-    )
-    session_rows = cur.fetchall()
+            bot_reply = generate_bot_response(build_prompt(email, current_session_id, user_message))
+            # The page below reads the session back, so wait for the commit.
+            save_turn(email, current_session_id, user_message, bot_reply, durable=True)
 
-    sessions = []
-    for sid, ts in session_rows:
+    with db.cursor() as cur:
         cur.execute(
-            "SELECT title FROM conversations WHERE session_id = %s AND title IS NOT NULL ORDER BY timestamp LIMIT 1",
-            (sid,),
+            """
+            SELECT id, created_at, title, archived
+            FROM chat_sessions
+            WHERE user_email = %s
+            ORDER BY created_at DESC
+            """,
+            (email,),
         )
-        title_row = cur.fetchone()
-        title = title_row[0] if title_row else None
-        sessions.append({"id": sid, "timestamp": ts, "title": title})
-
-    cur.execute(
-        """
-        SELECT message, sender, timestamp
-        FROM conversations
-        WHERE user_email = %s AND session_id = %s
-        ORDER BY timestamp ASC
-        """,
-        (email, current_session_id),
-    )
-    history = cur.fetchall()
-    cur.close()
-    conn.close()
+        sessions = [
+            {"id": sid, "timestamp": ts, "title": title, "archived": archived}
+            for sid, ts, title, archived in cur.fetchall()
+        ]
+
+    # Old months live in archive files; bring this session back in the
+    # background and show what is already in the database.
+    restoring = any(chat["archived"] and str(chat["id"]) == current_session_id for chat in sessions)
+    if restoring:
+        request_restore(current_session_id)
+
+    with db.cursor() as cur:
+        history, history_cursor = fetch_history_page(cur, email, current_session_id)
 
     return render_template(
         "chat.html",
@@ -245,59 +648,132 @@ def chat():
         first_name=user_data.get("first_name", ""),
         last_name=user_data.get("last_name", ""),
         history=history,
+        history_cursor=history_cursor,
         sessions=sessions,
         active_id=current_session_id,
+        restoring=restoring,
+    )
+
+
+@bp.route("/chat/history")
+def chat_history():
+    """Older messages of the active session, for infinite scroll in the chat box."""
+    if "user" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    session_id = request.args.get("session_id") or session.get("session_id")
+    before = request.args.get("before")
+    if not session_id or not before:
+        return jsonify({"error": "session_id and before are required"}), 400
+
+    try:
+        with db.cursor() as cur:
+            rows, next_cursor = fetch_history_page(cur, session["user"], session_id, before)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    return jsonify(
+        {
+            "messages": [
+                {"message": message, "sender": sender, "time": ts.strftime("%d/%m %H:%M")}
+                for message, sender, ts in rows
+            ],
+            "next_cursor": next_cursor,
+        }
     )
 
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/search")
+def search():
+    if "user" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    query = request.args.get("q", "").strip()
+    page = request.args.get("page", 1, type=int)
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    if not 1 <= page <= SEARCH_MAX_PAGES:
+        return jsonify({"error": "Invalid page"}), 400
+
+    results = search_messages(session["user"], query, page)
+    return jsonify(
+        {
+            "results": results,
+            "page": page,
+            "next_page": page + 1
+            if len(results) == SEARCH_PAGE_SIZE and page < SEARCH_MAX_PAGES
+            else None,
+        }
+    )
+
+
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         username = request.form.get("username")
         password = request.form.get("password")
         if not username or not password:
             flash("Username and password are required!", "danger")
-            return redirect(url_for("login"))
+            return redirect(url_for("main.login"))
+
+        account_key = f"login:acct:{username.lower()}"
+        ip_key = f"login:ip:{request.remote_addr}"
+        if login_ip_limiter.is_limited(ip_key):
+            flash("Too many failed attempts. Try again later.", "error")
+            return redirect(url_for("main.login"))
 
-        user_data = get_user_by_email(username)
+        user_data = get_user_by_email(username, use_cache=False)
         if not user_data:
+            login_ip_limiter.hit(ip_key)
             flash("Unknown user.", "error")
-            return redirect(url_for("login"))
+            return redirect(url_for("main.login"))
 
         if not user_data.get("confirmed"):
             flash("Please confirm your email before logging in.", "danger")
-            return redirect(url_for("login"))
+            return redirect(url_for("main.login"))
 
-        if user_data["attempts"] >= MAX_ATTEMPTS:
+        locked_until = user_data["locked_until"]
+        locked = locked_until is not None and locked_until > datetime.now(locked_until.tzinfo)
+        if locked or login_account_limiter.is_limited(account_key):
             flash("Too many failed attempts. Try again later.", "error")
-            return redirect(url_for("login"))
-
-        if not check_password_hash(user_data["password"], password):
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("UPDATE users SET attempts = attempts + 1 WHERE email = %s", (username,))
-            conn.commit()
-            cur.close()
-            conn.close()
+            return redirect(url_for("main.login"))
+
+        if not hashing.verify_password(user_data["password"], password):
+            login_ip_limiter.hit(ip_key)
+            if login_account_limiter.hit(account_key) >= MAX_ATTEMPTS:
+                # The lock is persisted so it holds across workers and restarts;
+                # this is the only write a failed login makes.
+                with db.cursor() as cur:
+                    cur.execute(
+                        "UPDATE users SET locked_until = now() + %s * interval '1 second' WHERE email = %s",
+                        (LOGIN_WINDOW, user_data["email"]),
+                    )
+                invalidate_user(username)
             flash("Incorrect username or password.", "error")
-            return redirect(url_for("login"))
-
-        # Reset attempt counter
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("UPDATE users SET attempts = 0 WHERE email = %s", (username,))
-        conn.commit()
-        cur.close()
-        conn.close()
-
+            return redirect(url_for("main.login"))
+
+        login_account_limiter.reset(account_key)
+        # Clear an expired lock and upgrade the stored hash if its work factor is outdated
+        new_hash = None
+        if hashing.needs_rehash(user_data["password"]):
+            new_hash = hashing.hash_password(password)
+        if new_hash or locked_until is not None:
+            with db.cursor() as cur:
+                cur.execute(
+                    "UPDATE users SET locked_until = NULL, password = COALESCE(%s, password) WHERE email = %s",
+                    (new_hash, user_data["email"]),
+                )
+            invalidate_user(username)
+
+        session.regenerate()
         session.permanent = True
         session["user"] = username
-        return redirect(url_for("chat"))
+        return redirect(url_for("main.chat"))
 
     return render_template("login.html")
 
 
-@app.route("/register", methods=["GET", "POST"])
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         # Collect form data
@@ -313,19 +789,12 @@ def register():
 
         if not all(form_data.values()) or not recaptcha_response:
             flash("Please fill in all fields and complete the CAPTCHA verification.", "error")
-            return redirect(url_for("register"))
+            return redirect(url_for("main.register"))
 
         # CAPTCHA verification
-        captcha_payload = {
-            "secret": os.environ.get("RECAPTCHA_SECRET"),
-            "response": recaptcha_response,
-        }
-        captcha_ok = requests.post(
-            "https://www.google.com/recaptcha/api/siteverify", data=captcha_payload
-        ).json()
-        if not captcha_ok.get("success"):
+        if not verify_captcha(recaptcha_response):
             flash("CAPTCHA verification failed.", "error")
-            return redirect(url_for("register"))
+            return redirect(url_for("main.register"))
 
         # DOB validation
         try:
@@ -334,93 +803,97 @@ def register():
             age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
             if dob > today:
                 flash("Date of birth cannot be in the future.", "error")
-                return redirect(url_for("register"))
+                return redirect(url_for("main.register"))
             if age < 13:
                 flash("You must be at least 13 years old to register.", "error")
-                return redirect(url_for("register"))
+                return redirect(url_for("main.register"))
             if age > 100:
                 flash("Please enter a realistic date of birth (under 100 years old).", "error")
-                return redirect(url_for("register"))
+                return redirect(url_for("main.register"))
         except ValueError:
             flash("Invalid date format for date of birth.", "error")
-            return redirect(url_for("register"))
+            return redirect(url_for("main.register"))
 
         # Password strength
         if not is_strong_password(form_data["password"]):
             flash("Password is too weak.", "error")
-            return redirect(url_for("register"))
+            return redirect(url_for("main.register"))
 
         # Save user
         if not save_user(form_data):
             flash("This email is already registered.", "error")
-            return redirect(url_for("register"))
+            return redirect(url_for("main.register"))
 
         # Send confirmation e‑mail
-        token = s.dumps(form_data["email"], salt="email-confirm")
-        link = url_for("confirm_email", token=token, _external=True)
-
-        msg = Message(
-            "Confirm your email address",
-            sender=app.config["MAIL_USERNAME"],
-            recipients=[form_data["email"]],
+        token = serializer().dumps(form_data["email"], salt="email-confirm")
+        link = url_for("main.confirm_email", token=token, _external=True)
+
+        jobs.enqueue(
+            "send_email",
+            subject="Confirm your email address",
+            recipient=form_data["email"],
+            body=f"Welcome to Cogi! Click here to confirm your address: {link}",
         )
-        msg.body = f"Welcome to Cogi! Click here to confirm your address: {link}"
-        mail.send(msg)
 
         flash("Registration successful! Please check your email to activate your account.", "success")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     # GET
     return render_template("register.html", current_date=date.today())
 
 
-@app.route("/confirm/<token>")
+@bp.route("/confirm/<token>")
 def confirm_email(token):
     try:
-        email = s.loads(token, salt="email-confirm", max_age=3600)
+        email = serializer().loads(token, salt="email-confirm", max_age=3600)
     except (SignatureExpired, BadSignature):
         flash("Invalid or expired link.", "danger")
-        return redirect(url_for("register"))
+        return redirect(url_for("main.register"))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET confirmed = TRUE WHERE email = %s", (email.lower(),))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("UPDATE users SET confirmed = TRUE WHERE email = %s", (email.lower(),))
+    invalidate_user(email)
 
     flash("Email confirmed. You can now log in.", "success")
-    return redirect(url_for("login"))
+    return redirect(url_for("main.login"))
 
 
-@app.route("/reset_request", methods=["POST"])
+@bp.route("/reset_request", methods=["POST"])
 def reset_request():
     email = request.form.get("email")
+    if not email:
+        return jsonify({"status": "error", "message": "Email is required."}), 400
+
+    account_key = f"reset:acct:{email.lower()}"
+    ip_key = f"reset:ip:{request.remote_addr}"
+    if reset_account_limiter.is_limited(account_key) or reset_ip_limiter.is_limited(ip_key):
+        return jsonify({"status": "error", "message": "Too many requests. Try again later."}), 429
+    reset_ip_limiter.hit(ip_key)
+
     user = get_user_by_email(email)
     if not user:
         return jsonify({"status": "error", "message": "No account associated with this email."}), 404
 
-    token = s.dumps(email, salt="reset-password")
-    reset_link = url_for("reset_token", token=token, _external=True)
-
-    msg = Message("Password reset", sender=app.config["MAIL_USERNAME"], recipients=[email])
-    msg.body = f"Click here to reset your password: {reset_link}"
+    reset_account_limiter.hit(account_key)
+    token = serializer().dumps(email, salt="reset-password")
+    reset_link = url_for("main.reset_token", token=token, _external=True)
 
-    try:
-        mail.send(msg)
-        return jsonify({"status": "success", "message": "Link sent to your email address."})
-    except Exception as exc:
-        print("Error sending email:", exc)
-        return jsonify({"status": "error", "message": "Error sending email."}), 500
+    jobs.enqueue(
+        "send_email",
+        subject="Password reset",
+        recipient=email,
+        body=f"Click here to reset your password: {reset_link}",
+    )
+    return jsonify({"status": "success", "message": "Link sent to your email address."})
 
 
-@app.route("/reset/<token>", methods=["GET", "POST"])
+@bp.route("/reset/<token>", methods=["GET", "POST"])
 def reset_token(token):
     try:
-        email = s.loads(token, salt="reset-password", max_age=3600)
+        email = serializer().loads(token, salt="reset-password", max_age=3600)
     except (SignatureExpired, BadSignature):
         flash("Invalid or expired link.", "danger")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     if request.method == "POST":
         password = request.form.get("password")
@@ -434,23 +907,22 @@ def reset_token(token):
             flash("Password is too weak.", "error")
             return render_template("reset_token.html", token=token)
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE users SET password = %s WHERE email = %s",
-            (generate_password_hash(password, method="pbkdf2:sha256"), email),
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
+        password_hash = hashing.hash_password(password)
+        with db.cursor() as cur:
+            cur.execute(
+                "UPDATE users SET password = %s, locked_until = NULL WHERE email = %s",
+                (password_hash, email),
+            )
+        invalidate_user(email)
+        login_account_limiter.reset(f"login:acct:{email.lower()}")
 
         flash("Password reset successful. You can now log in.", "success")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     return render_template("reset_token.html", token=token)
 
 
-@app.route("/send_message", methods=["POST"])
+@bp.route("/send_message", methods=["POST"])
 def send_message():
     if "user" not in session:
         return jsonify({"reply": "Not authenticated"}), 401
@@ -461,35 +933,59 @@ def send_message():
     if not user_input.strip():
         return jsonify({"reply": "❌ Empty message"}), 400
 
-    try:
-        response = client.chat.completions.create(
-            model="mistralai/Mistral-7B-Instruct-v0.1",
-            messages=[
-                {"role": "system", "content": "You are a helpful mental‑health assistant."},
-                {"role": "user", "content": user_input},
-            ],
-            max_tokens=200,
-            temperature=0.7,
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        return Response(
+            stream_with_context(_stream_reply(session["user"], user_input, session_id)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
-        reply = response.choices[0].message.content.strip()
 
-        save_message(session["user"], user_input, "user", session_id)
-        save_message(session["user"], reply, "bot", session_id)
+    try:
+        reply = complete_chat(build_prompt(session["user"], session_id, user_input))
+
+        save_turn(session["user"], session_id, user_input, reply)
 
         return jsonify({"reply": reply})
+    except GatewayError as exc:
+        log.warning("AI API error: %s", exc)
+        return jsonify({"reply": FALLBACK_REPLY}), 503
     except Exception as exc:
-        print("Server error:", exc)
+        log.exception("Server error: %s", exc)
         return jsonify({"reply": f"⚠️ Server error: {exc}"}), 500
 
 
-@app.route("/feedback", methods=["GET", "POST"])
+def _stream_reply(email: str, user_input: str, session_id: str):
+    """SSE body for /send_message: token events, then one done (or error) event.
+
+    An error event carries the fallback reply if the model call failed, or
+    the streamed reply and an ``error`` notice if it could not be saved.
+    """
+    parts = []
+    try:
+        for delta in stream_bot_response(build_prompt(email, session_id, user_input)):
+            parts.append(delta)
+            yield sse_event("token", {"text": delta})
+    except Exception as exc:
+        log.warning("Streaming error: %s", exc)
+        yield sse_event("error", {"reply": FALLBACK_REPLY})
+        return
+
+    reply = "".join(parts).strip()
+    try:
+        save_turn(email, session_id, user_input, reply)
+    except Exception as exc:
+        # The tokens are already on screen; say the turn will not be in the history.
+        log.error("Error saving streamed turn: %s", exc, extra={"session_id": session_id})
+        yield sse_event("error", {"reply": reply, "error": SAVE_FAILED_NOTICE})
+        return
+    yield sse_event("done", {"reply": reply})
+
+
+@bp.route("/feedback", methods=["GET", "POST"])
 def feedback():
     if "user" not in session:
         flash("You must be logged in to send feedback.", "warning")
-        return redirect(url_for("login"))
-
-    conn = get_db_connection()
-    cur = conn.cursor()
+        return redirect(url_for("main.login"))
 
     if request.method == "POST":
         name = request.form.get("name")
@@ -497,73 +993,121 @@ def feedback():
 
         if not name or not message:
             flash("Both name and message are required.", "error")
-            return redirect(url_for("index"))
+            return redirect(url_for("main.index"))
 
         try:
-            cur.execute("INSERT INTO feedback (name, message) VALUES (%s, %s)", (name, message))
-            conn.commit()
+            feedback_feed.add(name, message)
             flash("✅ Feedback sent successfully!", "success")
         except Exception as exc:
-            conn.rollback()
             flash(f"Error submitting feedback: {exc}", "error")
 
-        cur.close()
-        conn.close()
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
-    # GET – list feedback
-    cur.execute("SELECT name, message, submitted_at FROM feedback ORDER BY submitted_at DESC")
-    feedbacks = cur.fetchall()
-    cur.close()
-    conn.close()
-    return render_template(
-        "feedback.html",
-        feedbacks=[{"name": r[0], "message": r[1], "submitted_at": r[2]} for r in feedbacks],
-    )
+    # GET – list feedback, one keyset page at a time
+    before = request.args.get("before")
+    try:
+        before_key = decode_cursor(before) if before else None
+    except ValueError:
+        return redirect(url_for("main.feedback"))
+
+    def render():
+        entries, next_before = feedback_feed.page(before_key)
+        return render_template(
+            "feedback.html",
+            feedbacks=entries,
+            next_cursor=encode_cursor(*next_before) if next_before else None,
+        )
 
+    latest_id, latest_at = feedback_feed.version()
+    return conditional_page(f"feedback:{session['user']}:{before}:{latest_id}", latest_at, render)
 
-@app.route("/rename_chat", methods=["POST"])
+
+@bp.route("/rename_chat", methods=["POST"])
 def rename_chat():
     chat_id = request.form.get("chat_id")
     new_title = request.form.get("new_title", "").strip()
     if not new_title:
         flash("Title cannot be empty.", "warning")
-        return redirect(url_for("chat", session_id=chat_id))
+        return redirect(url_for("main.chat", session_id=chat_id))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE conversations SET title = %s WHERE session_id = %s", (new_title, chat_id))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute(
+            "UPDATE chat_sessions SET title = %s WHERE id = %s AND user_email = %s",
+            (new_title, chat_id, session.get("user")),
+        )
 
     flash("✅ Chat renamed successfully.", "success")
-    return redirect(url_for("chat", session_id=chat_id))
+    return redirect(url_for("main.chat", session_id=chat_id))
 
 
-@app.route("/delete_chat", methods=["POST"])
+@bp.route("/delete_chat", methods=["POST"])
 def delete_chat():
+    if "user" not in session:
+        flash("Session expired, please log in again.", "danger")
+        return redirect(url_for("main.login"))
+
     chat_id = request.form.get("chat_id")
     if not chat_id:
         flash("Invalid delete request.", "danger")
-        return redirect(url_for("chat"))
+        return redirect(url_for("main.chat"))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
+    user_email = session["user"]
     try:
-        cur.execute("DELETE FROM conversations WHERE session_id = %s", (chat_id,))
-        conn.commit()
+        with db.cursor() as cur:
+            cur.execute(
+                "DELETE FROM conversations WHERE user_email = %s AND session_id = %s AND timestamp >= "
+                "(SELECT COALESCE(MIN(created_at), '-infinity') FROM chat_sessions WHERE id = %s AND user_email = %s)",
+                (user_email, chat_id, chat_id, user_email),
+            )
+            cur.execute("DELETE FROM chat_sessions WHERE id = %s AND user_email = %s", (chat_id, user_email))
+            deleted = cur.rowcount
+        if deleted:
+            history_cache.discard(chat_id)
+            memory.forget(user_email, chat_id)
     except Exception as exc:
         flash(f"Delete failed: {exc}", "danger")
-    finally:
-        cur.close()
-        conn.close()
-    return redirect(url_for("chat"))
+    return redirect(url_for("main.chat"))
+
+
+@bp.route("/export")
+def export_chats():
+    """Download the user's conversations (or one session) as NDJSON or CSV, streamed in chunks."""
+    if "user" not in session:
+        flash("Session expired, please log in again.", "danger")
+        return redirect(url_for("main.login"))
+
+    fmt = request.args.get("format", "ndjson")
+    session_id = request.args.get("session_id") or None
+    if fmt not in EXPORT_CONTENT_TYPES:
+        abort(400)
+    if session_id:
+        try:
+            session_id = str(uuid.UUID(session_id))
+        except ValueError:
+            abort(400)
+
+    # Each download holds a database connection until the client has read it all.
+    if not export_slots.acquire(blocking=False):
+        return Response(
+            "Too many exports in progress, please try again shortly.", status=503, headers={"Retry-After": "30"}
+        )
+
+    filename = f"cogi-export-{datetime.now():%Y%m%d}.{fmt}"
+    response = Response(
+        export_stream(session["user"], fmt, session_id),
+        mimetype=EXPORT_CONTENT_TYPES[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-store",
+        },
+    )
+    response.call_on_close(export_slots.release)
+    return response
 
 
 # ----------------------------- Context / Filters -----------------------------
 
-@app.context_processor
+@bp.app_context_processor
 def inject_user_info():
     if "user" in session:
         user_data = get_user_by_email(session["user"])
@@ -577,61 +1121,243 @@ def inject_user_info():
 
 # ----------------------------- Session Management -----------------------------
 
-@app.before_request
+# Sessions live server-side (session_store.py); the store expires idle ones
+# and coalesces activity updates, so requests no longer rewrite the cookie.
+
+@bp.before_app_request
 def check_session_timeout():
-    if "user" in session:
-        session.modified = True
-        now = datetime.utcnow()
-        last_activity = session.get("last_activity")
-        if last_activity:
-            elapsed = now - datetime.fromisoformat(last_activity)
-            if elapsed > app.permanent_session_lifetime:
-                print("[DEBUG] Session expired")
-                flash("Session expired due to inactivity.", "warning")
-                session.clear()
-                print("[DEBUG] Redirecting to login after expiration")
-                return redirect(url_for("login"))
-        session["last_activity"] = now.isoformat()
+    if getattr(session, "expired", False):
+        log.debug("Session expired; redirecting to login")
+        flash("Session expired due to inactivity.", "warning")
+        return redirect(url_for("main.login"))
 
 
 # ----------------------------- Miscellaneous -----------------------------
 
-@app.route("/mission")
+@bp.route("/mission")
 def mission():
     return render_template("mission.html")
 
 
-@app.route("/subscribe", methods=["POST"])
+@bp.route("/subscribe", methods=["POST"])
 def subscribe():
     email = request.form.get("email", "").strip().lower()
     if not email or "@" not in email:
         flash("Invalid email address.", "danger")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO subscriber (email) VALUES (%s) ON CONFLICT DO NOTHING",
-            (email,),
-        )
-        conn.commit()
+        with db.cursor() as cur:
+            cur.execute(
+                "INSERT INTO subscriber (email) VALUES (%s) ON CONFLICT DO NOTHING",
+                (email,),
+            )
         flash("Thanks for subscribing!", "success")
     except Exception as exc:
-        print("❌ Error saving subscription:", exc)
+        log.error("Error saving subscription: %s", exc)
         flash("Something went wrong. Please try again.", "danger")
-    finally:
-        cur.close()
-        conn.close()
 
-    return redirect(url_for("index"))
+    return redirect(url_for("main.index"))
+
+
+def internal_only(view):
+    """Serve ``view`` only to internal addresses or callers with the metrics token."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get("METRICS_TOKEN")
+        auth = request.headers.get("Authorization", "")
+        if token and auth.startswith("Bearer ") and hmac.compare_digest(auth[7:].encode(), token.encode()):
+            return view(*args, **kwargs)
+        try:
+            address = ipaddress.ip_address(request.remote_addr or "")
+        except ValueError:
+            address = None
+        if address is not None and any(address in net for net in current_app.config.get("INTERNAL_NETWORKS", ())):
+            return view(*args, **kwargs)
+        abort(403)
+
+    return wrapper
+
+
+@bp.route("/metrics")
+@internal_only
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@bp.route("/stats/db")
+@internal_only
+def db_stats():
+    return jsonify(db.get_pool().stats())
 
 
-@app.route("/logout")
+@bp.route("/stats/hashing")
+@internal_only
+def hashing_stats():
+    return jsonify(hashing.stats())
+
+
+@bp.route("/stats/jobs")
+@internal_only
+def job_stats():
+    return jsonify(jobs.stats())
+
+
+@bp.route("/stats/memory")
+@internal_only
+def memory_stats():
+    return jsonify(memory.stats())
+
+
+@bp.route("/stats/sessions")
+@internal_only
+def session_stats():
+    return jsonify(current_app.session_interface.stats())
+
+
+@bp.route("/stats/llm")
+@internal_only
+def llm_stats():
+    return jsonify({**llm_router().stats(), "cache": response_cache.stats()})
+
+
+@bp.route("/logout")
 def logout():
     session.clear()
-    return redirect(url_for("index"))
+    session.regenerate()
+    return redirect(url_for("main.index"))
+
+
+# ----------------------------- Health -----------------------------
+
+@bp.route("/healthz")
+def liveness():
+    """The process is up and serving requests; dependencies are not checked."""
+    return jsonify({"status": "ok"})
+
+
+@bp.route("/readyz")
+def readiness():
+    """Ready for traffic: Postgres answers and the model gateway accepts calls."""
+    checks = {}
+    try:
+        with db.cursor() as cur:
+            cur.execute("SELECT 1")
+        checks["db"] = "ok"
+    except Exception as exc:
+        checks["db"] = f"error: {type(exc).__name__}"
+    llm = llm_router().stats()
+    checks["llm"] = "draining" if llm["draining"] else "circuit open" if llm["circuit"] == "open" else "ok"
+    checks["process"] = "draining" if _draining.is_set() else "ok"
+    ready = all(value == "ok" for value in checks.values())
+    return jsonify({"status": "ok" if ready else "unavailable", **checks}), 200 if ready else 503
+
+
+# ----------------------------- App factory -----------------------------
+
+_apps = []
+_shutdown_lock = threading.Lock()
+_draining = threading.Event()
+
+
+def create_app(config: dict = None) -> Flask:
+    """Build the Flask app with its own model router and summarizer."""
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SECRET_KEY", "supersecretkey")
+    app.permanent_session_lifetime = timedelta(minutes=10)
+    # Mail configuration (Mailtrap sandbox by default; point MAIL_SERVER at a
+    # local SMTP stand-in for development and tests)
+    app.config.update(
+        MAIL_SERVER=os.environ.get("MAIL_SERVER", "sandbox.smtp.mailtrap.io"),
+        MAIL_PORT=int(os.environ.get("MAIL_PORT", 587)),
+        MAIL_USE_TLS=os.environ.get("MAIL_USE_TLS", "true").lower() in ("1", "true", "yes"),
+        MAIL_USERNAME=os.environ.get("EMAIL_USER"),
+        MAIL_PASSWORD=os.environ.get("EMAIL_PASS"),
+    )
+    # /metrics and /stats/* are served to these networks, or to anyone
+    # presenting "Authorization: Bearer <METRICS_TOKEN>".
+    app.config.update(
+        METRICS_TOKEN=os.environ.get("METRICS_TOKEN") or None,
+        INTERNAL_NETWORKS=[
+            ipaddress.ip_network(net.strip())
+            for net in os.environ.get("INTERNAL_NETWORKS", "127.0.0.0/8,::1/128").split(",")
+            if net.strip()
+        ],
+    )
+    app.config.update(config or {})
+    app.session_interface = ServerSessionInterface.from_env()
+    mail.init_app(app)
+    assets.init_app(app)
+
+    # Chat models: Together AI by default, or the endpoints listed in
+    # LLM_MODELS (see model_router.py). TOGETHER_BASE_URL lets benchmarks and
+    # tests point at a local stand-in.
+    llm = ModelRouter.from_env()
+    app.extensions["llm_router"] = llm
+    app.extensions["summarizer"] = SessionSummarizer(partial(summarize_turns, llm), on_update=history_cache.discard)
+    # E-mail is sent by background workers (see jobs.py).
+    jobs.register("send_email", partial(send_email, app))
+    jobs.register("restore_session", restore_archived_session)
+
+    app.register_blueprint(bp)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+    _apps.append(app)
+    return app
+
+
+def begin_drain() -> None:
+    """Report "draining" on /readyz from now on; requests already accepted still complete.
+
+    Called from gunicorn's signal hooks as soon as a worker is asked to stop.
+    """
+    _draining.set()
+
+
+def shutdown(drain_timeout: float = None) -> None:
+    """Stop this process cleanly: let in-flight model calls finish, then flush
+    buffered turns and queued mail before closing the connection pool.
+
+    Runs at interpreter exit and from gunicorn's ``worker_exit`` hook; only
+    the first call does anything. A failing step is logged and the rest
+    still run, so one error cannot leave mail unsent or the pool open.
+    """
+    if drain_timeout is None:
+        drain_timeout = float(os.environ.get("LLM_DRAIN_TIMEOUT", 30))
+    begin_drain()
+    with _shutdown_lock:
+        apps, _apps[:] = list(_apps), []
+    if not apps:
+        return
+
+    def drain_model_calls():
+        for app in apps:
+            if not app.extensions["llm_router"].drain(drain_timeout):
+                log.warning("Model calls still in flight after %.0fs; shutting down anyway", drain_timeout)
+
+    def close_sessions():
+        for app in apps:
+            app.session_interface.close()
+
+    steps = [
+        ("draining model calls", drain_model_calls),
+        ("flushing chat turns", turn_writer.close),
+        ("stopping background jobs", jobs.shutdown),
+        ("stopping password hashing", hashing.shutdown),
+        ("closing session stores", close_sessions),
+        ("closing the connection pool", db.close_pool),
+    ]
+    for name, step in steps:
+        try:
+            step()
+        except Exception as exc:
+            log.error("Error %s during shutdown: %s", name, exc)
+
+
+atexit.register(shutdown)
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Development server; production runs gunicorn (see gunicorn.conf.py).
+    create_app().run(host="0.0.0.0", port=5000, debug=os.environ.get("FLASK_DEBUG", "1") == "1")
@@ -0,0 +1,183 @@
+"""
+Fingerprinted, precompressed static assets.
+
+``python assets.py build`` writes every file in ``static/`` to ``static/dist/``:
+
+* CSS and JS are minified (comments and indentation removed; JS keeps its
+  line breaks so automatic semicolon insertion is unaffected);
+* the name gets a hash of the content (``style.css`` becomes
+  ``style.1a2b3c4d5e6f.css``), so a changed file gets a new URL;
+* text files also get ``.gz`` and, if the optional ``brotli`` package is
+  installed, ``.br`` siblings;
+* ``manifest.json`` maps the source names to the fingerprinted ones.
+
+At runtime ``init_app`` reads the manifest. Templates keep calling
+``url_for('static', filename='style.css')``, and the URL resolves to the
+fingerprinted file. Those files are served with ``Cache-Control: immutable``
+for a year, as brotli or gzip when the client accepts it. Files that are not
+in the manifest, or every file when no build has been run (local
+development), are served by Flask as before.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST = "dist"
+MANIFEST = "manifest.json"
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_CSS_TOKENS = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)""", re.S)
+_JS_TOKENS = re.compile(r"""("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)|(/\*.*?\*/|//[^\n]*)""", re.S)
+
+
+# ----------------------------- Build -----------------------------
+
+def _hold_literals(pattern, text: str):
+    """Drop comments and swap string literals for placeholders; returns (text, restore)."""
+    literals = []
+
+    def hold(match):
+        if match.group(2):
+            return " "  # comment
+        literals.append(match.group(1))
+        return f"\0{len(literals) - 1}\0"
+
+    def restore(code: str) -> str:
+        return re.sub(r"\0(\d+)\0", lambda m: literals[int(m.group(1))], code)
+
+    return pattern.sub(hold, text), restore
+
+
+def minify_css(text: str) -> str:
+    """Drop comments and redundant whitespace; strings are left untouched."""
+    code, restore = _hold_literals(_CSS_TOKENS, text)
+    code = re.sub(r"\s+", " ", code)
+    # Not before ':' — "a :hover" and "a:hover" are different selectors.
+    code = re.sub(r"\s*([{};,>])\s*", r"\1", code)
+    code = re.sub(r":\s+", ":", code)
+    return restore(code.replace(";}", "}").strip())
+
+
+def minify_js(text: str) -> str:
+    """Drop comments, indentation and blank lines; strings and template literals are left untouched."""
+    code, restore = _hold_literals(_JS_TOKENS, text)
+    return restore("\n".join(line for line in (line.strip() for line in code.splitlines()) if line))
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+def fingerprinted(name: str, content: bytes) -> str:
+    root, ext = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def build(static_dir: str = STATIC_DIR) -> dict:
+    """Rebuild ``static/dist`` and return the manifest."""
+    dist = os.path.join(static_dir, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist)
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            ext = os.path.splitext(filename)[1].lower()
+            with open(source, "rb") as f:
+                content = f.read()
+            if ext in MINIFIERS:
+                content = MINIFIERS[ext](content.decode("utf-8")).encode("utf-8")
+            target = fingerprinted(name, content)
+            path = os.path.join(dist, target)
+            _write(path, content)
+            if ext in COMPRESSIBLE:
+                variants = [(".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+                if brotli is not None:
+                    variants.append((".br", brotli.compress(content, quality=11)))
+                for suffix, data in variants:
+                    if len(data) < len(content):
+                        _write(path + suffix, data)
+            manifest[name] = target
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+# ----------------------------- Serving -----------------------------
+
+class Assets:
+    def __init__(self, static_dir: str = STATIC_DIR):
+        self.static_dir = static_dir
+        self.dist = os.path.join(static_dir, DIST)
+        self.manifest = {}
+
+    def load(self) -> None:
+        try:
+            with open(os.path.join(self.dist, MANIFEST), encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def init_app(self, app) -> None:
+        self.load()
+        app.url_defaults(self._fingerprint)
+        app.view_functions["static"] = self.serve
+        app.extensions["assets"] = self
+
+    def _fingerprint(self, endpoint: str, values: dict) -> None:
+        if endpoint == "static" and values.get("filename") in self.manifest:
+            values["filename"] = f"{DIST}/{self.manifest[values['filename']]}"
+
+    def serve(self, filename: str):
+        prefix = DIST + "/"
+        if not filename.startswith(prefix) or not os.path.isfile(os.path.join(self.static_dir, filename)):
+            return current_app.send_static_file(filename)
+
+        name = filename[len(prefix) :]
+        accepted = request.accept_encodings
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if accepted[encoding] and os.path.isfile(os.path.join(self.dist, name + suffix)):
+                response = send_from_directory(self.dist, name + suffix, max_age=31536000)
+                response.headers["Content-Encoding"] = encoding
+                # send_file guessed the type from the .br/.gz name.
+                response.mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                break
+        else:
+            response = send_from_directory(self.dist, name, max_age=31536000)
+        response.headers["Cache-Control"] = IMMUTABLE
+        response.vary.add("Accept-Encoding")
+        return response
+
+
+def main(argv) -> int:
+    if len(argv) == 2 and argv[1] == "build":
+        manifest = build()
+        for name, target in sorted(manifest.items()):
+            print(f"{name} -> {DIST}/{target}")
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
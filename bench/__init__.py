@@ -0,0 +1,16 @@
+"""
+Benchmark harness for Cogi.
+
+Everything runs locally: a fake OpenAI-compatible server stands in for
+Together AI, an SMTP sink for the mail server, and a Postgres database you
+point the usual DB_* variables at (use a throwaway database — seeding
+replaces the bench users' data).
+
+    python -m bench.seed --users 200          # migrate and load realistic volumes
+    python -m bench.run --concurrency 20 --duration 60
+
+``bench.run`` starts the stand-ins and the app (``bench.serve``), drives
+simulated users through login, the home page, the chat page and chat turns,
+and writes latency percentiles, throughput and DB queries per request to a
+JSON file under ``bench/results/``.
+"""
@@ -0,0 +1,160 @@
+"""
+Local OpenAI-compatible stand-in for the Together AI chat completions API.
+
+Only ``POST /v1/chat/completions`` is implemented, with and without
+``stream``. Each reply waits ``latency`` seconds (time to first token) and
+then ``token_delay`` seconds per token, so both the blocking and the
+streaming code paths see realistic timings. ``jitter`` adds up to that
+many seconds of random extra latency, and ``error_rate`` answers that share
+of requests with a 503, so several instances can stand in for endpoints of
+different speed and health (see model_router.py).
+
+    python -m bench.fake_llm --port 8901 --latency 0.4 --token-delay 0.02
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = (
+    "It sounds like a lot is on your mind right now. Thank you for sharing it with me. "
+    "Would you like to talk about what has been weighing on you the most today?"
+)
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        latency: float = 0.4,
+        token_delay: float = 0.02,
+        tokens: int = 40,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+    ):
+        super().__init__(address, FakeLLMHandler)
+        self.latency = latency
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.counters = {"requests": 0, "streamed": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def count(self, streamed: bool, failed: bool = False) -> None:
+        with self._lock:
+            self.counters["requests"] += 1
+            self.counters["streamed"] += int(streamed)
+            self.counters["errors"] += int(failed)
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        streamed = bool(body.get("stream"))
+        failed = random.random() < self.server.error_rate
+        self.server.count(streamed, failed)
+        if failed:
+            self._send_json(503, {"error": {"message": "fake upstream error"}})
+            return
+        words = REPLY.split(" ")
+        pieces = [words[i % len(words)] + " " for i in range(self.server.tokens)]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "fake")
+
+        time.sleep(self.server.latency + random.uniform(0, self.server.jitter))
+        if not streamed:
+            time.sleep(self.server.token_delay * len(pieces))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(pieces).strip()},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(pieces), "total_tokens": len(pieces)},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(self.server.token_delay)
+            self._send_event(completion_id, model, {"content": piece}, None)
+        self._send_event(completion_id, model, {}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _send_event(self, completion_id: str, model: str, delta: dict, finish_reason) -> None:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start(host: str = "127.0.0.1", port: int = 0, **options) -> FakeLLMServer:
+    """Serve on a background thread; ``port`` 0 picks a free port."""
+    server = FakeLLMServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency", type=float, default=0.4, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds of latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    args = parser.parse_args()
+    server = FakeLLMServer(
+        (args.host, args.port),
+        latency=args.latency,
+        token_delay=args.token_delay,
+        tokens=args.tokens,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+    )
+    print(f"Fake LLM listening on http://{args.host}:{server.server_port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
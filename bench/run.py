@@ -0,0 +1,285 @@
+"""
+Drive simulated users against a locally served app and record the results.
+
+Starts the fake LLM and the SMTP sink in this process and the app as a
+``bench.serve`` subprocess pointed at them, then runs ``--concurrency``
+users for ``--duration`` seconds. Each user logs in as a seeded bench user
+(run ``bench.seed`` first) and loops over the home page, the chat page of
+one of its seeded sessions and a chat turn, streamed for ``--stream-ratio``
+of the turns; every ``--relogin-every`` loops it logs out and in again.
+
+Results — p50/p95/p99 latency per endpoint, requests per second and DB
+queries per request — are written to ``bench/results/<timestamp>.json``
+(or ``--output``).
+
+``--llm-backup-latency`` starts a second fake LLM and registers both with
+the model router (see model_router.py), to measure routing and hedging;
+``--llm-error-rate`` makes the primary fail that share of its requests.
+
+    python -m bench.run --concurrency 20 --duration 60 --llm-latency 0.4
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+from dotenv import load_dotenv
+
+from bench import fake_llm, smtp_sink
+from bench.seed import BENCH_PASSWORD, session_uuid, user_email
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}  # label -> [seconds]
+        self.first_byte = {}  # label -> [seconds], streamed replies only
+        self.errors = {}  # label -> count
+
+    def record(self, label: str, seconds: float, ok: bool, first_byte: float = None) -> None:
+        with self._lock:
+            self.samples.setdefault(label, []).append(seconds)
+            if first_byte is not None:
+                self.first_byte.setdefault(label, []).append(first_byte)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+    def summary(self, wall: float) -> dict:
+        endpoints = {}
+        with self._lock:
+            for label, values in sorted(self.samples.items()):
+                values = sorted(values)
+                entry = {
+                    "requests": len(values),
+                    "errors": self.errors.get(label, 0),
+                    "rps": round(len(values) / wall, 2),
+                    "mean_ms": round(sum(values) / len(values) * 1000, 1),
+                    "p50_ms": round(percentile(values, 50) * 1000, 1),
+                    "p95_ms": round(percentile(values, 95) * 1000, 1),
+                    "p99_ms": round(percentile(values, 99) * 1000, 1),
+                    "max_ms": round(values[-1] * 1000, 1),
+                }
+                if label in self.first_byte:
+                    ttfb = sorted(self.first_byte[label])
+                    entry["first_byte_p50_ms"] = round(percentile(ttfb, 50) * 1000, 1)
+                    entry["first_byte_p95_ms"] = round(percentile(ttfb, 95) * 1000, 1)
+                endpoints[label] = entry
+            total = sum(len(v) for v in self.samples.values())
+            errors = sum(self.errors.values())
+        return {"requests": total, "errors": errors, "rps": round(total / wall, 2), "endpoints": endpoints}
+
+
+class SimulatedUser(threading.Thread):
+    def __init__(self, n: int, base_url: str, recorder: Recorder, args, stop: threading.Event):
+        super().__init__(name=f"user-{n}", daemon=True)
+        self.email = user_email(n % args.users)
+        self.base_url = base_url
+        self.recorder = recorder
+        self.args = args
+        self.stop = stop
+        self.rng = random.Random(n)
+        self.http = requests.Session()
+        self.logged_in = False
+
+    def timed(self, label: str, method: str, path: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=60, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.record(label, time.perf_counter() - started, ok)
+        return response
+
+    def login(self) -> None:
+        if self.logged_in:
+            self.timed("GET /logout", "GET", "/logout", allow_redirects=False)
+        response = self.timed(
+            "POST /login",
+            "POST",
+            "/login",
+            data={"username": self.email, "password": BENCH_PASSWORD},
+            allow_redirects=False,
+        )
+        self.logged_in = response is not None and "/chat" in response.headers.get("Location", "")
+        if not self.logged_in:
+            print(f"⚠️ Login failed for {self.email} — has bench.seed been run?", file=sys.stderr)
+
+    def chat_turn(self) -> None:
+        payload = {"message": self.rng.choice(["hello", "I feel anxious today", "Can we talk about sleep?"])}
+        if self.rng.random() >= self.args.stream_ratio:
+            self.timed("POST /send_message", "POST", "/send_message", json=payload)
+            return
+        label = "POST /send_message (stream)"
+        started = time.perf_counter()
+        first_byte, ok = None, False
+        try:
+            with self.http.post(
+                self.base_url + "/send_message",
+                json=payload,
+                headers={"Accept": "text/event-stream"},
+                stream=True,
+                timeout=60,
+            ) as response:
+                ok = response.status_code < 400
+                for chunk in response.iter_content(chunk_size=None):
+                    if first_byte is None and chunk:
+                        first_byte = time.perf_counter() - started
+        except requests.RequestException:
+            ok = False
+        self.recorder.record(label, time.perf_counter() - started, ok, first_byte)
+
+    def run(self) -> None:
+        self.login()
+        loops = 0
+        while not self.stop.is_set():
+            session_id = session_uuid(self.email, self.rng.randrange(self.args.sessions))
+            self.timed("GET /", "GET", "/")
+            self.timed("GET /chat", "GET", f"/chat?session_id={session_id}")
+            self.chat_turn()
+            loops += 1
+            if self.args.relogin_every and loops % self.args.relogin_every == 0:
+                self.login()
+            if self.args.think_time:
+                self.stop.wait(self.rng.uniform(0, 2 * self.args.think_time))
+
+
+def start_app(port: int, llm: fake_llm.FakeLLMServer, smtp: smtp_sink.SMTPSink, backup=None) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        TOGETHER_API_KEY="bench",
+        TOGETHER_BASE_URL=f"http://127.0.0.1:{llm.server_port}/v1",
+        MAIL_SERVER="127.0.0.1",
+        MAIL_PORT=str(smtp.server_address[1]),
+        MAIL_USE_TLS="false",
+        PYTHONUNBUFFERED="1",
+    )
+    if backup is not None:
+        env["LLM_MODELS"] = json.dumps(
+            [
+                {"name": name, "base_url": f"http://127.0.0.1:{server.server_port}/v1", "api_key_env": "TOGETHER_API_KEY"}
+                for name, server in (("primary", llm), ("backup", backup))
+            ]
+        )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "bench.serve", "--port", str(port)], cwd=ROOT_DIR, env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("the app exited during startup")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("the app did not start within 30 seconds")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20, help="simulated users")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load after warm-up")
+    parser.add_argument("--users", type=int, default=200, help="seeded bench users to log in as")
+    parser.add_argument("--sessions", type=int, default=5, help="seeded sessions per user")
+    parser.add_argument("--stream-ratio", type=float, default=0.5, help="fraction of chat turns that stream")
+    parser.add_argument("--relogin-every", type=int, default=10, help="loops between logins (0 = never)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between loops, seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="fake LLM time to first token")
+    parser.add_argument("--llm-token-delay", type=float, default=0.02, help="fake LLM delay between tokens")
+    parser.add_argument("--llm-tokens", type=int, default=40, help="tokens per fake reply")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="fake LLM random extra latency, up to")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="share of fake LLM requests that fail")
+    parser.add_argument("--llm-backup-latency", type=float, help="start a second fake LLM with this latency")
+    parser.add_argument("--port", type=int, default=8900, help="port for the app under test")
+    parser.add_argument("--output", help="results file (default: bench/results/<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    llm = fake_llm.start(
+        latency=args.llm_latency,
+        token_delay=args.llm_token_delay,
+        tokens=args.llm_tokens,
+        jitter=args.llm_jitter,
+        error_rate=args.llm_error_rate,
+    )
+    backup = None
+    if args.llm_backup_latency is not None:
+        backup = fake_llm.start(
+            latency=args.llm_backup_latency, token_delay=args.llm_token_delay, tokens=args.llm_tokens
+        )
+    smtp = smtp_sink.start()
+    app = start_app(args.port, llm, smtp, backup)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        recorder = Recorder()
+        stop = threading.Event()
+        users = [SimulatedUser(n, base_url, recorder, args, stop) for n in range(args.concurrency)]
+        started_at = datetime.now(timezone.utc).isoformat()
+        started = time.perf_counter()
+        for user in users:
+            user.start()
+        stop.wait(args.duration)
+        stop.set()
+        for user in users:
+            user.join(timeout=60)
+        wall = time.perf_counter() - started
+        queries = requests.get(base_url + "/__bench__/queries", timeout=5).json()
+    finally:
+        app.terminate()
+        app.wait(timeout=15)
+
+    summary = recorder.summary(wall)
+    for label, entry in summary["endpoints"].items():
+        per_request = queries["endpoints"].get(label, {}).get("queries_per_request")
+        if per_request is not None:
+            entry["db_queries_per_request"] = per_request
+    results = {
+        "started_at": started_at,
+        "config": vars(args),
+        "wall_seconds": round(wall, 2),
+        **summary,
+        "db": queries,
+        "llm": dict(llm.counters),
+        "llm_backup": dict(backup.counters) if backup is not None else None,
+        "emails_sent": smtp.messages,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'endpoint':32} {'reqs':>6} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8}")
+    for label, entry in summary["endpoints"].items():
+        print(
+            f"{label:32} {entry['requests']:>6} {entry['errors']:>4} {entry['p50_ms']:>7.0f}ms "
+            f"{entry['p95_ms']:>7.0f}ms {entry['p99_ms']:>7.0f}ms {entry.get('db_queries_per_request', '-'):>8}"
+        )
+    print(f"✅ {summary['requests']} requests, {summary['rps']} req/s — results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
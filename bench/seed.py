@@ -0,0 +1,150 @@
+"""
+Load a local database with benchmark data.
+
+Creates ``--users`` confirmed users (``bench-<n>@example.com``, all with
+password ``BENCH_PASSWORD``), each with ``--sessions`` chat sessions of
+``--messages`` messages spread over the last ``--months`` months, plus
+``--feedback`` feedback entries. Pending migrations are applied first and
+earlier bench data is replaced, so the command can be re-run.
+
+    python -m bench.seed --users 200 --sessions 5 --messages 40
+"""
+
+import argparse
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+from werkzeug.security import generate_password_hash
+
+import db
+import hashing
+import migrate
+import partitions
+
+BENCH_PASSWORD = "bench-password"
+BENCH_DOMAIN = "example.com"
+FEEDBACK_NAME = "Bench user"
+
+USER_LINES = [
+    "I have been feeling anxious about work lately.",
+    "I couldn't sleep well last night.",
+    "Can you suggest a breathing exercise?",
+    "My exams are next week and I feel overwhelmed.",
+    "Talking to my family has been hard recently.",
+    "I had a good day today, actually.",
+]
+BOT_LINES = [
+    "That sounds really hard. What part of it feels heaviest right now?",
+    "Thank you for telling me. Would it help to try a short grounding exercise together?",
+    "It makes sense to feel that way. What has helped you in the past?",
+    "I'm glad you shared that. How are you feeling about it now?",
+]
+
+
+def user_email(n: int) -> str:
+    return f"bench-{n}@{BENCH_DOMAIN}"
+
+
+def session_uuid(email: str, n: int) -> str:
+    """Deterministic session id, so the load generator can find seeded sessions."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"cogi-bench:{email}:{n}"))
+
+
+def clear(cur) -> None:
+    pattern = f"bench-%@{BENCH_DOMAIN}"
+    cur.execute("DELETE FROM conversations WHERE user_email LIKE %s", (pattern,))
+    cur.execute("DELETE FROM chat_sessions WHERE user_email LIKE %s", (pattern,))
+    cur.execute("DELETE FROM users WHERE email LIKE %s", (pattern,))
+    cur.execute("DELETE FROM feedback WHERE name = %s", (FEEDBACK_NAME,))
+
+
+def seed(users: int, sessions: int, messages: int, feedback: int, months: int, rng: random.Random) -> dict:
+    now = datetime.now(timezone.utc)
+    oldest = partitions.add_months(partitions.month_start(now.year, now.month), -months)
+    # Hash once with the app's current method, so logins never trigger a rehash.
+    password = generate_password_hash(BENCH_PASSWORD, method=hashing.HASH_METHOD)
+    span = (now - oldest).total_seconds()
+    counts = {"users": 0, "sessions": 0, "messages": 0, "feedback": 0}
+
+    with db.cursor() as cur:
+        clear(cur)
+        # Monthly partitions for the whole seeded range, not just the months ahead.
+        partitions.ensure_partitions(cur, months + partitions.MONTHS_AHEAD, now=oldest)
+
+        for n in range(users):
+            email = user_email(n)
+            cur.execute(
+                "INSERT INTO users (email, password, first_name, last_name, confirmed) VALUES (%s, %s, %s, %s, TRUE)",
+                (email, password, "Bench", f"User {n}"),
+            )
+            session_rows, message_rows = [], []
+            for s in range(sessions):
+                sid = session_uuid(email, s)
+                started = oldest + timedelta(seconds=rng.uniform(0, span * 0.9))
+                at = started
+                for m in range(messages):
+                    sender = "user" if m % 2 == 0 else "bot"
+                    text = rng.choice(USER_LINES if sender == "user" else BOT_LINES)
+                    message_rows.append((email, text, sender, at, sid))
+                    at += timedelta(seconds=rng.uniform(5, 120))
+                session_rows.append((sid, email, f"Chat {s + 1}", started, min(at, now)))
+            execute_values(
+                cur,
+                "INSERT INTO chat_sessions (id, user_email, title, created_at, last_message_at) VALUES %s",
+                session_rows,
+            )
+            execute_values(
+                cur,
+                'INSERT INTO conversations (user_email, message, sender, "timestamp", session_id) VALUES %s',
+                message_rows,
+                page_size=1000,
+            )
+            counts["users"] += 1
+            counts["sessions"] += len(session_rows)
+            counts["messages"] += len(message_rows)
+
+        execute_values(
+            cur,
+            "INSERT INTO feedback (name, message, submitted_at) VALUES %s",
+            [
+                (FEEDBACK_NAME, rng.choice(USER_LINES), (oldest + timedelta(seconds=rng.uniform(0, span))).replace(tzinfo=None))
+                for _ in range(feedback)
+            ],
+            page_size=1000,
+        )
+        counts["feedback"] = feedback
+        cur.execute("ANALYZE")
+    return counts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--sessions", type=int, default=5, help="chat sessions per user")
+    parser.add_argument("--messages", type=int, default=40, help="messages per session")
+    parser.add_argument("--feedback", type=int, default=500)
+    parser.add_argument("--months", type=int, default=3, help="spread messages over this many past months")
+    parser.add_argument("--random-seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    conn = migrate.connect()
+    try:
+        print(f"✅ {migrate.migrate(conn)} migration(s) applied.")
+    finally:
+        conn.close()
+
+    started = time.monotonic()
+    counts = seed(args.users, args.sessions, args.messages, args.feedback, args.months, random.Random(args.random_seed))
+    db.close_pool()
+    print(f"✅ Seeded {counts} in {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Run the app for a benchmark, counting the SQL statements each request issues.
+
+Started by ``bench.run`` with the stand-in services configured through the
+environment. Every psycopg2 ``execute`` is counted against the request being
+served on that thread (statements from background threads — summarizer,
+write-behind, job workers — are counted separately), and the totals are
+served as JSON at ``/__bench__/queries``.
+
+    python -m bench.serve --port 8900
+"""
+
+import argparse
+import json
+import os
+import threading
+
+from werkzeug.serving import make_server
+
+import db
+
+QUERIES_PATH = "/__bench__/queries"
+
+
+class QueryCounter:
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.by_endpoint = {}  # label -> [requests, queries]
+        self.background = 0
+
+    def statement(self) -> None:
+        if getattr(self._local, "count", None) is not None:
+            self._local.count += 1
+        else:
+            with self._lock:
+                self.background += 1
+
+    def begin(self) -> None:
+        self._local.count = 0
+
+    def end(self, label: str) -> None:
+        count, self._local.count = self._local.count, None
+        with self._lock:
+            totals = self.by_endpoint.setdefault(label, [0, 0])
+            totals[0] += 1
+            totals[1] += count
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "endpoints": {
+                    label: {"requests": n, "queries": q, "queries_per_request": round(q / n, 2) if n else 0}
+                    for label, (n, q) in self.by_endpoint.items()
+                },
+                "background_queries": self.background,
+            }
+
+
+counter = QueryCounter()
+
+
+class CountingCursor(db.TimedCursor):
+    def execute(self, query, vars=None):
+        counter.statement()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        counter.statement()
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        counter.statement()
+        return super().copy_expert(sql, file, size)
+
+
+class CountingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") == QUERIES_PATH:
+            body = json.dumps(counter.snapshot()).encode("utf-8")
+            start_response("200 OK", [("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+            return [body]
+        return self._counted(environ, start_response)
+
+    def _counted(self, environ, start_response):
+        label = f"{environ['REQUEST_METHOD']} {environ.get('PATH_INFO', '/')}"
+        counter.begin()
+        try:
+            # Streamed responses query the database while the body is iterated.
+            yield from self.app(environ, start_response)
+        finally:
+            counter.end(label)
+
+
+def install_counting_pool() -> None:
+    """Replace the app's pool with one whose cursors are counted."""
+    db._pool = db.ConnectionPool(
+        minconn=0,
+        maxconn=db.pool_max_from_env(),
+        cursor_factory=CountingCursor,
+        **db.dsn_from_env(),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+
+    install_counting_pool()
+    from app import create_app  # imported after the pool swap
+
+    app = create_app()  # reads the stand-in settings from the environment
+    app.wsgi_app = CountingMiddleware(app.wsgi_app)
+    server = make_server(args.host, args.port, app, threaded=True)
+    print(f"Benchmark app listening on http://{args.host}:{args.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Minimal SMTP server that accepts every message and throws it away.
+
+Point MAIL_SERVER/MAIL_PORT at it (with MAIL_USE_TLS=false) so registration
+and password-reset mail never leaves the machine.
+
+    python -m bench.smtp_sink --port 8925
+"""
+
+import argparse
+import socketserver
+import threading
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, SMTPHandler)
+        self.messages = 0
+        self._lock = threading.Lock()
+
+    def received(self) -> None:
+        with self._lock:
+            self.messages += 1
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str) -> None:
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost bench SMTP sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip().split(" ", 1)[0].upper()
+            if command in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline().rstrip(b"\r\n") != b".":
+                    pass
+                self.server.received()
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                # MAIL, RCPT, RSET, NOOP, ...
+                self.reply("250 OK")
+
+
+def start(host: str = "127.0.0.1", port: int = 0) -> SMTPSink:
+    """Serve on a background thread; ``port`` 0 picks a free port."""
+    server = SMTPSink((host, port))
+    threading.Thread(target=server.serve_forever, name="smtp-sink", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8925)
+    args = parser.parse_args()
+    server = SMTPSink((args.host, args.port))
+    print(f"SMTP sink listening on {args.host}:{server.server_address[1]}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
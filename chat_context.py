@@ -0,0 +1,121 @@
+"""
+Prompt assembly for multi-turn conversations.
+
+The model only sees what we send it, so each request carries the stored
+summary of the session's older turns (see summarizer.py) followed by the
+recent turns, newest first until a token budget is used up. Both are kept
+per session in process memory so building a prompt does not re-read the
+session from Postgres on every message. Each cached entry carries the
+session's version, ``(chat_sessions.last_message_at, summarized_through_id)``;
+the caller compares it with the database (one primary-key lookup) so turns
+written by another worker, a new summary or a deleted chat are noticed.
+Snippets recalled from the user's other sessions (see memory.py) go right
+after the summary.
+"""
+
+import os
+import threading
+from collections import OrderedDict, deque
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", 1500))
+HISTORY_MAX_TURNS = int(os.environ.get("HISTORY_MAX_TURNS", 40))
+HISTORY_CACHE_SESSIONS = int(os.environ.get("HISTORY_CACHE_SESSIONS", 1024))
+
+ROLE_BY_SENDER = {"user": "user", "bot": "assistant"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token, plus per-message overhead)."""
+    return len(text) // 4 + 4
+
+
+class HistoryCache:
+    """LRU map of session_id -> (summary, last ``max_turns`` (role, content) pairs, version).
+
+    ``version`` is ``(last_message_at, summarized_through_id)`` as of the
+    cached turns, or None for a session with no stored row yet.
+    """
+
+    def __init__(self, max_sessions: int = HISTORY_CACHE_SESSIONS, max_turns: int = HISTORY_MAX_TURNS):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str):
+        """Return ``(summary, turns, version)`` for a cached session, or None if it is not cached."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            return entry[0], list(entry[1]), entry[2]
+
+    def load(self, session_id: str, turns, summary=None, version=None) -> None:
+        with self._lock:
+            self._sessions[session_id] = [summary, deque(turns, maxlen=self.max_turns), version]
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def append(self, session_id: str, role: str, content: str, at=None) -> None:
+        """Record a new turn written at ``at``; sessions that are not cached are left for the next load."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry[1].append((role, content))
+                if at is not None:
+                    last, through_id = entry[2] or (None, 0)
+                    entry[2] = (at if last is None else max(last, at), through_id)
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+def is_current(cached_version, stored_version) -> bool:
+    """Whether a cached entry still holds the session's latest turns and summary.
+
+    The cache may be ahead of the database (its own turns still in the
+    write-behind buffer), but never behind: a newer ``last_message_at``, a
+    different summary or a missing session row means it must be reloaded.
+    """
+    if stored_version is None:
+        return cached_version is None
+    if cached_version is None or cached_version[0] is None:
+        return False
+    return stored_version[1] == cached_version[1] and stored_version[0] <= cached_version[0]
+
+
+def build_messages(
+    system_prompt: str, history, user_message: str, budget: int = HISTORY_TOKEN_BUDGET, summary=None, memories=None
+):
+    """Assemble chat messages: system prompt, summary, memories, as many recent turns as fit, then the new message.
+
+    ``history`` is a list of (role, content) pairs, oldest first. Turns are
+    taken newest first; once the budget is exhausted, older turns are dropped.
+    """
+    preamble = [{"role": "system", "content": system_prompt}]
+    if summary:
+        preamble.append(
+            {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+        )
+    if memories:
+        preamble.append(
+            {
+                "role": "system",
+                "content": "Things the user said in earlier conversations:\n"
+                + "\n".join(f"- {snippet}" for snippet in memories),
+            }
+        )
+    remaining = budget - estimate_tokens(user_message)
+    remaining -= sum(estimate_tokens(m["content"]) for m in preamble)
+    kept = []
+    for role, content in reversed(history):
+        cost = estimate_tokens(content)
+        if cost > remaining:
+            break
+        kept.append({"role": role, "content": content})
+        remaining -= cost
+    kept.reverse()
+    return preamble + kept + [{"role": "user", "content": user_message}]
@@ -0,0 +1,316 @@
+"""
+PostgreSQL connection pool for Cogi.
+
+Every request used to open (and tear down) its own psycopg2 connection.
+This module keeps a bounded set of live connections and hands them out
+through context managers, so call sites look like:
+
+    with db.cursor() as cur:
+        cur.execute("SELECT ...")
+
+The transaction is committed when the block exits cleanly and rolled back
+if it raises.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+import metrics
+
+
+def dsn_from_env() -> dict:
+    """psycopg2.connect() keyword arguments taken from DB_* environment variables."""
+    return {
+        "dbname": os.environ.get("DB_NAME", "cogi_db"),
+        "user": os.environ.get("DB_USER", "mac"),
+        "password": os.environ.get("DB_PASSWORD", "cogi123"),
+        "host": os.environ.get("DB_HOST", "localhost"),
+        "port": os.environ.get("DB_PORT", "5432"),
+    }
+
+
+def pool_max_from_env() -> int:
+    """DB_POOL_MAX, by default one connection per request thread (GUNICORN_THREADS)
+    plus one per background job worker (JOB_WORKERS) and one for the turn flusher.
+
+    Without GUNICORN_THREADS (the development server) the default is 10.
+    """
+    if "DB_POOL_MAX" in os.environ:
+        return int(os.environ["DB_POOL_MAX"])
+    if "GUNICORN_THREADS" not in os.environ:
+        return 10
+    return int(os.environ["GUNICORN_THREADS"]) + int(os.environ.get("JOB_WORKERS", 2)) + 1
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Cursor that reports each statement's duration to ``metrics``."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metrics.record_query(time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            metrics.record_query(time.perf_counter() - started)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            metrics.record_query(time.perf_counter() - started)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out before the deadline."""
+
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of psycopg2 connections.
+
+    ``minconn`` connections are opened up front, more are opened on demand up
+    to ``maxconn``. When every connection is in use, ``getconn`` waits up to
+    ``timeout`` seconds for one to be returned, then raises ``PoolTimeout``.
+    Idle connections older than ``health_check_interval`` seconds are pinged
+    before being handed out (0 pings on every checkout).
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=5.0, health_check_interval=30.0, **dsn):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("invalid pool bounds: min=%s max=%s" % (minconn, maxconn))
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._dsn = dsn
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, returned_at) — used as a LIFO stack
+        self._size = 0  # connections opened and not yet closed
+        self._waiting = 0
+        self._closed = False
+        self._counters = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "peak_in_use": 0,
+        }
+        for _ in range(minconn):
+            conn = self._connect()
+            self._size += 1
+            self._idle.append((conn, time.monotonic()))
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+            maxconn=pool_max_from_env(),
+            timeout=float(os.environ.get("DB_POOL_TIMEOUT", 5)),
+            health_check_interval=float(os.environ.get("DB_POOL_HEALTHCHECK_INTERVAL", 30)),
+            **dsn_from_env(),
+        )
+
+    # ------------------------------------------------------------------ internals
+
+    def _connect(self):
+        return psycopg2.connect(**{"cursor_factory": TimedCursor, **self._dsn})
+
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    # ------------------------------------------------------------------ public API
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            if self._closed:
+                raise PoolTimeout("connection pool is closed")
+            waited = False
+            while True:
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    conn, returned_at = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeout(
+                        "no database connection available after %.1fs" % self.timeout
+                    )
+                if not waited:
+                    self._counters["waits"] += 1
+                    waited = True
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._counters["checkouts"] += 1
+            in_use = self._size - len(self._idle)
+            if in_use > self._counters["peak_in_use"]:
+                self._counters["peak_in_use"] = in_use
+
+        # Network I/O happens outside the lock.
+        if conn is not None and not self._is_healthy(conn, time.monotonic() - returned_at):
+            with self._cond:
+                self._counters["health_check_failures"] += 1
+            self._close_quietly(conn)
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._release_slot()
+                raise
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed or self._closed:
+            self._close_quietly(conn)
+            self._release_slot()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; commit on success, roll back on error."""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    @contextmanager
+    def cursor(self):
+        with self.connection() as conn:
+            cur = conn.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> dict:
+        """Snapshot of pool usage, suitable for a JSON endpoint or metrics scrape."""
+        with self._cond:
+            idle = len(self._idle)
+            in_use = self._size - idle
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "open": self._size,
+                "idle": idle,
+                "in_use": in_use,
+                "waiting": self._waiting,
+                "saturation": round(in_use / self.maxconn, 3),
+                **self._counters,
+            }
+
+
+# ----------------------------- Module-level pool -----------------------------
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool.from_env()
+    return _pool
+
+
+def connection():
+    return get_pool().connection()
+
+
+def cursor():
+    return get_pool().cursor()
+
+
+@contextmanager
+def dedicated_connection():
+    """A connection of its own, outside the pool, for long-lived work such as
+    streaming an export to a slow client; commit on success, roll back on
+    error, always closed."""
+    conn = psycopg2.connect(cursor_factory=TimedCursor, **dsn_from_env())
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
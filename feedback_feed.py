@@ -0,0 +1,108 @@
+"""
+Read model for user feedback.
+
+The homepage shows the newest entries and is mostly hit by anonymous
+visitors, so that snippet is kept in process for ``ttl`` seconds and dropped
+as soon as this process records new feedback (other workers pick it up when
+their copy expires). The full list is keyset-paginated on
+(submitted_at, id).
+
+``version()`` identifies the newest entry and is served from the same
+cache, so pages can be given ETag / Last-Modified validators without a
+query.
+"""
+
+import os
+import threading
+import time
+
+import db
+
+
+def _as_dict(row) -> dict:
+    return {"id": row[0], "name": row[1], "message": row[2], "submitted_at": row[3]}
+
+
+class FeedbackFeed:
+    def __init__(self, snippet_size: int = 10, page_size: int = 50, ttl: float = 60.0):
+        self.snippet_size = snippet_size
+        self.page_size = page_size
+        self.ttl = ttl
+        self._snippet = None  # (entries, expires_at)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            snippet_size=int(os.environ.get("FEEDBACK_SNIPPET_SIZE", 10)),
+            page_size=int(os.environ.get("FEEDBACK_PAGE_SIZE", 50)),
+            ttl=float(os.environ.get("FEEDBACK_CACHE_TTL", 60)),
+        )
+
+    def latest(self) -> list:
+        """The newest ``snippet_size`` entries, newest first."""
+        with self._lock:
+            if self._snippet is None or self._snippet[1] <= time.monotonic():
+                # Refreshed under the lock: one query per expiry, not one per waiting request.
+                with db.cursor() as cur:
+                    cur.execute(
+                        """
+                        SELECT id, name, message, submitted_at
+                        FROM feedback
+                        ORDER BY submitted_at DESC, id DESC
+                        LIMIT %s
+                        """,
+                        (self.snippet_size,),
+                    )
+                    entries = [_as_dict(row) for row in cur.fetchall()]
+                self._snippet = (entries, time.monotonic() + self.ttl)
+            return self._snippet[0]
+
+    def version(self):
+        """(id, submitted_at) of the newest entry, or (0, None) if there is none."""
+        entries = self.latest()
+        return (entries[0]["id"], entries[0]["submitted_at"]) if entries else (0, None)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._snippet = None
+
+    def add(self, name: str, message: str) -> None:
+        with db.cursor() as cur:
+            cur.execute("INSERT INTO feedback (name, message) VALUES (%s, %s)", (name, message))
+        self.invalidate()
+
+    def page(self, before=None):
+        """Return (entries, next_before) for one page of the full list, newest first.
+
+        ``before`` is the (submitted_at, id) of the last entry of the previous
+        page, or None for the first page; ``next_before`` is None on the last.
+        """
+        with db.cursor() as cur:
+            if before:
+                cur.execute(
+                    """
+                    SELECT id, name, message, submitted_at
+                    FROM feedback
+                    WHERE (submitted_at, id) < (%s, %s)
+                    ORDER BY submitted_at DESC, id DESC
+                    LIMIT %s
+                    """,
+                    (before[0], before[1], self.page_size + 1),
+                )
+            else:
+                cur.execute(
+                    """
+                    SELECT id, name, message, submitted_at
+                    FROM feedback
+                    ORDER BY submitted_at DESC, id DESC
+                    LIMIT %s
+                    """,
+                    (self.page_size + 1,),
+                )
+            rows = cur.fetchall()
+        entries = [_as_dict(row) for row in rows[: self.page_size]]
+        next_before = None
+        if len(rows) > self.page_size:
+            next_before = (entries[-1]["submitted_at"], entries[-1]["id"])
+        return entries, next_before
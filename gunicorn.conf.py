@@ -0,0 +1,100 @@
+"""
+Gunicorn settings for production (``gunicorn -c gunicorn.conf.py wsgi:app``).
+
+Requests spend most of their time waiting on Together AI, so the default is
+a few processes with many threads each (``gthread``) rather than one
+process per CPU. Every setting can be overridden from the environment:
+
+    WEB_CONCURRENCY          worker processes (default: CPU count, at least 2;
+                             always 1 without SESSION_REDIS_URL)
+    GUNICORN_THREADS         threads per worker (default 16)
+    GUNICORN_WORKER_CLASS    worker class (default gthread)
+    GUNICORN_TIMEOUT         seconds a worker may stay silent (default 120)
+    GUNICORN_GRACEFUL_TIMEOUT  seconds to finish in-flight requests on stop (default
+                             LLM_ROUTE_TIMEOUT + 30, and never less than LLM_ROUTE_TIMEOUT + 15)
+    GUNICORN_PRELOAD         "1" to import the app once in the master before forking
+    GUNICORN_MAX_REQUESTS    recycle a worker after this many requests (default 0, never)
+    PORT                     listening port (default 5000)
+
+Sessions live in process memory unless SESSION_REDIS_URL points at a shared
+Redis (see session_store.py); a login on one worker would be unknown to the
+others, so without it a single worker is started.
+
+DB_POOL_MAX follows GUNICORN_THREADS unless it is set (see db.py). Keep
+LLM_MAX_IN_FLIGHT in line with how many concurrent model calls one worker
+should make.
+
+On SIGTERM a worker stops accepting connections and reports "draining" on
+/readyz while its in-flight requests finish; then ``worker_exit`` flushes
+buffered turns and queued mail and closes the pool.
+"""
+
+import os
+import signal
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", max(2, os.cpu_count() or 1)))
+if workers > 1 and not os.environ.get("SESSION_REDIS_URL"):
+    print(
+        "gunicorn.conf.py: SESSION_REDIS_URL is not set, so sessions are per process; "
+        f"starting 1 worker instead of {workers}",
+        file=sys.stderr,
+    )
+    workers = 1
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+# Read by db.py in the workers to size the connection pool.
+os.environ.setdefault("GUNICORN_THREADS", str(threads))
+# Streamed replies keep a request busy for the whole model call.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+# A reply may take up to LLM_ROUTE_TIMEOUT; stopping sooner would cut it off,
+# and worker_exit needs the remaining margin to flush.
+route_timeout = float(os.environ.get("LLM_ROUTE_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", route_timeout + 30))
+if graceful_timeout < route_timeout + 15:
+    print(
+        f"gunicorn.conf.py: GUNICORN_GRACEFUL_TIMEOUT={graceful_timeout} is shorter than "
+        f"LLM_ROUTE_TIMEOUT={route_timeout:g} plus 15s; using {route_timeout + 15:g}",
+        file=sys.stderr,
+    )
+    graceful_timeout = int(route_timeout + 15)
+keepalive = 5
+preload_app = os.environ.get("GUNICORN_PRELOAD", "0") == "1"
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    """Report "draining" on /readyz as soon as the worker is asked to stop.
+
+    gthread keeps serving in-flight requests for up to graceful_timeout after
+    SIGTERM, and only then runs ``worker_exit``.
+    """
+    app_module = sys.modules.get("app")
+    if app_module is None:
+        return
+    handle_exit = worker.handle_exit
+
+    def on_term(sig, frame):
+        app_module.begin_drain()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, on_term)
+
+
+def worker_int(worker):
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        app_module.begin_drain()
+
+
+def worker_exit(server, worker):
+    """Drain model calls, flush buffered turns and queued mail, close the pool."""
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        # Requests have finished by now (or hit graceful_timeout); the master
+        # kills workers that outlive it, so keep this well inside the margin.
+        app_module.shutdown(drain_timeout=(graceful_timeout - route_timeout) / 3)
@@ -0,0 +1,90 @@
+"""
+Password hashing off the request thread.
+
+PBKDF2 is deliberately slow and holds the GIL while it runs, so hashing on
+a request thread stalls every other request in the same worker. Hashes are
+computed in a process pool sized to the machine's cores instead.
+
+The work factor is ``PASSWORD_HASH_ITERATIONS``. Hashes stored with other
+parameters still verify; ``needs_rehash`` tells the caller to upgrade them.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+HASH_ITERATIONS = int(os.environ.get("PASSWORD_HASH_ITERATIONS", 1000000))
+HASH_METHOD = f"pbkdf2:sha256:{HASH_ITERATIONS}"
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+
+_executor = None
+_lock = threading.Lock()
+_stats = {"queue_depth": 0, "peak_queue_depth": 0, "completed": 0}
+
+
+# These run in the worker processes and must stay importable at module level.
+
+def _hash(password: str, method: str) -> str:
+    return generate_password_hash(password, method=method)
+
+
+def _verify(stored: str, password: str) -> bool:
+    return check_password_hash(stored, password)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            # spawn, not fork: the web process is multi-threaded.
+            _executor = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _run(fn, *args):
+    with _lock:
+        _stats["queue_depth"] += 1
+        _stats["peak_queue_depth"] = max(_stats["peak_queue_depth"], _stats["queue_depth"])
+    try:
+        return _get_executor().submit(fn, *args).result()
+    except BrokenProcessPool:
+        # A crashed worker poisons the pool; replace it and hash inline this once.
+        shutdown()
+        return fn(*args)
+    finally:
+        with _lock:
+            _stats["queue_depth"] -= 1
+            _stats["completed"] += 1
+
+
+def hash_password(password: str) -> str:
+    return _run(_hash, password, HASH_METHOD)
+
+
+def verify_password(stored: str, password: str) -> bool:
+    return _run(_verify, stored, password)
+
+
+def needs_rehash(stored: str) -> bool:
+    """True if ``stored`` was not produced with the current method and work factor."""
+    return stored.split("$", 1)[0] != HASH_METHOD
+
+
+def stats() -> dict:
+    """Calls currently waiting for or running in the pool, plus totals."""
+    with _lock:
+        return {"workers": HASH_WORKERS, "iterations": HASH_ITERATIONS, **_stats}
+
+
+def shutdown() -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
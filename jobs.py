@@ -0,0 +1,134 @@
+"""
+In-process background job queue.
+
+Slow side effects (sending e-mail) are enqueued by the request and run on a
+small pool of worker threads, so the response does not wait on SMTP. A job
+that raises is retried with exponential backoff; after ``max_attempts`` it is
+written to the ``failed_jobs`` dead-letter table for inspection.
+
+Jobs live in memory: anything still queued when the process is killed is
+lost, but ``shutdown`` drains the queue on a normal exit.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import db
+
+log = logging.getLogger(__name__)
+
+
+def record_dead_letter(name: str, payload: dict, error: str, attempts: int) -> None:
+    with db.cursor() as cur:
+        cur.execute(
+            "INSERT INTO failed_jobs (name, payload, error, attempts) VALUES (%s, %s, %s, %s)",
+            (name, json.dumps(payload, default=str), error, attempts),
+        )
+
+
+class JobQueue:
+    def __init__(self, workers: int = 2, max_attempts: int = 5, backoff_base: float = 2.0, dead_letter=record_dead_letter):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.dead_letter = dead_letter
+        self._handlers = {}
+        self._queue = queue.Queue()
+        self._threads = []
+        self._timers = set()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.counters = {"enqueued": 0, "succeeded": 0, "retried": 0, "dead": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.environ.get("JOB_WORKERS", 2)),
+            max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", 5)),
+        )
+
+    def register(self, name: str, handler) -> None:
+        self._handlers[name] = handler
+
+    def enqueue(self, name: str, **payload) -> None:
+        if name not in self._handlers:
+            raise KeyError(f"unknown job: {name}")
+        self._start()
+        with self._lock:
+            self.counters["enqueued"] += 1
+        self._queue.put((name, payload, 1))
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"jobs-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            name, payload, attempt = item
+            try:
+                self._handlers[name](**payload)
+                with self._lock:
+                    self.counters["succeeded"] += 1
+            except Exception as exc:
+                self._failed(name, payload, attempt, exc)
+            finally:
+                self._queue.task_done()
+
+    def _failed(self, name: str, payload: dict, attempt: int, exc: Exception) -> None:
+        log.warning("Job %s failed (attempt %d/%d): %s", name, attempt, self.max_attempts, exc)
+        if attempt < self.max_attempts and not self._stopping:
+            with self._lock:
+                self.counters["retried"] += 1
+            delay = self.backoff_base ** attempt
+            timer = threading.Timer(delay, self._requeue, args=(name, payload, attempt + 1))
+            timer.daemon = True
+            with self._lock:
+                self._timers.add(timer)
+            timer.start()
+            return
+        with self._lock:
+            self.counters["dead"] += 1
+        try:
+            self.dead_letter(name, payload, repr(exc), attempt)
+        except Exception as dl_exc:
+            log.error("Could not record failed job %s: %s", name, dl_exc)
+
+    def _requeue(self, name: str, payload: dict, attempt: int) -> None:
+        with self._lock:
+            self._timers = {t for t in self._timers if t.is_alive() and t is not threading.current_thread()}
+        self._queue.put((name, payload, attempt))
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Run every queued job (pending retries get one last attempt), then stop the workers."""
+        self._stopping = True
+        with self._lock:
+            timers, self._timers = self._timers, set()
+        for timer in timers:
+            # Fire delayed retries now instead of dropping them.
+            if timer.is_alive():
+                timer.cancel()
+                self._queue.put((timer.args[0], timer.args[1], self.max_attempts))
+        with self._lock:
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counters, "queued": self._queue.qsize()}
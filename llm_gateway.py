@@ -0,0 +1,285 @@
+"""
+Gateway for chat-completion calls to Together AI.
+
+All model calls go through one ``LLMGateway`` so that a slow or failing
+upstream cannot take the whole site down with it. The gateway owns:
+
+* a bounded number of in-flight calls (callers wait briefly for a slot,
+  then give up instead of piling up on every worker thread);
+* a deadline per call, shared by all of its retries;
+* retries with jittered exponential backoff for transient errors;
+* a circuit breaker that fails fast while the upstream is unhealthy.
+
+Every failure surfaces as a ``GatewayError`` so callers can fall back to
+their canned reply.
+"""
+
+import os
+import random
+import threading
+import time
+
+import openai
+
+import metrics
+
+
+class GatewayError(Exception):
+    """The model call did not produce a response."""
+
+
+class GatewayBusy(GatewayError):
+    """Too many calls already in flight."""
+
+
+class GatewayTimeout(GatewayError):
+    """The call's deadline passed before a response arrived."""
+
+
+class CircuitOpen(GatewayError):
+    """The circuit breaker is open; the upstream is not being called."""
+
+
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class CircuitBreaker:
+    """Classic closed / open / half-open breaker.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls for ``reset_timeout`` seconds. It then lets a single trial
+    call through; success closes it again, failure re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def cancel_trial(self) -> None:
+        """Give back a half-open trial taken by ``allow()`` for a call that never ran."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class LLMGateway:
+    """Wraps an ``openai.OpenAI`` client's chat-completion endpoint."""
+
+    def __init__(
+        self,
+        client,
+        max_in_flight: int = 8,
+        queue_timeout: float = 2.0,
+        timeout: float = 30.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 4.0,
+        breaker: CircuitBreaker = None,
+    ):
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._in_flight = 0
+        self._in_flight_lock = threading.Condition()
+        self._draining = False
+
+    @classmethod
+    def from_env(cls, client):
+        return cls(
+            client,
+            max_in_flight=int(os.environ.get("LLM_MAX_IN_FLIGHT", 8)),
+            queue_timeout=float(os.environ.get("LLM_QUEUE_TIMEOUT", 2)),
+            timeout=float(os.environ.get("LLM_TIMEOUT", 30)),
+            max_retries=int(os.environ.get("LLM_MAX_RETRIES", 2)),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.environ.get("LLM_BREAKER_THRESHOLD", 5)),
+                reset_timeout=float(os.environ.get("LLM_BREAKER_RESET", 30)),
+            ),
+        )
+
+    # ------------------------------------------------------------------ internals
+
+    def _acquire(self) -> None:
+        if self._draining:
+            raise GatewayBusy("shutting down")
+        if not self.breaker.allow():
+            raise CircuitOpen("model endpoint unavailable (circuit open)")
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.breaker.cancel_trial()
+            raise GatewayBusy("too many model calls in flight")
+        with self._in_flight_lock:
+            self._in_flight += 1
+
+    def _release(self) -> None:
+        with self._in_flight_lock:
+            self._in_flight -= 1
+            self._in_flight_lock.notify_all()
+        self._slots.release()
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _call(self, params: dict):
+        """Run one create() call with retries, all bounded by a single deadline."""
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.breaker.record_failure()
+                raise GatewayTimeout("model call exceeded %.1fs" % self.timeout)
+            try:
+                return self.client.chat.completions.create(timeout=remaining, **params)
+            except RETRYABLE_ERRORS as exc:
+                delay = self._backoff(attempt)
+                attempt += 1
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                    self.breaker.record_failure()
+                    raise GatewayError(str(exc)) from exc
+                time.sleep(delay)
+            except openai.OpenAIError as exc:
+                # Client-side errors (bad request, auth) are not retried and say
+                # nothing about upstream health.
+                self.breaker.record_success()
+                raise GatewayError(str(exc)) from exc
+            except Exception as exc:
+                # Anything else (a raw transport error) must still settle a half-open trial.
+                self.breaker.record_failure()
+                raise GatewayError(f"{type(exc).__name__}: {exc}") from exc
+
+    # ------------------------------------------------------------------ public API
+
+    @staticmethod
+    def _observe(kind: str, started: float, error: Exception = None) -> None:
+        elapsed = time.perf_counter() - started
+        metrics.LLM_REQUEST_SECONDS.observe(elapsed, kind=kind, outcome="error" if error else "ok")
+        metrics.add_time("llm", elapsed)
+        if error is not None:
+            metrics.LLM_ERRORS.inc(reason=type(error).__name__)
+
+    def complete(self, **params) -> str:
+        """Return the stripped text of a non-streaming completion."""
+        started = time.perf_counter()
+        try:
+            self._acquire()
+            try:
+                response = self._call(params)
+            finally:
+                self._release()
+            self.breaker.record_success()
+            content = response.choices[0].message.content if response.choices else None
+            if content is None:
+                raise GatewayError("model returned no content")
+        except GatewayError as exc:
+            self._observe("complete", started, exc)
+            raise
+        self._observe("complete", started)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            metrics.LLM_TOKENS.inc(usage.prompt_tokens or 0, type="prompt")
+            metrics.LLM_TOKENS.inc(usage.completion_tokens or 0, type="completion")
+        return content.strip()
+
+    def stream(self, **params):
+        """Yield text deltas of a streaming completion.
+
+        Retries only cover opening the stream; once tokens have been sent to
+        the caller a failure is raised as-is.
+        """
+        started = time.perf_counter()
+        chunks = 0
+        try:
+            self._acquire()
+        except GatewayError as exc:
+            self._observe("stream", started, exc)
+            raise
+        try:
+            stream = self._call(dict(params, stream=True))
+            try:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        chunks += 1
+                        yield chunk.choices[0].delta.content
+            except Exception as exc:
+                self.breaker.record_failure()
+                raise GatewayError(str(exc) or type(exc).__name__) from exc
+            except GeneratorExit:
+                # Closed by the caller (client went away, or a hedge won): the
+                # upstream was answering, and a half-open trial must not stay pending.
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+        except GatewayError as exc:
+            self._observe("stream", started, exc)
+            raise
+        else:
+            self._observe("stream", started)
+        finally:
+            metrics.LLM_TOKENS.inc(chunks, type="completion")
+            self._release()
+
+    def drain(self, timeout: float = 30.0) -> bool:
+        """Refuse new calls and wait up to ``timeout`` seconds for in-flight ones.
+
+        Returns True if every call finished in time.
+        """
+        self._draining = True
+        with self._in_flight_lock:
+            return self._in_flight_lock.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def stats(self) -> dict:
+        with self._in_flight_lock:
+            in_flight = self._in_flight
+        return {
+            "in_flight": in_flight,
+            "max_in_flight": self.max_in_flight,
+            "circuit": self.breaker.state,
+            "draining": self._draining,
+        }
@@ -0,0 +1,373 @@
+"""
+Long-term memory across a user's chat sessions.
+
+Each user's own messages are embedded into a per-user vector index. When a
+prompt is built, the things they said in *other* sessions that are most
+similar to the new message are put in front of the model.
+
+* Embedding runs on the background job queue. New turns are indexed once
+  they are committed (see ``TurnWriter(on_written=...)``). A user's older
+  history is backfilled the first time their memory is used.
+* The index for a user lives in ``MEMORY_DIR/<embedder>/<user>/`` as two
+  append-only files. ``vectors.f32`` holds raw float32 rows, L2-normalized.
+  ``rows.jsonl`` holds the message id, session id and text of each row.
+  Each process keeps an in-memory copy. Before every search it reads the
+  rows other workers have appended since.
+* A search is one matrix-vector product over the user's rows plus an
+  ``argpartition`` for the top k. It is bound by memory bandwidth: at 100k
+  rows of 128 dimensions (50 MB), it takes a few milliseconds.
+
+The default embedder is a feature-hashing bag of words: no model download,
+but lexical overlap only. ``MEMORY_EMBEDDER=sentence-transformers:<model>``
+uses a local sentence-transformers model instead (an optional dependency).
+Memory is off unless ``MEMORY_ENABLED`` is set.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import db
+import metrics
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # optional dependency
+    SentenceTransformer = None
+
+log = logging.getLogger(__name__)
+
+WORD = re.compile(r"[a-z0-9']+")
+SNIPPET_CHARS = 300
+STOPWORDS = frozenset(
+    "a an and are as at be but by do for from have i i'm im in is it it's me my of on or so that the "
+    "this to was we with you your".split()
+)
+
+
+class HashingEmbedder:
+    """Signed feature hashing of word unigrams and bigrams; a stand-in for a real model."""
+
+    def __init__(self, dim: int = 128):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _bucket(self, feature: str):
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        return h % self.dim, 1.0 if h >> 63 else -1.0
+
+    def embed(self, texts) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = [w for w in WORD.findall(text.lower()) if w not in STOPWORDS]
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                column, sign = self._bucket(feature)
+                out[row, column] += sign
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1, norms)
+
+
+class SentenceTransformerEmbedder:
+    def __init__(self, model_name: str):
+        if SentenceTransformer is None:
+            raise RuntimeError("the sentence-transformers package is required for this MEMORY_EMBEDDER")
+        self._model = SentenceTransformer(model_name)
+        self.dim = self._model.get_sentence_embedding_dimension()
+        self.name = "st-" + re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+
+    def embed(self, texts) -> np.ndarray:
+        return np.asarray(self._model.encode(list(texts), normalize_embeddings=True), dtype=np.float32)
+
+
+def embedder_from_env():
+    spec = os.environ.get("MEMORY_EMBEDDER", "hashing")
+    if spec.startswith("sentence-transformers:"):
+        return SentenceTransformerEmbedder(spec.split(":", 1)[1])
+    return HashingEmbedder(int(os.environ.get("MEMORY_DIM", 128)))
+
+
+class UserIndex:
+    """In-memory copy of one user's index files, grown in place as rows are appended."""
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)  # spare capacity past _size
+        self._sessions = np.empty(0, dtype=np.int32)
+        self._size = 0
+        self._ids = set()
+        self._texts = []
+        self._session_codes = {}
+        self._inode = None
+        self._vector_offset = 0
+        self._row_offset = 0
+
+    def __len__(self):
+        return self._size
+
+    def _append(self, vectors: np.ndarray, rows: list) -> None:
+        needed = self._size + len(rows)
+        if needed > len(self._vectors):
+            capacity = max(needed, 2 * len(self._vectors), 1024)
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            grown[: self._size] = self._vectors[: self._size]
+            sessions = np.empty(capacity, dtype=np.int32)
+            sessions[: self._size] = self._sessions[: self._size]
+            self._vectors, self._sessions = grown, sessions
+        self._vectors[self._size : needed] = vectors
+        for offset, row in enumerate(rows):
+            code = self._session_codes.setdefault(row["session_id"], len(self._session_codes))
+            self._sessions[self._size + offset] = code
+            self._ids.add(row["id"])
+            self._texts.append(row["text"])
+        self._size = needed
+
+    def sync(self) -> None:
+        """Load rows appended to the files since the last call, by this or any other process."""
+        vector_path = os.path.join(self.path, "vectors.f32")
+        with self._lock:
+            try:
+                st = os.stat(vector_path)
+            except FileNotFoundError:
+                if self._size:
+                    self._reset()
+                return
+            if st.st_ino != self._inode or st.st_size < self._vector_offset:
+                # The files were rewritten (see drop_session).
+                self._reset()
+                self._inode = st.st_ino
+            if st.st_size == self._vector_offset:
+                return
+            with open(os.path.join(self.path, "rows.jsonl"), "rb") as f:
+                f.seek(self._row_offset)
+                data = f.read()
+            lines = data[: data.rfind(b"\n") + 1].splitlines(keepends=True)
+            # A writer may be between its two appends; only take rows present in both files.
+            count = min(len(lines), (st.st_size - self._vector_offset) // (4 * self.dim))
+            if not count:
+                return
+            vectors = np.fromfile(
+                vector_path, dtype=np.float32, count=count * self.dim, offset=self._vector_offset
+            ).reshape(count, self.dim)
+            self._append(vectors, [json.loads(line) for line in lines[:count]])
+            self._vector_offset += count * 4 * self.dim
+            self._row_offset += sum(len(line) for line in lines[:count])
+
+    def search(self, query: np.ndarray, k: int, exclude_session: str = None):
+        """Return up to ``k`` (score, text) pairs, best first."""
+        with self._lock:
+            if not self._size:
+                return []
+            scores = self._vectors[: self._size] @ query
+            code = self._session_codes.get(exclude_session)
+            if code is not None:
+                scores[self._sessions[: self._size] == code] = -np.inf
+            k = min(k, self._size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(float(scores[i]), self._texts[i]) for i in top if np.isfinite(scores[i])]
+
+    def known(self, message_ids) -> set:
+        with self._lock:
+            return {i for i in message_ids if i in self._ids}
+
+    def drop_session(self, session_id: str) -> bool:
+        """Rewrite the files without ``session_id``'s rows; returns False if it had none.
+
+        The caller holds the user's file lock and has just synced, so the
+        files hold exactly the rows loaded here.
+        """
+        with self._lock:
+            code = self._session_codes.get(str(session_id), -1)
+            keep = np.flatnonzero(self._sessions[: self._size] != code)
+            if len(keep) == self._size:
+                return False
+            with open(os.path.join(self.path, "rows.jsonl"), "rb") as f:
+                lines = f.readlines()
+            with open(os.path.join(self.path, "rows.jsonl.tmp"), "wb") as f:
+                f.writelines(lines[i] for i in keep)
+            self._vectors[keep].tofile(os.path.join(self.path, "vectors.f32.tmp"))
+        os.replace(os.path.join(self.path, "rows.jsonl.tmp"), os.path.join(self.path, "rows.jsonl"))
+        os.replace(os.path.join(self.path, "vectors.f32.tmp"), os.path.join(self.path, "vectors.f32"))
+        return True
+
+
+class MemoryStore:
+    def __init__(
+        self,
+        embedder,
+        directory: str,
+        queue=None,
+        top_k: int = 3,
+        min_score: float = 0.3,
+        max_users: int = 256,
+        enabled: bool = True,
+    ):
+        self.embedder = embedder
+        self.directory = os.path.join(directory, embedder.name)
+        self.queue = queue
+        self.top_k = top_k
+        self.min_score = min_score
+        self.max_users = max_users
+        self.enabled = enabled
+        self._indexes = OrderedDict()
+        self._backfills = set()
+        self._lock = threading.Lock()
+        if queue is not None:
+            queue.register("memory_index", self.index_rows)
+            queue.register("memory_backfill", self.backfill)
+            queue.register("memory_forget", self.forget_session)
+
+    @classmethod
+    def from_env(cls, queue=None):
+        enabled = os.environ.get("MEMORY_ENABLED", "").lower() in ("1", "true", "yes")
+        default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory_index")
+        return cls(
+            embedder_from_env() if enabled else HashingEmbedder(),
+            os.environ.get("MEMORY_DIR", default_dir),
+            queue=queue,
+            top_k=int(os.environ.get("MEMORY_TOP_K", 3)),
+            min_score=float(os.environ.get("MEMORY_MIN_SCORE", 0.3)),
+            max_users=int(os.environ.get("MEMORY_CACHE_USERS", 256)),
+            enabled=enabled,
+        )
+
+    def _user_dir(self, email: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(email.lower().encode("utf-8")).hexdigest()[:24])
+
+    def _index(self, email: str) -> UserIndex:
+        with self._lock:
+            index = self._indexes.get(email)
+            if index is None:
+                index = self._indexes[email] = UserIndex(self._user_dir(email), self.embedder.dim)
+                while len(self._indexes) > self.max_users:
+                    self._indexes.popitem(last=False)
+            self._indexes.move_to_end(email)
+        index.sync()
+        return index
+
+    # ------------------------------------------------------------------ writes (job handlers)
+
+    def _locked(self, email: str):
+        path = self._user_dir(email)
+        os.makedirs(path, exist_ok=True)
+        lock = open(os.path.join(path, "lock"), "w")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def index_rows(self, email: str, rows: list) -> int:
+        """Embed and append ``rows`` — [message_id, session_id, text] — skipping ones already indexed."""
+        lock = self._locked(email)
+        try:
+            index = self._index(email)
+            known = index.known(row[0] for row in rows)
+            rows = [row for row in rows if row[0] not in known and row[2].strip()]
+            if not rows:
+                return 0
+            vectors = self.embedder.embed([text for _, _, text in rows])
+            path = self._user_dir(email)
+            with open(os.path.join(path, "rows.jsonl"), "ab") as f:
+                for message_id, session_id, text in rows:
+                    f.write(json.dumps({"id": message_id, "session_id": str(session_id), "text": text}).encode("utf-8") + b"\n")
+            with open(os.path.join(path, "vectors.f32"), "ab") as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        finally:
+            lock.close()
+        index.sync()
+        return len(rows)
+
+    def backfill(self, email: str, batch_size: int = 500) -> int:
+        """Index every earlier message of the user, oldest first."""
+        path = self._user_dir(email)
+        marker = os.path.join(path, "backfilled")
+        if os.path.exists(marker):
+            return 0
+        # Users without earlier messages have no index files yet.
+        os.makedirs(path, exist_ok=True)
+        indexed, last_id = 0, 0
+        while True:
+            with db.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT id, session_id, message
+                    FROM conversations
+                    WHERE user_email = %s AND sender = 'user' AND id > %s
+                    ORDER BY id
+                    LIMIT %s
+                    """,
+                    (email, last_id, batch_size),
+                )
+                rows = cur.fetchall()
+            if not rows:
+                break
+            indexed += self.index_rows(email, [[i, str(sid), text] for i, sid, text in rows])
+            last_id = rows[-1][0]
+        open(marker, "w").close()
+        return indexed
+
+    def forget_session(self, email: str, session_id: str) -> None:
+        """Drop a deleted chat's rows by rewriting the user's files."""
+        lock = self._locked(email)
+        try:
+            index = self._index(email)
+            if not index.drop_session(session_id):
+                return
+        finally:
+            lock.close()
+        index.sync()
+
+    # ------------------------------------------------------------------ request path
+
+    def remember(self, rows) -> None:
+        """``TurnWriter`` callback: queue newly written user messages for indexing."""
+        if not self.enabled or self.queue is None:
+            return
+        by_user = {}
+        for email, session_id, message_id, sender, text in rows:
+            if sender == "user":
+                by_user.setdefault(email, []).append([message_id, str(session_id), text])
+        for email, user_rows in by_user.items():
+            self.queue.enqueue("memory_index", email=email, rows=user_rows)
+
+    def forget(self, email: str, session_id: str) -> None:
+        if email and self.enabled and self.queue is not None:
+            self.queue.enqueue("memory_forget", email=email, session_id=str(session_id))
+
+    def recall(self, email: str, text: str, exclude_session: str = None) -> list:
+        """Up to ``top_k`` earlier messages of the user similar to ``text``, from other sessions."""
+        if not self.enabled:
+            return []
+        started = time.perf_counter()
+        if email not in self._backfills and not os.path.exists(os.path.join(self._user_dir(email), "backfilled")):
+            with self._lock:
+                schedule = email not in self._backfills
+                self._backfills.add(email)
+            if schedule and self.queue is not None:
+                self.queue.enqueue("memory_backfill", email=email)
+        index = self._index(email)
+        query = self.embedder.embed([text])[0]
+        hits = index.search(query, self.top_k, exclude_session=str(exclude_session) if exclude_session else None)
+        metrics.MEMORY_RECALL_SECONDS.observe(time.perf_counter() - started)
+        return [snippet[:SNIPPET_CHARS] for score, snippet in hits if score >= self.min_score]
+
+    def stats(self) -> dict:
+        with self._lock:
+            indexes = list(self._indexes.values())
+        return {
+            "enabled": self.enabled,
+            "embedder": self.embedder.name,
+            "users_cached": len(indexes),
+            "rows_cached": sum(len(index) for index in indexes),
+        }
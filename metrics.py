@@ -0,0 +1,204 @@
+"""
+Prometheus-style metrics and per-request phase timings.
+
+Counters and histograms are kept in process memory and rendered in the
+Prometheus text exposition format by ``render()`` (served at ``/metrics``).
+Each worker process exports its own series; the scraper sums them.
+
+While a request is being handled, time spent in the database, in model calls
+and in template rendering is also added up per phase (``begin_request`` /
+``end_request``), so a slow page can be attributed to Postgres, Together or
+Jinja. Work done on background threads only reaches the global metrics.
+"""
+
+import bisect
+import contextvars
+import math
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+            for key, value in series:
+                lines.extend(self._render_series(list(zip(self.labelnames, key)), value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _render_series(self, pairs, value):
+        return [f"{self.name}{_format_labels(pairs)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count.
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _render_series(self, pairs, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            le = pairs + [("le", _format_value(bound))]
+            lines.append(f"{self.name}_bucket{_format_labels(le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(pairs)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(pairs)} {count}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------- Metrics -----------------------------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "cogi_http_request_duration_seconds",
+    "Time until the response headers are ready, per route.",
+    ("endpoint", "method", "status"),
+)
+REQUEST_DB_QUERIES = Histogram(
+    "cogi_http_request_db_queries",
+    "SQL statements issued while handling a request.",
+    ("endpoint",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "cogi_http_request_db_duration_seconds",
+    "Time spent in SQL statements while handling a request.",
+    ("endpoint",),
+)
+DB_QUERY_SECONDS = Histogram(
+    "cogi_db_query_duration_seconds",
+    "Duration of individual SQL statements, including background work.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "cogi_llm_request_duration_seconds",
+    "Model calls through the gateway, including queueing and retries.",
+    ("kind", "outcome"),
+)
+LLM_TOKENS = Counter(
+    "cogi_llm_tokens_total",
+    "Tokens reported by the model endpoint (streamed replies count chunks).",
+    ("type",),
+)
+LLM_ERRORS = Counter("cogi_llm_errors_total", "Failed model calls by error type.", ("reason",))
+LLM_ROUTED = Counter(
+    "cogi_llm_routed_total",
+    "Replies by the model endpoint that produced them (hedge: won by a hedge request).",
+    ("endpoint", "kind", "hedge"),
+)
+MAIL_SECONDS = Histogram("cogi_mail_send_duration_seconds", "SMTP send time.", ("outcome",))
+CAPTCHA_SECONDS = Histogram(
+    "cogi_captcha_verify_duration_seconds", "reCAPTCHA verification round trips.", ("outcome",)
+)
+MEMORY_RECALL_SECONDS = Histogram(
+    "cogi_memory_recall_duration_seconds",
+    "Embedding the new message and searching the user's memory index.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+
+
+# ----------------------------- Request phases -----------------------------
+
+_timings = contextvars.ContextVar("cogi_request_timings", default=None)
+
+
+def begin_request() -> None:
+    _timings.set({"db": 0.0, "db_queries": 0, "llm": 0.0, "render": 0.0})
+
+
+def end_request() -> dict:
+    """Return the current request's phase totals and stop collecting them."""
+    timings = _timings.get()
+    _timings.set(None)
+    return timings
+
+
+def add_time(phase: str, seconds: float) -> None:
+    timings = _timings.get()
+    if timings is not None:
+        timings[phase] += seconds
+
+
+def record_query(seconds: float) -> None:
+    DB_QUERY_SECONDS.observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings["db"] += seconds
+        timings["db_queries"] += 1
+
+
+def server_timing(timings: dict, total: float) -> str:
+    """Format phase totals as a ``Server-Timing`` header value (milliseconds)."""
+    return ", ".join(
+        [
+            f'db;dur={timings["db"] * 1000:.1f};desc="{timings["db_queries"]} queries"',
+            f'llm;dur={timings["llm"] * 1000:.1f}',
+            f'render;dur={timings["render"] * 1000:.1f}',
+            f"total;dur={total * 1000:.1f}",
+        ]
+    )
@@ -0,0 +1,291 @@
+"""
+Versioned schema migrations for Cogi.
+
+Migrations are the numbered ``.sql`` files in ``migrations/``. Each one is
+applied once, in order, and recorded in ``schema_migrations`` together with a
+checksum of its contents. A file whose first line is
+``-- migrate: no-transaction`` runs in autocommit mode, one statement at a
+time, which is required for ``CREATE INDEX CONCURRENTLY``. If such a build
+fails, drop the INVALID index it leaves behind before running again.
+
+Usage:
+    python migrate.py            # apply pending migrations
+    python migrate.py status     # list applied / pending migrations
+    python migrate.py check      # EXPLAIN the hot queries and fail on sequential scans or partial indexes
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+
+SAMPLE_EMAIL = "explain@example.com"
+SAMPLE_SESSION = "00000000-0000-0000-0000-000000000000"
+
+# Queries run on every chat page load, chat turn or feedback view. Each must
+# reach the tables in INDEXED_TABLES through an index.
+HOT_QUERIES = [
+    (
+        "chat sidebar",
+        "SELECT id, created_at, title, archived FROM chat_sessions WHERE user_email = %s ORDER BY created_at DESC",
+        (SAMPLE_EMAIL,),
+    ),
+    (
+        "chat history page",
+        """
+        SELECT id, message, sender, timestamp FROM conversations
+        WHERE user_email = %s AND session_id = %s AND timestamp >= (SELECT COALESCE(MIN(created_at), '-infinity') FROM chat_sessions WHERE id = %s)
+        ORDER BY timestamp DESC, id DESC LIMIT 51
+        """,
+        (SAMPLE_EMAIL, SAMPLE_SESSION, SAMPLE_SESSION),
+    ),
+    (
+        "chat history older page",
+        """
+        SELECT id, message, sender, timestamp FROM conversations
+        WHERE user_email = %s AND session_id = %s AND (timestamp, id) < (now(), 1000)
+          AND timestamp >= (SELECT COALESCE(MIN(created_at), '-infinity') FROM chat_sessions WHERE id = %s)
+        ORDER BY timestamp DESC, id DESC LIMIT 51
+        """,
+        (SAMPLE_EMAIL, SAMPLE_SESSION, SAMPLE_SESSION),
+    ),
+    (
+        "cached history version",
+        """
+        SELECT s.last_message_at, COALESCE(cs.summarized_through_id, 0)
+        FROM chat_sessions s LEFT JOIN conversation_summaries cs ON cs.session_id = s.id
+        WHERE s.id = %s
+        """,
+        (SAMPLE_SESSION,),
+    ),
+    (
+        "summarizer new turns",
+        """
+        SELECT id, sender, message FROM conversations
+        WHERE session_id = %s AND id > 0 AND timestamp >= (SELECT COALESCE(MIN(created_at), '-infinity') FROM chat_sessions WHERE id = %s)
+        ORDER BY id
+        """,
+        (SAMPLE_SESSION, SAMPLE_SESSION),
+    ),
+    (
+        "delete chat",
+        """
+        DELETE FROM conversations WHERE user_email = %s AND session_id = %s
+          AND timestamp >= (SELECT COALESCE(MIN(created_at), '-infinity') FROM chat_sessions WHERE id = %s AND user_email = %s)
+        """,
+        (SAMPLE_EMAIL, SAMPLE_SESSION, SAMPLE_SESSION, SAMPLE_EMAIL),
+    ),
+    (
+        "conversation export",
+        """
+        SELECT c.user_email, c.session_id, s.title, c.id, c.sender, c.message, c."timestamp"
+        FROM conversations c JOIN chat_sessions s ON s.id = c.session_id
+        WHERE c.user_email = %s
+        ORDER BY c.session_id DESC, c."timestamp", c.id
+        """,
+        (SAMPLE_EMAIL,),
+    ),
+    (
+        "message search",
+        """
+        SELECT id FROM conversations
+        WHERE user_email = %s AND search_vector @@ websearch_to_tsquery('english', 'anxious')
+        """,
+        (SAMPLE_EMAIL,),
+    ),
+    (
+        "feedback list",
+        "SELECT id, name, message, submitted_at FROM feedback ORDER BY submitted_at DESC, id DESC LIMIT 51",
+        (),
+    ),
+    (
+        "feedback older page",
+        """
+        SELECT id, name, message, submitted_at FROM feedback
+        WHERE (submitted_at, id) < (now(), 1000)
+        ORDER BY submitted_at DESC, id DESC LIMIT 51
+        """,
+        (),
+    ),
+]
+INDEXED_TABLES = {"conversations", "feedback", "chat_sessions"}
+# Hot queries that must reach all of these columns through one index scan;
+# an index on only some of them still avoids a sequential scan, but reads
+# other users' rows and filters them out afterwards.
+INDEX_COLUMNS = {"message search": ("user_email", "search_vector")}
+PARTITION_OF = re.compile(r"_(y\d{4}m\d{2}|restored)$")
+
+
+def connect():
+    return psycopg2.connect(**db.dsn_from_env())
+
+
+def discover():
+    """Return [(version, name, path)] for every migration file, sorted by version."""
+    found = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not filename.endswith(".sql"):
+            continue
+        version, _, name = filename[:-4].partition("_")
+        found.append((version, name, os.path.join(MIGRATIONS_DIR, filename)))
+    return found
+
+
+def split_statements(sql: str):
+    """Split a migration into statements (migrations must not put ';' inside literals)."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [stmt.strip() for stmt in "\n".join(lines).split(";") if stmt.strip()]
+
+
+def ensure_table(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version text PRIMARY KEY,
+                name text NOT NULL,
+                checksum text NOT NULL,
+                applied_at timestamp with time zone DEFAULT now() NOT NULL
+            )
+            """
+        )
+    conn.commit()
+
+
+def applied_versions(conn) -> dict:
+    with conn.cursor() as cur:
+        cur.execute("SELECT version, checksum FROM schema_migrations")
+        versions = dict(cur.fetchall())
+    # End the read transaction: a no-transaction migration cannot switch to
+    # autocommit while one is open.
+    conn.rollback()
+    return versions
+
+
+def apply(conn, version: str, name: str, sql: str, checksum: str) -> None:
+    record = (
+        "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+        (version, name, checksum),
+    )
+    if sql.lstrip().startswith(NO_TRANSACTION_MARKER):
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for statement in split_statements(sql):
+                    cur.execute(statement)
+                cur.execute(*record)
+        finally:
+            conn.autocommit = False
+    else:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            cur.execute(*record)
+        conn.commit()
+
+
+def migrate(conn) -> int:
+    """Apply pending migrations; return how many were applied."""
+    ensure_table(conn)
+    done = applied_versions(conn)
+    count = 0
+    for version, name, path in discover():
+        with open(path, encoding="utf-8") as f:
+            sql = f.read()
+        checksum = hashlib.sha256(sql.encode("utf-8")).hexdigest()
+        if version in done:
+            if done[version] != checksum:
+                print(f"⚠️ {version}_{name} was modified after being applied")
+            continue
+        print(f"Applying {version}_{name} ...")
+        apply(conn, version, name, sql, checksum)
+        count += 1
+    return count
+
+
+def status(conn) -> None:
+    ensure_table(conn)
+    done = applied_versions(conn)
+    for version, name, _ in discover():
+        print(f"{'applied' if version in done else 'pending'}  {version}_{name}")
+
+
+def seq_scans(plan: dict):
+    """Yield the relation names of every sequential scan in an EXPLAIN (FORMAT JSON) plan."""
+    if plan.get("Node Type") == "Seq Scan":
+        # Scans of a partition count against the partitioned table.
+        yield PARTITION_OF.sub("", plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        yield from seq_scans(child)
+
+
+def index_conditions(plan: dict):
+    """Yield the ``Index Cond`` of every index scan in an EXPLAIN (FORMAT JSON) plan."""
+    if "Index Cond" in plan:
+        yield plan["Index Cond"]
+    for child in plan.get("Plans", []):
+        yield from index_conditions(child)
+
+
+def check(conn) -> bool:
+    """EXPLAIN each hot query and report any sequential scan of an indexed table,
+    or a query in INDEX_COLUMNS that no single index scan covers.
+
+    Small development databases make the planner prefer sequential scans
+    regardless of indexes, so the check disables them for its own
+    transaction: a query that still seq-scans has no usable index.
+    """
+    ok = True
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL enable_seqscan = off")
+        for label, query, params in HOT_QUERIES:
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            bad = sorted({rel for rel in seq_scans(plan[0]["Plan"]) if rel in INDEXED_TABLES})
+            columns = INDEX_COLUMNS.get(label, ())
+            covered = not columns or any(
+                all(column in cond for column in columns) for cond in index_conditions(plan[0]["Plan"])
+            )
+            if bad:
+                ok = False
+                print(f"❌ {label}: sequential scan on {', '.join(bad)}")
+            elif not covered:
+                ok = False
+                print(f"❌ {label}: no single index scan on {', '.join(columns)}")
+            else:
+                print(f"✅ {label}")
+    conn.rollback()
+    return ok
+
+
+def main(argv) -> int:
+    load_dotenv()
+    command = argv[1] if len(argv) > 1 else "up"
+    conn = connect()
+    try:
+        if command == "up":
+            print(f"✅ {migrate(conn)} migration(s) applied.")
+        elif command == "status":
+            status(conn)
+        elif command == "check":
+            return 0 if check(conn) else 1
+        else:
+            print(__doc__)
+            return 2
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
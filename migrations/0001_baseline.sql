@@ -0,0 +1,38 @@
+-- Base tables, equivalent to the original pg_dump in schema.sql.
+-- Written with IF NOT EXISTS so it is a no-op on databases created from that dump.
+
+CREATE TABLE IF NOT EXISTS public.users (
+    id SERIAL PRIMARY KEY,
+    email character varying(255) NOT NULL UNIQUE,
+    password text NOT NULL,
+    first_name character varying(100),
+    last_name character varying(100),
+    gender character varying(10),
+    dob date,
+    confirmed boolean DEFAULT false,
+    attempts integer DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS public.conversations (
+    id SERIAL PRIMARY KEY,
+    user_email character varying(255) REFERENCES public.users(email),
+    message text NOT NULL,
+    sender character varying(20),
+    "timestamp" timestamp with time zone DEFAULT now(),
+    session_id uuid DEFAULT gen_random_uuid(),
+    CONSTRAINT conversations_sender_check CHECK (((sender)::text = ANY ((ARRAY['user'::character varying, 'bot'::character varying])::text[])))
+);
+
+CREATE TABLE IF NOT EXISTS public.feedback (
+    id SERIAL PRIMARY KEY,
+    name character varying(100) NOT NULL,
+    message text NOT NULL,
+    submitted_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Newsletter subscribers
+CREATE TABLE IF NOT EXISTS public.subscriber (
+    id SERIAL PRIMARY KEY,
+    email VARCHAR(255) NOT NULL UNIQUE,
+    subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,26 @@
+-- Sidebar index of chat sessions: one row per session, kept current by the app
+CREATE TABLE IF NOT EXISTS public.chat_sessions (
+    id uuid PRIMARY KEY,
+    user_email character varying(255) NOT NULL REFERENCES public.users(email),
+    title character varying(255),
+    created_at timestamp with time zone DEFAULT now() NOT NULL,
+    last_message_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS chat_sessions_user_created_idx
+    ON public.chat_sessions (user_email, created_at DESC);
+
+-- Legacy per-row titles, only read by the backfill below
+ALTER TABLE public.conversations ADD COLUMN IF NOT EXISTS title character varying(255);
+
+-- Backfill sessions that predate chat_sessions
+INSERT INTO public.chat_sessions (id, user_email, title, created_at, last_message_at)
+SELECT session_id,
+       MIN(user_email),
+       (ARRAY_AGG(title ORDER BY "timestamp") FILTER (WHERE title IS NOT NULL))[1],
+       MIN("timestamp"),
+       MAX("timestamp")
+FROM public.conversations
+WHERE session_id IS NOT NULL AND user_email IS NOT NULL
+GROUP BY session_id
+ON CONFLICT (id) DO NOTHING;
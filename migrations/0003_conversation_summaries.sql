@@ -0,0 +1,7 @@
+-- Rolling summary of each session's older turns (see summarizer.py)
+CREATE TABLE IF NOT EXISTS public.conversation_summaries (
+    session_id uuid PRIMARY KEY REFERENCES public.chat_sessions(id) ON DELETE CASCADE,
+    summary text NOT NULL,
+    summarized_through_id integer NOT NULL,
+    updated_at timestamp with time zone DEFAULT now() NOT NULL
+);
@@ -0,0 +1,14 @@
+-- migrate: no-transaction
+-- Indexes for the chat and feedback hot paths, built without locking out writes.
+
+-- Chat page, history pagination and prompt history: keyset on ("timestamp", id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS conversations_user_session_ts_id_idx
+    ON public.conversations (user_email, session_id, "timestamp" DESC, id DESC);
+
+-- delete_chat and the summarizer (session_id = ? AND id > ? ORDER BY id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS conversations_session_id_idx
+    ON public.conversations (session_id, id);
+
+-- Feedback list ordered by submission time
+CREATE INDEX CONCURRENTLY IF NOT EXISTS feedback_submitted_at_idx
+    ON public.feedback (submitted_at DESC);
@@ -0,0 +1,9 @@
+-- Dead-letter table for background jobs that exhausted their retries (see jobs.py)
+CREATE TABLE IF NOT EXISTS public.failed_jobs (
+    id SERIAL PRIMARY KEY,
+    name text NOT NULL,
+    payload jsonb NOT NULL,
+    error text,
+    attempts integer NOT NULL,
+    failed_at timestamp with time zone DEFAULT now() NOT NULL
+);
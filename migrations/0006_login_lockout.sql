@@ -0,0 +1,2 @@
+-- Time-limited account lock set by the login rate limiter (replaces users.attempts)
+ALTER TABLE public.users ADD COLUMN IF NOT EXISTS locked_until timestamp with time zone;
@@ -0,0 +1,10 @@
+-- migrate: no-transaction
+-- Full-text search over a user's messages. The generated column is kept
+-- current by Postgres on every insert/update.
+
+ALTER TABLE public.conversations
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(message, ''))) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS conversations_search_vector_idx
+    ON public.conversations USING gin (search_vector);
@@ -0,0 +1,72 @@
+-- Range-partition conversations by month (partitions.py creates future
+-- partitions and archives old ones). This copies the whole table: on a
+-- large database, run it in a maintenance window.
+
+ALTER TABLE public.conversations RENAME TO conversations_unpartitioned;
+
+CREATE TABLE public.conversations (
+    id integer NOT NULL DEFAULT nextval('public.conversations_id_seq'::regclass),
+    user_email character varying(255) REFERENCES public.users(email),
+    message text NOT NULL,
+    sender character varying(20),
+    "timestamp" timestamp with time zone NOT NULL DEFAULT now(),
+    session_id uuid DEFAULT gen_random_uuid(),
+    title character varying(255),
+    search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(message, ''))) STORED,
+    CONSTRAINT conversations_sender_check CHECK (((sender)::text = ANY ((ARRAY['user'::character varying, 'bot'::character varying])::text[])))
+) PARTITION BY RANGE ("timestamp");
+
+-- One partition per UTC month, from the oldest message to three months ahead
+DO $$
+DECLARE
+    month timestamp := date_trunc('month', COALESCE(
+        (SELECT MIN("timestamp") FROM public.conversations_unpartitioned), now()) AT TIME ZONE 'UTC');
+    last_month timestamp := date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months';
+BEGIN
+    WHILE month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.conversations FOR VALUES FROM (%L) TO (%L)',
+            'conversations_' || to_char(month, '"y"YYYY"m"MM'),
+            month AT TIME ZONE 'UTC',
+            (month + interval '1 month') AT TIME ZONE 'UTC'
+        );
+        month := month + interval '1 month';
+    END LOOP;
+END $$;
+
+-- Rows brought back from archived months land here (see partitions.restore_session)
+CREATE TABLE IF NOT EXISTS public.conversations_restored PARTITION OF public.conversations DEFAULT;
+
+INSERT INTO public.conversations (id, user_email, message, sender, "timestamp", session_id, title)
+SELECT id, user_email, message, sender, COALESCE("timestamp", now()), session_id, title
+FROM public.conversations_unpartitioned;
+
+ALTER SEQUENCE public.conversations_id_seq OWNED BY public.conversations.id;
+DROP TABLE public.conversations_unpartitioned;
+
+ALTER TABLE public.conversations ADD CONSTRAINT conversations_pkey PRIMARY KEY (id, "timestamp");
+CREATE INDEX conversations_user_session_ts_id_idx
+    ON public.conversations (user_email, session_id, "timestamp" DESC, id DESC);
+CREATE INDEX conversations_session_id_idx
+    ON public.conversations (session_id, id);
+CREATE INDEX conversations_search_vector_idx
+    ON public.conversations USING gin (search_vector);
+
+-- Bookkeeping for archived months
+CREATE TABLE IF NOT EXISTS public.archived_partitions (
+    name text PRIMARY KEY,
+    range_start timestamp with time zone NOT NULL,
+    range_end timestamp with time zone NOT NULL,
+    path text NOT NULL,
+    row_count bigint NOT NULL,
+    archived_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS public.archived_session_partitions (
+    session_id uuid NOT NULL REFERENCES public.chat_sessions(id) ON DELETE CASCADE,
+    partition_name text NOT NULL REFERENCES public.archived_partitions(name),
+    PRIMARY KEY (session_id, partition_name)
+);
+
+ALTER TABLE public.chat_sessions ADD COLUMN IF NOT EXISTS archived boolean NOT NULL DEFAULT false;
@@ -0,0 +1,14 @@
+-- Message search filters on user_email and search_vector together. With a
+-- GIN index on search_vector alone, Postgres reads every user's matches and
+-- then discards the other users' rows; btree_gin lets one GIN index hold
+-- both columns.
+--
+-- Indexes on a partitioned table cannot be built CONCURRENTLY: writes to
+-- conversations wait while each partition is indexed.
+
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+CREATE INDEX IF NOT EXISTS conversations_user_search_idx
+    ON public.conversations USING gin (user_email, search_vector);
+
+DROP INDEX IF EXISTS public.conversations_search_vector_idx;
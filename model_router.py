@@ -0,0 +1,395 @@
+"""
+Model registry and latency-aware routing for chat completions.
+
+The registry lists the OpenAI-compatible endpoints a reply may come from.
+It is read from ``LLM_MODELS`` (a JSON list) or from the file named by
+``LLM_MODELS_FILE``:
+
+    [
+      {"name": "together-mistral", "model": "mistralai/Mistral-7B-Instruct-v0.1",
+       "base_url": "https://api.together.xyz/v1", "api_key_env": "TOGETHER_API_KEY",
+       "max_tokens": 200, "temperature": 0.7},
+      {"name": "local-vllm", "model": "mistral-7b", "base_url": "http://vllm:8000/v1",
+       "api_key_env": "VLLM_API_KEY"}
+    ]
+
+Without either, the registry holds Together AI alone (``TOGETHER_BASE_URL``,
+``TOGETHER_API_KEY``), which is the previous behaviour.
+
+Each endpoint gets its own ``LLMGateway``, with its own in-flight limit,
+retries and circuit breaker, plus rolling latency and error statistics.
+Calls are routed as follows:
+
+* Endpoints are ranked by the moving average of their latency: time to
+  first token for streams, total time for blocking calls. The ranking is
+  penalized by recent errors. An endpoint whose circuit is open goes last.
+  An endpoint without recent samples is probed with one call, so it can
+  win traffic back after recovering.
+* If the chosen endpoint has not answered within the SLO (``LLM_SLO_FIRST_TOKEN``
+  for streams, ``LLM_SLO_COMPLETE`` for blocking calls; 0 disables), a hedge
+  request goes to the next endpoint, and whichever answers first is used.
+  The other request is abandoned; a stream is closed at its next token.
+* If an endpoint fails, the next one is tried until every endpoint has been.
+* The whole routed call, hedges and fallbacks included, is bounded by
+  ``LLM_ROUTE_TIMEOUT``; a stream must also keep producing tokens within it.
+
+Point two entries at local fakes (``python -m bench.fake_llm --latency ...
+--error-rate ...``) to exercise routing, hedging and fallback offline.
+"""
+
+import contextvars
+import json
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from openai import OpenAI
+
+import metrics
+from llm_gateway import CircuitBreaker, GatewayError, GatewayTimeout, LLMGateway
+
+DEFAULT_MODEL = "mistralai/Mistral-7B-Instruct-v0.1"
+DEFAULT_PARAMS = {"max_tokens": 200, "temperature": 0.7}
+KINDS = ("complete", "stream")
+
+
+class LatencyStats:
+    """Moving averages of latency and error rate, plus recent samples for percentiles."""
+
+    def __init__(self, alpha: float = 0.2, window: int = 100):
+        self.alpha = alpha
+        self.ewma = None
+        self.errors = 0.0  # moving average of failures (0..1)
+        self.last_sample = None  # monotonic time of the last result or probe
+        self.count = 0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def _update_errors(self, failed: bool) -> None:
+        self.errors += self.alpha * ((1.0 if failed else 0.0) - self.errors)
+        self.last_sample = time.monotonic()
+        self.count += 1
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.ewma = seconds if self.ewma is None else self.ewma + self.alpha * (seconds - self.ewma)
+            self._recent.append(seconds)
+            self._update_errors(False)
+
+    def fail(self) -> None:
+        with self._lock:
+            self._update_errors(True)
+
+    def score(self, stale_after: float):
+        """Expected latency, penalized by errors; None when there is no recent sample."""
+        with self._lock:
+            if self.last_sample is None or time.monotonic() - self.last_sample > stale_after:
+                return None
+            if self.ewma is None:
+                return math.inf  # first probe still running, or only failures so far
+            return self.ewma * (1 + 10 * self.errors)
+
+    def probing(self) -> None:
+        with self._lock:
+            self.last_sample = time.monotonic()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            ewma = self.ewma
+
+        def percentile(p):
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))] * 1000, 1) if recent else None
+
+        return {
+            "samples": self.count,
+            "ewma_ms": round(ewma * 1000, 1) if ewma is not None else None,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "error_rate": round(self.errors, 3),
+        }
+
+
+class Endpoint:
+    def __init__(self, name: str, gateway: LLMGateway, model: str, params: dict = None):
+        self.name = name
+        self.gateway = gateway
+        self.model = model
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        self.latency = {kind: LatencyStats() for kind in KINDS}
+
+    def request(self, messages, overrides: dict) -> dict:
+        return {**self.params, **overrides, "model": self.model, "messages": messages}
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "model": self.model,
+            **self.gateway.stats(),
+            **{kind: self.latency[kind].snapshot() for kind in KINDS},
+        }
+
+
+class _Attempt:
+    def __init__(self, endpoint: Endpoint):
+        self.endpoint = endpoint
+        self.cancelled = threading.Event()
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        endpoints,
+        slo_first_token: float = 2.0,
+        slo_complete: float = 8.0,
+        stale_after: float = 60.0,
+        timeout: float = 60.0,
+    ):
+        if not endpoints:
+            raise ValueError("at least one model endpoint is required")
+        self.endpoints = list(endpoints)
+        self.slo = {"stream": slo_first_token, "complete": slo_complete}
+        self.stale_after = stale_after
+        self.timeout = timeout
+        self.counters = {"hedged": 0, "hedge_won": 0, "fallbacks": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def default(self) -> Endpoint:
+        """The first configured endpoint; only its replies are cached, under its model and parameters."""
+        return self.endpoints[0]
+
+    @classmethod
+    def from_env(cls, client_factory=OpenAI):
+        entries = load_registry()
+        endpoints = []
+        for entry in entries:
+            key_env = entry.get("api_key_env", "TOGETHER_API_KEY")
+            api_key = os.environ.get(key_env, "").strip()
+            if not api_key:
+                raise ValueError(f"{key_env} is missing (model endpoint {entry['name']!r})")
+            # Retries and timeouts are owned by the gateway (see llm_gateway.py).
+            client = client_factory(api_key=api_key, base_url=entry["base_url"], max_retries=0)
+            gateway = LLMGateway.from_env(client)
+            params = {k: entry[k] for k in ("max_tokens", "temperature") if k in entry}
+            endpoints.append(Endpoint(entry["name"], gateway, entry.get("model", DEFAULT_MODEL), params))
+        return cls(
+            endpoints,
+            slo_first_token=float(os.environ.get("LLM_SLO_FIRST_TOKEN", 2)),
+            slo_complete=float(os.environ.get("LLM_SLO_COMPLETE", 8)),
+            stale_after=float(os.environ.get("LLM_STATS_STALE_AFTER", 60)),
+            timeout=float(os.environ.get("LLM_ROUTE_TIMEOUT", 60)),
+        )
+
+    # ------------------------------------------------------------------ routing
+
+    def ranked(self, kind: str) -> list:
+        """Endpoints in the order they should be tried for a ``kind`` call."""
+        scored = []
+        for index, endpoint in enumerate(self.endpoints):
+            open_circuit = endpoint.gateway.breaker.state == CircuitBreaker.OPEN
+            score = endpoint.latency[kind].score(self.stale_after)
+            # No recent sample: try it now (0) rather than never learning it recovered.
+            scored.append((open_circuit, 0.0 if score is None else score, index, endpoint))
+        scored.sort(key=lambda item: item[:3])
+        first = scored[0][3]
+        if first.latency[kind].score(self.stale_after) is None:
+            first.latency[kind].probing()
+        return [endpoint for *_, endpoint in scored]
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _launch(self, kind: str, endpoint: Endpoint, params: dict, events: queue.Queue, context=None) -> _Attempt:
+        attempt = _Attempt(endpoint)
+        target = self._run_stream if kind == "stream" else self._run_complete
+        run = (context or contextvars.Context()).run
+        threading.Thread(
+            target=run, args=(target, attempt, params, events), name=f"llm-{endpoint.name}", daemon=True
+        ).start()
+        return attempt
+
+    @staticmethod
+    def _as_gateway_error(exc: Exception) -> GatewayError:
+        # A malformed response or a raw transport error must still reach the
+        # waiting request as an error event, or it would wait for nothing.
+        if isinstance(exc, GatewayError):
+            return exc
+        error = GatewayError(f"{type(exc).__name__}: {exc}")
+        error.__cause__ = exc
+        return error
+
+    @staticmethod
+    def _run_complete(attempt: _Attempt, params: dict, events: queue.Queue) -> None:
+        endpoint = attempt.endpoint
+        started = time.perf_counter()
+        try:
+            reply = endpoint.gateway.complete(**params)
+        except Exception as exc:
+            endpoint.latency["complete"].fail()
+            events.put(("error", attempt, ModelRouter._as_gateway_error(exc)))
+            return
+        endpoint.latency["complete"].observe(time.perf_counter() - started)
+        events.put(("result", attempt, reply))
+
+    @staticmethod
+    def _run_stream(attempt: _Attempt, params: dict, events: queue.Queue) -> None:
+        endpoint = attempt.endpoint
+        started = time.perf_counter()
+        first = True
+        deltas = endpoint.gateway.stream(**params)
+        try:
+            for delta in deltas:
+                if first:
+                    endpoint.latency["stream"].observe(time.perf_counter() - started)
+                    first = False
+                if attempt.cancelled.is_set():
+                    return
+                events.put(("chunk", attempt, delta))
+        except Exception as exc:
+            if first:
+                endpoint.latency["stream"].fail()
+            events.put(("error", attempt, ModelRouter._as_gateway_error(exc)))
+            return
+        finally:
+            deltas.close()
+        events.put(("end", attempt, None))
+
+    def _race(self, kind: str, messages, overrides: dict, events: queue.Queue, deadline: float):
+        """Start the call, hedging and falling back as needed; return (winner, first event)."""
+        candidates = self.ranked(kind)
+        slo = self.slo[kind]
+        active = []
+        errors = []
+        hedge = None
+
+        def launch(context=None):
+            if not candidates:
+                return None
+            endpoint = candidates.pop(0)
+            attempt = self._launch(kind, endpoint, endpoint.request(messages, overrides), events, context)
+            active.append(attempt)
+            return attempt
+
+        # The first attempt carries the request's context, so its model time
+        # shows up in the request's Server-Timing.
+        launch(contextvars.copy_context())
+        hedge_at = time.monotonic() + slo if slo > 0 else None
+        while active:
+            now = time.monotonic()
+            if now >= deadline:
+                for pending in active:
+                    pending.cancelled.set()
+                raise GatewayTimeout("no model endpoint answered within %.1fs" % self.timeout)
+            wait_until = deadline
+            hedging = hedge_at is not None and hedge is None and candidates and hedge_at < deadline
+            if hedging:
+                wait_until = hedge_at
+            try:
+                event, attempt, payload = events.get(timeout=max(0.0, wait_until - now))
+            except queue.Empty:
+                if hedging:
+                    self._count("hedged")
+                    hedge = launch()
+                continue
+            if attempt not in active:
+                continue
+            if event == "error":
+                active.remove(attempt)
+                errors.append(payload)
+                if not active and launch():
+                    self._count("fallbacks")
+                continue
+            for other in active:
+                if other is not attempt:
+                    other.cancelled.set()
+            if attempt is hedge:
+                self._count("hedge_won")
+            metrics.LLM_ROUTED.inc(endpoint=attempt.endpoint.name, kind=kind, hedge=str(attempt is hedge).lower())
+            return attempt, (event, payload)
+        raise errors[-1] if errors else GatewayError("no model endpoint available")
+
+    # ------------------------------------------------------------------ public API
+
+    def complete(self, messages, on_route=None, **overrides) -> str:
+        """Return the stripped text of a non-streaming completion from the best endpoint.
+
+        ``on_route``, if given, is called with the Endpoint that produced the reply.
+        """
+        deadline = time.monotonic() + self.timeout
+        winner, (_, reply) = self._race("complete", messages, overrides, queue.Queue(), deadline)
+        if on_route is not None:
+            on_route(winner.endpoint)
+        return reply
+
+    def stream(self, messages, on_route=None, **overrides):
+        """Yield text deltas from whichever endpoint produces the first token.
+
+        ``on_route``, if given, is called with that Endpoint before the first delta.
+        """
+        events = queue.Queue()
+        deadline = time.monotonic() + self.timeout
+        winner, (event, payload) = self._race("stream", messages, overrides, events, deadline)
+        if on_route is not None:
+            on_route(winner.endpoint)
+        try:
+            while event != "end":
+                if event == "error":
+                    raise payload
+                yield payload
+                while True:
+                    try:
+                        event, attempt, payload = events.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        raise GatewayTimeout("model stream exceeded %.1fs" % self.timeout) from None
+                    if attempt is winner:
+                        break
+        finally:
+            winner.cancelled.set()
+
+    def drain(self, timeout: float = 30.0) -> bool:
+        """Refuse new calls on every endpoint and wait for in-flight ones, sharing ``timeout``."""
+        deadline = time.monotonic() + timeout
+        done = True
+        for endpoint in self.endpoints:
+            done = endpoint.gateway.drain(max(0.0, deadline - time.monotonic())) and done
+        return done
+
+    def stats(self) -> dict:
+        endpoints = [endpoint.stats() for endpoint in self.endpoints]
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            # Open only when no endpoint can take a call.
+            "circuit": "open" if all(e["circuit"] == CircuitBreaker.OPEN for e in endpoints) else "closed",
+            "draining": any(e["draining"] for e in endpoints),
+            **counters,
+            "endpoints": endpoints,
+        }
+
+
+def load_registry() -> list:
+    """The configured endpoints as dicts with at least ``name`` and ``base_url``."""
+    raw = os.environ.get("LLM_MODELS")
+    path = os.environ.get("LLM_MODELS_FILE")
+    if not raw and path:
+        with open(path, encoding="utf-8") as f:
+            raw = f.read()
+    if not raw:
+        return [
+            {
+                "name": "together",
+                "model": DEFAULT_MODEL,
+                "base_url": os.environ.get("TOGETHER_BASE_URL", "https://api.together.xyz/v1"),
+                "api_key_env": "TOGETHER_API_KEY",
+            }
+        ]
+    entries = json.loads(raw)
+    for entry in entries:
+        if "name" not in entry or "base_url" not in entry:
+            raise ValueError(f"model endpoint needs a name and a base_url: {entry}")
+    return entries
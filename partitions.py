@@ -0,0 +1,301 @@
+"""
+Monthly partition upkeep for ``conversations``.
+
+``conversations`` is range-partitioned by UTC month on "timestamp"
+(migration 0008). This module
+
+* creates the partitions for the coming months ahead of time, so new rows
+  never fall into the DEFAULT partition;
+* archives months older than the retention period: the partition is
+  written to a gzip'd CSV file under ``ARCHIVE_DIR`` while still attached,
+  then detached, recorded in ``archived_partitions`` and dropped in a short
+  second transaction. Sessions with messages in it are flagged
+  ``chat_sessions.archived``;
+* restores an archived session on demand: its rows are read back from the
+  archive files into the DEFAULT partition ``conversations_restored``. The
+  app runs this as a background job (see app.py).
+
+Usage (e.g. from a daily cron job):
+    python partitions.py maintain     # create future partitions, archive old ones
+    python partitions.py restore <session_id>
+"""
+
+import csv
+import gzip
+import logging
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+import psycopg2.errors
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+import db
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", 3))
+RETENTION_MONTHS = int(os.environ.get("PARTITION_RETENTION_MONTHS", 12))
+# DETACH takes ACCESS EXCLUSIVE on conversations, and every chat query queues
+# behind it while it waits; give up quickly and try again instead.
+DETACH_LOCK_TIMEOUT = os.environ.get("ARCHIVE_LOCK_TIMEOUT", "2s")
+DETACH_ATTEMPTS = 5
+
+COLUMNS = ["id", "user_email", "message", "sender", "timestamp", "session_id", "title"]
+PARTITION_NAME = re.compile(r"^conversations_y(\d{4})m(\d{2})$")
+
+
+def month_start(year: int, month: int) -> datetime:
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def add_months(start: datetime, months: int) -> datetime:
+    index = start.year * 12 + start.month - 1 + months
+    return month_start(index // 12, index % 12 + 1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"conversations_y{start.year:04d}m{start.month:02d}"
+
+
+def ensure_partitions(cur, months_ahead: int = MONTHS_AHEAD, now: datetime = None) -> list:
+    """Create any missing partition from the current month to ``months_ahead`` months ahead."""
+    now = now or datetime.now(timezone.utc)
+    current = month_start(now.year, now.month)
+    created = []
+    for offset in range(months_ahead + 1):
+        start = add_months(current, offset)
+        name = partition_name(start)
+        cur.execute("SELECT to_regclass(%s)", (f"public.{name}",))
+        if cur.fetchone()[0] is not None:
+            continue
+        cur.execute(
+            sql.SQL(
+                "CREATE TABLE public.{} PARTITION OF public.conversations FOR VALUES FROM (%s) TO (%s)"
+            ).format(sql.Identifier(name)),
+            (start, add_months(start, 1)),
+        )
+        created.append(name)
+    return created
+
+
+def ensure_range(cur, first: datetime, last: datetime) -> list:
+    """Create the missing monthly partitions covering ``first``..``last`` (e.g. before a bulk import).
+
+    Months that were already archived are left to the DEFAULT partition, so
+    their archive file is not overwritten when the month is archived again.
+    """
+    cur.execute("SELECT name FROM archived_partitions")
+    archived = {name for (name,) in cur.fetchall()}
+    created = []
+    start = month_start(first.year, first.month)
+    while start <= last:
+        name = partition_name(start)
+        if name not in archived:
+            cur.execute("SELECT to_regclass(%s)", (f"public.{name}",))
+            if cur.fetchone()[0] is None:
+                cur.execute(
+                    sql.SQL(
+                        "CREATE TABLE public.{} PARTITION OF public.conversations FOR VALUES FROM (%s) TO (%s)"
+                    ).format(sql.Identifier(name)),
+                    (start, add_months(start, 1)),
+                )
+                created.append(name)
+        start = add_months(start, 1)
+    return created
+
+
+def list_partitions(cur) -> list:
+    """Return [(name, range_start)] for the attached monthly partitions, oldest first."""
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'public.conversations'::regclass
+        """
+    )
+    found = []
+    for (name,) in cur.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            found.append((name, month_start(int(match.group(1)), int(match.group(2)))))
+    return sorted(found, key=lambda item: item[1])
+
+
+class ArchiveChanged(Exception):
+    """Rows were written to the partition after it was exported."""
+
+
+def _export_partition(conn, name: str, path: str) -> int:
+    """Write the attached partition to ``path``; return its row count.
+
+    Reading a partition directly locks only that partition, so chat traffic
+    on ``conversations`` carries on while the month is compressed.
+    """
+    table = sql.Identifier(name)
+    # One snapshot for the COPY and the count.
+    conn.rollback()
+    conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    try:
+        with conn.cursor() as cur:
+            tmp_path = path + ".tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8", newline="") as out:
+                out.write(",".join(COLUMNS) + "\n")
+                cur.copy_expert(
+                    sql.SQL("COPY (SELECT {} FROM public.{} ORDER BY session_id, id) TO STDOUT WITH CSV")
+                    .format(sql.SQL(", ").join(map(sql.Identifier, COLUMNS)), table)
+                    .as_string(conn),
+                    out,
+                )
+            cur.execute(sql.SQL("SELECT count(*) FROM public.{}").format(table))
+            row_count = cur.fetchone()[0]
+        conn.rollback()
+    finally:
+        conn.set_session(isolation_level="DEFAULT", readonly="DEFAULT")
+    os.replace(tmp_path, path)
+    return row_count
+
+
+def _detach_partition(conn, name: str, start: datetime, path: str, row_count: int) -> None:
+    """Detach, record and drop the exported partition in one short transaction."""
+    table = sql.Identifier(name)
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = %s", (DETACH_LOCK_TIMEOUT,))
+        cur.execute(sql.SQL("ALTER TABLE public.conversations DETACH PARTITION public.{}").format(table))
+        cur.execute(sql.SQL("SELECT count(*) FROM public.{}").format(table))
+        if cur.fetchone()[0] != row_count:
+            raise ArchiveChanged(name)
+        cur.execute(
+            """
+            INSERT INTO archived_partitions (name, range_start, range_end, path, row_count)
+            VALUES (%s, %s, %s, %s, %s)
+            """,
+            (name, start, add_months(start, 1), path, row_count),
+        )
+        cur.execute(
+            sql.SQL(
+                """
+                INSERT INTO archived_session_partitions (session_id, partition_name)
+                SELECT DISTINCT p.session_id, %s FROM public.{} p
+                JOIN chat_sessions s ON s.id = p.session_id
+                ON CONFLICT DO NOTHING
+                """
+            ).format(table),
+            (name,),
+        )
+        cur.execute(
+            "UPDATE chat_sessions SET archived = TRUE WHERE id IN "
+            "(SELECT session_id FROM archived_session_partitions WHERE partition_name = %s)",
+            (name,),
+        )
+        cur.execute(sql.SQL("DROP TABLE public.{}").format(table))
+    conn.commit()
+
+
+def archive_partition(conn, name: str, start: datetime, archive_dir: str = ARCHIVE_DIR) -> int:
+    """Write one monthly partition to ``<archive_dir>/<name>.csv.gz``, then detach and drop it.
+
+    The export runs first, with the partition still attached; only the
+    detach holds the exclusive lock on ``conversations``. If the detach
+    cannot get its lock in time, or rows arrived after the export, the
+    transaction is rolled back and the month is tried again.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    row_count = _export_partition(conn, name, path)
+    for attempt in range(1, DETACH_ATTEMPTS + 1):
+        try:
+            _detach_partition(conn, name, start, path, row_count)
+            return row_count
+        except (ArchiveChanged, psycopg2.errors.LockNotAvailable) as exc:
+            conn.rollback()
+            if attempt == DETACH_ATTEMPTS:
+                raise
+            log.warning("Detaching %s failed (%s); retrying", name, type(exc).__name__)
+            if isinstance(exc, ArchiveChanged):
+                row_count = _export_partition(conn, name, path)
+            else:
+                time.sleep(attempt)
+
+
+def maintain(retention_months: int = RETENTION_MONTHS, months_ahead: int = MONTHS_AHEAD) -> None:
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            for name in ensure_partitions(cur, months_ahead):
+                print(f"Created partition {name}")
+        conn.commit()
+
+        now = datetime.now(timezone.utc)
+        cutoff = add_months(month_start(now.year, now.month), -retention_months)
+        with conn.cursor() as cur:
+            old = [(name, start) for name, start in list_partitions(cur) if start < cutoff]
+        for name, start in old:
+            rows = archive_partition(conn, name, start)
+            print(f"Archived {name} ({rows} rows)")
+
+
+def restore_session(session_id: str) -> int:
+    """Copy an archived session's rows back into ``conversations``; return how many were restored."""
+    with db.cursor() as cur:
+        cur.execute(
+            """
+            SELECT a.name, a.path
+            FROM archived_session_partitions sp
+            JOIN archived_partitions a ON a.name = sp.partition_name
+            WHERE sp.session_id = %s
+            """,
+            (session_id,),
+        )
+        archives = cur.fetchall()
+
+    restored = 0
+    for name, path in archives:
+        rows = []
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            next(reader)  # header
+            for row in reader:
+                if row[5] == session_id:
+                    # CSV writes NULL as an empty field; message is NOT NULL and keeps "".
+                    rows.append([v if v != "" or i == 2 else None for i, v in enumerate(row)])
+        with db.cursor() as cur:
+            if rows:
+                execute_values(
+                    cur,
+                    'INSERT INTO conversations (id, user_email, message, sender, "timestamp", session_id, title) '
+                    "VALUES %s ON CONFLICT DO NOTHING",
+                    rows,
+                )
+            cur.execute(
+                "DELETE FROM archived_session_partitions WHERE session_id = %s AND partition_name = %s",
+                (session_id, name),
+            )
+        restored += len(rows)
+
+    with db.cursor() as cur:
+        cur.execute("UPDATE chat_sessions SET archived = FALSE WHERE id = %s", (session_id,))
+    return restored
+
+
+def main(argv) -> int:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if len(argv) >= 2 and argv[1] == "maintain":
+        maintain()
+    elif len(argv) == 3 and argv[1] == "restore":
+        print(f"✅ Restored {restore_session(argv[2])} message(s).")
+    else:
+        print(__doc__)
+        return 2
+    db.close_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,123 @@
+"""
+Sliding-window rate limiting for login and password-reset attempts.
+
+Each key (e.g. ``login:acct:<email>`` or ``login:ip:<addr>``) keeps the
+timestamps of its recent events; a key is limited while at least ``limit``
+of them fall inside the last ``window`` seconds, so blocks lift by
+themselves as old events age out.
+
+Events are kept in process memory by default. Setting
+``RATE_LIMIT_REDIS_URL`` shares them between workers through Redis sorted
+sets (requires the optional ``redis`` package).
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+log = logging.getLogger(__name__)
+
+
+class LocalWindowBackend:
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, key: str, since: float):
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= since:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    def add(self, key: str, now: float, window: float) -> int:
+        with self._lock:
+            events = self._prune(key, now - window)
+            if events is None:
+                if len(self._events) >= self.max_keys:
+                    # Forget the stalest key rather than growing without bound.
+                    self._events.pop(next(iter(self._events)))
+                events = self._events[key] = deque()
+            events.append(now)
+            return len(events)
+
+    def count(self, key: str, now: float, window: float) -> int:
+        with self._lock:
+            events = self._prune(key, now - window)
+            return len(events) if events else 0
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._events.pop(key, None)
+
+
+class RedisWindowBackend:
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("the redis package is required for RATE_LIMIT_REDIS_URL")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    # Redis errors fail open: an unreachable limiter must not block logins.
+
+    def add(self, key: str, now: float, window: float) -> int:
+        pipe = self._client.pipeline()
+        pipe.zremrangebyscore(key, 0, now - window)
+        pipe.zadd(key, {f"{now}:{uuid.uuid4().hex[:8]}": now})
+        pipe.zcard(key)
+        pipe.expire(key, int(window) + 1)
+        try:
+            return pipe.execute()[2]
+        except redis.RedisError as exc:
+            log.warning("Rate limiter error: %s", exc)
+            return 0
+
+    def count(self, key: str, now: float, window: float) -> int:
+        pipe = self._client.pipeline()
+        pipe.zremrangebyscore(key, 0, now - window)
+        pipe.zcard(key)
+        try:
+            return pipe.execute()[1]
+        except redis.RedisError as exc:
+            log.warning("Rate limiter error: %s", exc)
+            return 0
+
+    def clear(self, key: str) -> None:
+        try:
+            self._client.delete(key)
+        except redis.RedisError as exc:
+            log.warning("Rate limiter error: %s", exc)
+
+
+def backend_from_env():
+    url = os.environ.get("RATE_LIMIT_REDIS_URL")
+    return RedisWindowBackend(url) if url else LocalWindowBackend()
+
+
+class SlidingWindowLimiter:
+    def __init__(self, limit: int, window: float, backend=None):
+        self.limit = limit
+        self.window = window
+        self.backend = backend if backend is not None else LocalWindowBackend()
+
+    def hit(self, key: str) -> int:
+        """Record an event for ``key`` and return how many fall in the current window."""
+        return self.backend.add(key, time.time(), self.window)
+
+    def is_limited(self, key: str) -> bool:
+        return self.backend.count(key, time.time(), self.window) >= self.limit
+
+    def reset(self, key: str) -> None:
+        self.backend.clear(key)
@@ -0,0 +1,150 @@
+"""
+Opt-in cache of model replies for repeated opening messages.
+
+Many conversations start with the same few messages ("hello", "I feel
+anxious"). When a prompt is just the system prompt plus a single user
+message, the reply is looked up by (normalized message, model, temperature,
+system prompt) before calling the model. Prompts that carry session history
+or a summary are never cached.
+
+The default backend is an in-process LRU with a TTL. Setting
+``RESPONSE_CACHE_REDIS_URL`` shares the cache between workers through Redis
+(requires the optional ``redis`` package).
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+
+def normalize_prompt(text: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation."""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip(" .!?…")
+
+
+def cache_key(user_message: str, model: str, temperature: float, system_prompt: str) -> str:
+    raw = json.dumps([normalize_prompt(user_message), model, temperature, system_prompt])
+    return "cogi:reply:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LocalBackend:
+    """Thread-safe LRU map with a per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shared backend; size is bounded by Redis' own maxmemory/LRU policy."""
+
+    def __init__(self, url: str, ttl: float = 3600.0):
+        if redis is None:
+            raise RuntimeError("the redis package is required for RESPONSE_CACHE_REDIS_URL")
+        self.ttl = int(ttl)
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def get(self, key: str):
+        try:
+            value = self._client.get(key)
+        except redis.RedisError:
+            return None
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str) -> None:
+        try:
+            self._client.set(key, value, ex=self.ttl)
+        except redis.RedisError:
+            pass
+
+
+class ResponseCache:
+    def __init__(self, backend=None, enabled: bool = True):
+        self.backend = backend if backend is not None else LocalBackend()
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        enabled = os.environ.get("RESPONSE_CACHE_ENABLED", "").lower() in ("1", "true", "yes")
+        ttl = float(os.environ.get("RESPONSE_CACHE_TTL", 3600))
+        redis_url = os.environ.get("RESPONSE_CACHE_REDIS_URL")
+        if enabled and redis_url:
+            backend = RedisBackend(redis_url, ttl=ttl)
+        else:
+            backend = LocalBackend(int(os.environ.get("RESPONSE_CACHE_SIZE", 1024)), ttl=ttl)
+        return cls(backend, enabled=enabled)
+
+    def key_for(self, messages: list, model: str, temperature: float):
+        """Return the cache key for a prompt, or None if the prompt must not be cached."""
+        if not self.enabled:
+            return None
+        # Only a bare system prompt + user message is cacheable; anything
+        # longer carries session history or a summary.
+        if len(messages) != 2 or [m["role"] for m in messages] != ["system", "user"]:
+            return None
+        return cache_key(messages[1]["content"], model, temperature, messages[0]["content"])
+
+    def get(self, key: str):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.backend.set(key, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 3) if total else 0.0,
+        }
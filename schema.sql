@@ -1,209 +0,0 @@
---
--- PostgreSQL database dump
---
-
--- Dumped from database version 14.18 (Homebrew)
--- Dumped by pg_dump version 14.18 (Homebrew)
-
-SET statement_timeout = 0;
-SET lock_timeout = 0;
-SET idle_in_transaction_session_timeout = 0;
-SET client_encoding = 'UTF8';
-SET standard_conforming_strings = on;
-SELECT pg_catalog.set_config('search_path', '', false);
-SET check_function_bodies = false;
-SET xmloption = content;
-SET client_min_messages = warning;
-SET row_security = off;
-
-SET default_tablespace = '';
-
-SET default_table_access_method = heap;
-
---
--- Name: conversations; Type: TABLE; Schema: public; Owner: mac
---
-
-CREATE TABLE public.conversations (
-    id integer NOT NULL,
-    user_email character varying(255),
-    message text NOT NULL,
-    sender character varying(20),
-    "timestamp" timestamp with time zone DEFAULT now(),
-    session_id uuid DEFAULT gen_random_uuid(),
-    CONSTRAINT conversations_sender_check CHECK (((sender)::text = ANY ((ARRAY['user'::character varying, 'bot'::character varying])::text[])))
-);
-
-
-ALTER TABLE public.conversations OWNER TO mac;
-
---
--- Name: conversations_id_seq; Type: SEQUENCE; Schema: public; Owner: mac
---
-
-CREATE SEQUENCE public.conversations_id_seq
-    AS integer
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1;
-
-
-ALTER TABLE public.conversations_id_seq OWNER TO mac;
-
---
--- Name: conversations_id_seq; Type: SEQUENCE OWNED BY; Schema: public; Owner: mac
---
-
-ALTER SEQUENCE public.conversations_id_seq OWNED BY public.conversations.id;
-
-
---
--- Name: feedback; Type: TABLE; Schema: public; Owner: mac
---
-
-CREATE TABLE public.feedback (
-    id integer NOT NULL,
-    name character varying(100) NOT NULL,
-    message text NOT NULL,
-    submitted_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP
-);
-
-
-ALTER TABLE public.feedback OWNER TO mac;
-
---
--- Name: feedback_id_seq; Type: SEQUENCE; Schema: public; Owner: mac
---
-
-CREATE SEQUENCE public.feedback_id_seq
-    AS integer
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1;
-
-
-ALTER TABLE public.feedback_id_seq OWNER TO mac;
-
---
--- Name: feedback_id_seq; Type: SEQUENCE OWNED BY; Schema: public; Owner: mac
---
-
-ALTER SEQUENCE public.feedback_id_seq OWNED BY public.feedback.id;
-
-
---
--- Name: users; Type: TABLE; Schema: public; Owner: mac
---
-
-CREATE TABLE public.users (
-    id integer NOT NULL,
-    email character varying(255) NOT NULL,
-    password text NOT NULL,
-    first_name character varying(100),
-    last_name character varying(100),
-    gender character varying(10),
-    dob date,
-    confirmed boolean DEFAULT false,
-    attempts integer DEFAULT 0
-);
-
-
-ALTER TABLE public.users OWNER TO mac;
-
---
--- Name: users_id_seq; Type: SEQUENCE; Schema: public; Owner: mac
---
-
-CREATE SEQUENCE public.users_id_seq
-    AS integer
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1;
-
-
-ALTER TABLE public.users_id_seq OWNER TO mac;
-
---
--- Name: users_id_seq; Type: SEQUENCE OWNED BY; Schema: public; Owner: mac
---
-
-ALTER SEQUENCE public.users_id_seq OWNED BY public.users.id;
-
-
---
--- Name: conversations id; Type: DEFAULT; Schema: public; Owner: mac
---
-
-ALTER TABLE ONLY public.conversations ALTER COLUMN id SET DEFAULT nextval('public.conversations_id_seq'::regclass);
-
-
---
--- Name: feedback id; Type: DEFAULT; Schema: public; Owner: mac
---
-
-ALTER TABLE ONLY public.feedback ALTER COLUMN id SET DEFAULT nextval('public.feedback_id_seq'::regclass);
-
-
---
--- Name: users id; Type: DEFAULT; Schema: public; Owner: mac
---
-
-ALTER TABLE ONLY public.users ALTER COLUMN id SET DEFAULT nextval('public.users_id_seq'::regclass);
-
-
---
--- Name: conversations conversations_pkey; Type: CONSTRAINT; Schema: public; Owner: mac
---
-
-ALTER TABLE ONLY public.conversations
-    ADD CONSTRAINT conversations_pkey PRIMARY KEY (id);
-
-
---
--- Name: feedback feedback_pkey; Type: CONSTRAINT; Schema: public; Owner: mac
---
-
-ALTER TABLE ONLY public.feedback
-    ADD CONSTRAINT feedback_pkey PRIMARY KEY (id);
-
-
---
--- Name: users users_email_key; Type: CONSTRAINT; Schema: public; Owner: mac
---
-
-ALTER TABLE ONLY public.users
-    ADD CONSTRAINT users_email_key UNIQUE (email);
-
-
---
--- Name: users users_pkey; Type: CONSTRAINT; Schema: public; Owner: mac
---
-
-ALTER TABLE ONLY public.users
-    ADD CONSTRAINT users_pkey PRIMARY KEY (id);
-
-
---
--- Name: conversations conversations_user_email_fkey; Type: FK CONSTRAINT; Schema: public; Owner: mac
---
-
-ALTER TABLE ONLY public.conversations
-    ADD CONSTRAINT conversations_user_email_fkey FOREIGN KEY (user_email) REFERENCES public.users(email);
-
-
---
--- PostgreSQL database dump complete
---
-
--- Table pour les abonnés à la newsletter
-CREATE TABLE IF NOT EXISTS public.subscriber (
-    id SERIAL PRIMARY KEY,
-    email VARCHAR(255) NOT NULL UNIQUE,
-    subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
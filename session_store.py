@@ -0,0 +1,241 @@
+"""
+Server-side sessions.
+
+The cookie carries only a random session id; the session data (user, active
+chat ``session_id``, flashes) and its last-activity time live in a backend.
+Inactivity expiry is enforced here rather than by rewriting a signed cookie
+on every response:
+
+* a session idle for longer than ``lifetime`` is dropped when it is next
+  opened, and swept from the backend in the background;
+* the activity time is written at most once every ``touch_interval``
+  seconds; unchanged sessions are not written at all in between;
+* the cookie is only sent when a session is created, renewed or deleted.
+
+Call ``session.regenerate()`` whenever the privilege level changes (login,
+logout): the data moves to a new session id and the old record is deleted,
+so an id planted in a victim's browser before login is worthless after it.
+
+Sessions are kept in process memory by default. Setting
+``SESSION_REDIS_URL`` stores them in Redis instead (requires the optional
+``redis`` package, listed in requirements.txt), which shares them between
+workers and lets key expiry do the sweeping. With more than one worker
+process a shared backend is required; see gunicorn.conf.py.
+"""
+
+import logging
+import os
+import secrets
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+log = logging.getLogger(__name__)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, sid: str, data=None, last_activity: float = None, new: bool = False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(data, on_update)
+        self.sid = sid
+        self.last_activity = last_activity
+        self.new = new
+        self.modified = False
+        # True when the request arrived with a logged-in session that had timed out.
+        self.expired = False
+        # Set by regenerate(): the id whose record must be deleted on save.
+        self.previous_sid = None
+
+    def regenerate(self) -> None:
+        """Move this session to a fresh id; the old record is deleted when the response is saved."""
+        if not self.new and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+
+
+class MemorySessionBackend:
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid: str):
+        """Return (data, last_activity) or None."""
+        with self._lock:
+            record = self._records.get(sid)
+            return (dict(record[0]), record[1]) if record else None
+
+    def save(self, sid: str, data: dict, now: float, lifetime: float) -> None:
+        with self._lock:
+            self._records[sid] = (dict(data), now)
+
+    def touch(self, sid: str, now: float, lifetime: float) -> None:
+        with self._lock:
+            record = self._records.get(sid)
+            if record:
+                self._records[sid] = (record[0], now)
+
+    def delete(self, sid: str) -> None:
+        with self._lock:
+            self._records.pop(sid, None)
+
+    def sweep(self, idle_before: float) -> int:
+        with self._lock:
+            stale = [sid for sid, (_, at) in self._records.items() if at < idle_before]
+            for sid in stale:
+                del self._records[sid]
+        return len(stale)
+
+    def __len__(self):
+        return len(self._records)
+
+
+class RedisSessionBackend:
+    """One hash per session (``data``, ``last_activity``) that expires with the session."""
+
+    prefix = "cogi:session:"
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("SESSION_REDIS_URL is set but the redis package is not installed (pip install redis)")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def load(self, sid: str):
+        record = self._client.hgetall(self.prefix + sid)
+        if not record:
+            return None
+        return session_json_serializer.loads(record[b"data"].decode("utf-8")), float(record[b"last_activity"])
+
+    def save(self, sid: str, data: dict, now: float, lifetime: float) -> None:
+        pipe = self._client.pipeline()
+        pipe.hset(self.prefix + sid, mapping={"data": session_json_serializer.dumps(dict(data)), "last_activity": now})
+        pipe.expire(self.prefix + sid, int(lifetime) + 1)
+        pipe.execute()
+
+    def touch(self, sid: str, now: float, lifetime: float) -> None:
+        pipe = self._client.pipeline()
+        pipe.hset(self.prefix + sid, "last_activity", now)
+        pipe.expire(self.prefix + sid, int(lifetime) + 1)
+        pipe.execute()
+
+    def delete(self, sid: str) -> None:
+        self._client.delete(self.prefix + sid)
+
+    def sweep(self, idle_before: float) -> int:
+        return 0  # keys expire by themselves
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, backend=None, touch_interval: float = 60.0, sweep_interval: float = 60.0):
+        self.backend = backend if backend is not None else MemorySessionBackend()
+        self.touch_interval = touch_interval
+        self.sweep_interval = sweep_interval
+        self.counters = {"created": 0, "expired": 0, "writes": 0, "touches": 0, "swept": 0}
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls):
+        url = os.environ.get("SESSION_REDIS_URL")
+        return cls(
+            backend=RedisSessionBackend(url) if url else MemorySessionBackend(),
+            touch_interval=float(os.environ.get("SESSION_TOUCH_INTERVAL", 60)),
+            sweep_interval=float(os.environ.get("SESSION_SWEEP_INTERVAL", 60)),
+        )
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def open_session(self, app, request):
+        self._start_sweeper(app.permanent_session_lifetime.total_seconds())
+        sid = request.cookies.get(self.get_cookie_name(app))
+        record = self.backend.load(sid) if sid else None
+        if record is None:
+            return ServerSession(secrets.token_urlsafe(32), new=True)
+
+        data, last_activity = record
+        if time.time() - last_activity > app.permanent_session_lifetime.total_seconds():
+            self.backend.delete(sid)
+            self._count("expired")
+            fresh = ServerSession(secrets.token_urlsafe(32), new=True)
+            fresh.expired = "user" in data
+            return fresh
+        return ServerSession(sid, data, last_activity)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+
+        if session.previous_sid is not None:
+            self.backend.delete(session.previous_sid)
+            if not session:
+                response.delete_cookie(name, domain=domain, path=path)
+
+        if not session:
+            if not session.new:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified or session.new:
+            self.backend.save(session.sid, session, now, lifetime)
+            self._count("writes")
+        elif now - session.last_activity >= self.touch_interval:
+            self.backend.touch(session.sid, now, lifetime)
+            self._count("touches")
+
+        if session.new:
+            self._count("created")
+            response.set_cookie(
+                name,
+                session.sid,
+                domain=domain,
+                path=path,
+                httponly=self.get_cookie_httponly(app),
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+    def _start_sweeper(self, lifetime: float) -> None:
+        if self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(
+                    target=self._sweep_loop, args=(lifetime,), name="session-sweeper", daemon=True
+                )
+                self._sweeper.start()
+
+    def _sweep_loop(self, lifetime: float) -> None:
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                swept = self.backend.sweep(time.time() - lifetime)
+            except Exception as exc:
+                log.error("Error sweeping sessions: %s", exc)
+                continue
+            with self._lock:
+                self.counters["swept"] += swept
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        if isinstance(self.backend, MemorySessionBackend):
+            stats["active"] = len(self.backend)
+        return stats
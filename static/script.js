@@ -102,8 +102,103 @@ document.addEventListener('DOMContentLoaded', function () {
   messageWrapper.appendChild(content);
   chatBox.appendChild(messageWrapper);
   chatBox.scrollTop = chatBox.scrollHeight;
+  return content.querySelector('.message-text');
 }
 
+  // ========== Lecture du flux SSE de /send_message ==========
+  async function readReplyStream(response, textEl) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let reply = '';
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const frame = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let event = 'message';
+        let data = '';
+        frame.split('\n').forEach(line => {
+          if (line.startsWith('event:')) event = line.slice(6).trim();
+          else if (line.startsWith('data:')) data += line.slice(5).trim();
+        });
+        if (!data) continue;
+        const payload = JSON.parse(data);
+
+        if (event === 'token') {
+          reply += payload.text;
+          textEl.textContent = reply;
+        } else if (event === 'done' || event === 'error') {
+          textEl.textContent = payload.reply || reply || "❌ Erreur : réponse vide";
+          if (payload.error) textEl.textContent += `\n\n${payload.error}`;
+        }
+        chatBox.scrollTop = chatBox.scrollHeight;
+      }
+    }
+  }
+
+
+  // ========== Chargement des anciens messages au scroll ==========
+  const historyBox = document.getElementById('chat-history');
+  let loadingHistory = false;
+
+  function buildHistoryMessage(msg) {
+    const wrapper = document.createElement('div');
+    wrapper.className = `chat-message ${msg.sender === 'user' ? 'user-message' : 'bot-message'}`;
+
+    const avatar = document.createElement('div');
+    avatar.className = 'message-avatar';
+    avatar.innerHTML = msg.sender === 'user' ? '<i class="bi bi-person-circle"></i>' : '<i class="bi bi-robot"></i>';
+
+    const content = document.createElement('div');
+    content.className = 'message-content';
+    [['message-sender', msg.sender.charAt(0).toUpperCase() + msg.sender.slice(1)],
+     ['message-text', msg.message],
+     ['message-timestamp', msg.time]].forEach(([cls, text]) => {
+      const el = document.createElement('div');
+      el.className = cls;
+      el.textContent = text;
+      content.appendChild(el);
+    });
+
+    wrapper.appendChild(avatar);
+    wrapper.appendChild(content);
+    return wrapper;
+  }
+
+  function loadOlderMessages() {
+    const cursor = historyBox.dataset.cursor;
+    if (!cursor || loadingHistory) return;
+    loadingHistory = true;
+
+    const params = new URLSearchParams({ session_id: historyBox.dataset.sessionId, before: cursor });
+    fetch(`/chat/history?${params}`)
+      .then(response => response.json())
+      .then(data => {
+        const previousHeight = chatBox.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        (data.messages || []).forEach(msg => fragment.appendChild(buildHistoryMessage(msg)));
+        historyBox.insertBefore(fragment, historyBox.firstChild);
+        historyBox.dataset.cursor = data.next_cursor || '';
+        // Garde la position de lecture après l'ajout en haut
+        chatBox.scrollTop += chatBox.scrollHeight - previousHeight;
+      })
+      .catch(error => console.error('Erreur historique :', error))
+      .finally(() => { loadingHistory = false; });
+  }
+
+  if (historyBox) {
+    chatBox.scrollTop = chatBox.scrollHeight;
+    chatBox.addEventListener('scroll', function () {
+      if (chatBox.scrollTop < 80) loadOlderMessages();
+    });
+  }
 
   sendBtn.addEventListener('click', function (e) {
     e.preventDefault();
@@ -116,15 +211,22 @@ document.addEventListener('DOMContentLoaded', function () {
     fetch('/send_message', {
       method: 'POST',
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream'
       },
       body: JSON.stringify({ message: message })
     })
-      .then(response => response.json())
-      .then(data => {
-        console.log('Réponse API :', data);
-        const botReply = data.reply || "❌ Erreur : réponse vide";
-        displayMessage(botReply, 'bot');
+      .then(response => {
+        const contentType = response.headers.get('Content-Type') || '';
+        if (contentType.includes('text/event-stream') && response.body) {
+          const textEl = displayMessage('', 'bot');
+          return readReplyStream(response, textEl);
+        }
+        return response.json().then(data => {
+          console.log('Réponse API :', data);
+          const botReply = data.reply || "❌ Erreur : réponse vide";
+          displayMessage(botReply, 'bot');
+        });
       })
       .catch(error => {
         console.error('Erreur fetch :', error);
@@ -0,0 +1,112 @@
+"""
+Rolling summaries of long chat sessions.
+
+Once a session has more than ``trigger_turns`` turns that are not yet covered
+by its summary, the session is queued for a background worker. The worker
+folds everything except the newest ``keep_turns`` turns into the stored
+summary (``conversation_summaries``) and records the id of the last turn it
+covered, so the next run only reads turns written after that. Prompts then
+carry the summary plus the uncovered turns, which keeps their size flat no
+matter how long the conversation gets.
+
+Nothing here runs on the request thread except ``schedule``, which only
+puts the session id on a queue.
+"""
+
+import logging
+import os
+import queue
+import threading
+
+import db
+
+SUMMARY_TRIGGER_TURNS = int(os.environ.get("SUMMARY_TRIGGER_TURNS", 20))
+SUMMARY_KEEP_TURNS = int(os.environ.get("SUMMARY_KEEP_TURNS", 6))
+
+log = logging.getLogger(__name__)
+
+
+class SessionSummarizer:
+    """Background worker that keeps ``conversation_summaries`` up to date.
+
+    ``summarize`` is called as ``summarize(previous_summary, turns)`` where
+    ``turns`` is a list of (sender, message) pairs, and must return the new
+    summary text. ``on_update(session_id)`` is called after a summary is stored.
+    """
+
+    def __init__(self, summarize, on_update=None, trigger_turns=SUMMARY_TRIGGER_TURNS, keep_turns=SUMMARY_KEEP_TURNS):
+        self.summarize = summarize
+        self.on_update = on_update
+        self.trigger_turns = trigger_turns
+        self.keep_turns = keep_turns
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def schedule(self, session_id: str, uncovered_turns: int) -> None:
+        """Queue a session for summarization if it has grown past the threshold."""
+        if uncovered_turns < self.trigger_turns:
+            return
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="summarizer", daemon=True)
+                self._thread.start()
+        self._queue.put(session_id)
+
+    def _worker(self) -> None:
+        while True:
+            session_id = self._queue.get()
+            try:
+                self.summarize_session(session_id)
+            except Exception as exc:
+                log.warning("Summarizer error: %s", exc)
+            finally:
+                with self._lock:
+                    self._pending.discard(session_id)
+
+    def summarize_session(self, session_id: str) -> bool:
+        """Fold the uncovered turns of one session (except the newest) into its summary."""
+        with db.cursor() as cur:
+            cur.execute(
+                "SELECT summary, summarized_through_id FROM conversation_summaries WHERE session_id = %s",
+                (session_id,),
+            )
+            row = cur.fetchone()
+            previous, through_id = row if row else (None, 0)
+            cur.execute(
+                """
+                SELECT id, sender, message
+                FROM conversations
+                WHERE session_id = %s AND id > %s
+                  AND timestamp >= (SELECT COALESCE(MIN(created_at), '-infinity') FROM chat_sessions WHERE id = %s)
+                ORDER BY id
+                """,
+                (session_id, through_id, session_id),
+            )
+            rows = cur.fetchall()
+
+        to_fold = rows[: len(rows) - self.keep_turns]
+        if len(rows) < self.trigger_turns or not to_fold:
+            return False
+
+        # The model call happens without holding a pooled connection.
+        summary = self.summarize(previous, [(sender, message) for _, sender, message in to_fold])
+        with db.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO conversation_summaries (session_id, summary, summarized_through_id)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (session_id) DO UPDATE
+                SET summary = EXCLUDED.summary,
+                    summarized_through_id = EXCLUDED.summarized_through_id,
+                    updated_at = now()
+                """,
+                (session_id, summary, to_fold[-1][0]),
+            )
+        if self.on_update:
+            self.on_update(session_id)
+        return True
@@ -0,0 +1,19 @@
+"""
+Shared test setup.
+
+The tests run without Postgres or a model endpoint: database access and
+model clients are replaced by fakes, and mail goes to ``bench.smtp_sink``.
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# app.py builds its model router at create_app(); no call is made in tests.
+os.environ.setdefault("TOGETHER_API_KEY", "test-key")
+
@@ -0,0 +1,136 @@
+"""Stand-ins for psycopg2 connections and OpenAI-compatible clients, and a polling helper."""
+
+import threading
+import time
+import types
+
+import psycopg2
+import psycopg2.extensions
+
+
+def wait_for(predicate, timeout: float = 5.0, interval: float = 0.01) -> bool:
+    """Poll ``predicate`` until it is true or ``timeout`` seconds have passed."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+
+    def execute(self, query, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.executed.append(query)
+        if not self.conn.autocommit:
+            self.conn.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        self._rows = list(self.conn.results.pop(0)) if self.conn.results else []
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeConnection:
+    """Records statements; ``results`` holds the rows returned by successive execute() calls."""
+
+    def __init__(self, results=None):
+        self.results = list(results or [])
+        self._autocommit = False
+        self.closed = 0
+        self.broken = False
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    @property
+    def autocommit(self):
+        return self._autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        # Same rule as psycopg2.
+        if self.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            raise psycopg2.ProgrammingError("set_session cannot be used inside a transaction")
+        self._autocommit = value
+
+    @property
+    def info(self):
+        return types.SimpleNamespace(transaction_status=self.transaction_status)
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+        self.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+def completion(content):
+    message = types.SimpleNamespace(content=content)
+    return types.SimpleNamespace(usage=None, choices=[types.SimpleNamespace(message=message)])
+
+
+def chunk(content):
+    delta = types.SimpleNamespace(content=content)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)])
+
+
+class FakeClient:
+    """Answers ``chat.completions.create`` after ``latency`` seconds.
+
+    ``content`` is the reply (split into word chunks when streaming);
+    ``error`` is raised instead when set, ``stream_error`` after the first
+    chunk of a stream.
+    """
+
+    def __init__(self, content="hello there", latency=0.0, error=None, stream_error=None):
+        self.content = content
+        self.latency = latency
+        self.error = error
+        self.stream_error = stream_error
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, timeout=None, stream=False, **params):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        if not stream:
+            return completion(self.content)
+
+        def chunks():
+            for i, word in enumerate(self.content.split(" ")):
+                if i and self.stream_error is not None:
+                    raise self.stream_error
+                yield chunk(word)
+
+        return chunks()
@@ -0,0 +1,155 @@
+"""Request-level checks that need no database."""
+
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+import app as app_module
+from fakes import FakeClient
+from llm_gateway import LLMGateway
+from model_router import Endpoint, ModelRouter
+from response_cache import LocalBackend, ResponseCache
+
+
+class Recorder:
+    def __init__(self):
+        self.statements = []
+        self.rowcount = 1
+
+    def execute(self, query, params=None):
+        self.statements.append((query, params))
+
+
+@pytest.fixture
+def app():
+    return app_module.create_app({"METRICS_TOKEN": "s3cret", "TESTING": True})
+
+
+@pytest.fixture
+def cursor(monkeypatch):
+    recorder = Recorder()
+
+    @contextmanager
+    def fake_cursor():
+        yield recorder
+
+    monkeypatch.setattr(app_module.db, "cursor", fake_cursor)
+    return recorder
+
+
+@pytest.mark.parametrize("path", ["/metrics", "/stats/jobs", "/stats/sessions", "/stats/llm"])
+def test_internal_endpoints_refuse_outside_callers(app, path):
+    client = app.test_client()
+    outside = {"REMOTE_ADDR": "203.0.113.7"}
+    assert client.get(path, environ_base=outside).status_code == 403
+    assert client.get(path, environ_base=outside, headers={"Authorization": "Bearer wrong"}).status_code == 403
+    assert client.get(path, environ_base=outside, headers={"Authorization": "Bearer s3cret"}).status_code == 200
+    assert client.get(path).status_code == 200  # loopback
+
+
+def test_delete_chat_requires_login(app, cursor):
+    response = app.test_client().post("/delete_chat", data={"chat_id": "abc"})
+    assert response.status_code == 302 and "/login" in response.headers["Location"]
+    assert cursor.statements == []
+
+
+def test_delete_chat_is_scoped_to_the_owner(app, cursor):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = "owner@example.com"
+    client.post("/delete_chat", data={"chat_id": "someone-elses-chat"})
+
+    assert len(cursor.statements) == 2
+    for query, params in cursor.statements:
+        assert "user_email = %s" in query
+        assert "owner@example.com" in params
+
+
+def test_concurrent_exports_are_capped_and_slots_released(app, monkeypatch):
+    monkeypatch.setattr(app_module, "export_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(app_module, "export_stream", lambda email, fmt, session_id: iter(["{}\n"]))
+    first, second = app.test_client(), app.test_client()
+    for client in (first, second):
+        with client.session_transaction() as session:
+            session["user"] = "owner@example.com"
+
+    downloading = first.get("/export", buffered=False)
+    assert downloading.status_code == 200
+    busy = second.get("/export")
+    assert busy.status_code == 503 and busy.headers["Retry-After"]
+
+    downloading.close()
+    assert second.get("/export").status_code == 200
+
+
+def test_readiness_reports_draining_once_asked_to_stop(app, cursor, monkeypatch):
+    monkeypatch.setattr(app_module, "_draining", threading.Event())
+    client = app.test_client()
+    assert client.get("/readyz").get_json()["process"] == "ok"
+
+    app_module.begin_drain()
+    response = client.get("/readyz")
+    assert response.status_code == 503 and response.get_json()["process"] == "draining"
+
+
+def test_shutdown_runs_every_step_when_one_fails(app, monkeypatch):
+    done = []
+
+    class FailingWriter:
+        def close(self):
+            raise RuntimeError("database unreachable")
+
+    class Recording:
+        def __init__(self, name):
+            self.name = name
+
+        def shutdown(self):
+            done.append(self.name)
+
+    monkeypatch.setattr(app_module, "_draining", threading.Event())
+    monkeypatch.setattr(app_module, "_apps", [app])
+    monkeypatch.setattr(app_module, "turn_writer", FailingWriter())
+    monkeypatch.setattr(app_module, "jobs", Recording("jobs"))
+    monkeypatch.setattr(app_module, "hashing", Recording("hashing"))
+    monkeypatch.setattr(app_module.db, "close_pool", lambda: done.append("pool"))
+
+    app_module.shutdown(drain_timeout=0)
+    assert done == ["jobs", "hashing", "pool"]
+
+
+def test_stream_reports_a_turn_that_could_not_be_saved(monkeypatch):
+    def failing_save(*args, **kwargs):
+        raise RuntimeError("database unreachable")
+
+    monkeypatch.setattr(app_module, "build_prompt", lambda email, session_id, text: [])
+    monkeypatch.setattr(app_module, "stream_bot_response", lambda messages: iter(["Hello", " there"]))
+    monkeypatch.setattr(app_module, "save_turn", failing_save)
+
+    events = list(app_module._stream_reply("owner@example.com", "hi", "s1"))
+    assert events[:2] == [
+        app_module.sse_event("token", {"text": "Hello"}),
+        app_module.sse_event("token", {"text": " there"}),
+    ]
+    assert events[-1] == app_module.sse_event(
+        "error", {"reply": "Hello there", "error": app_module.SAVE_FAILED_NOTICE}
+    )
+
+
+def test_only_replies_from_the_default_endpoint_are_cached(app, monkeypatch):
+    def endpoint(name, **client_kwargs):
+        return Endpoint(name, LLMGateway(FakeClient(**client_kwargs), max_retries=0), model=f"{name}-model")
+
+    cache = ResponseCache(LocalBackend())
+    monkeypatch.setattr(app_module, "response_cache", cache)
+    prompt = [{"role": "system", "content": "be kind"}, {"role": "user", "content": "hello"}]
+    with app.app_context():
+        slow = endpoint("primary", content="primary reply", latency=1.0)
+        app.extensions["llm_router"] = ModelRouter([slow, endpoint("backup", content="backup reply")], slo_complete=0.05)
+        key = app_module.cache_key(prompt)
+        assert app_module.complete_chat(prompt) == "backup reply"
+        assert cache.get(key) is None
+
+        app.extensions["llm_router"] = ModelRouter([endpoint("primary", content="primary reply")], slo_complete=0)
+        assert app_module.complete_chat(prompt) == "primary reply"
+        assert cache.get(key) == "primary reply"
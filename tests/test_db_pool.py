@@ -0,0 +1,113 @@
+"""ConnectionPool checkout limits, timeouts and health checks, with fake connections."""
+
+import threading
+import time
+
+import psycopg2
+import pytest
+
+from db import ConnectionPool, PoolTimeout
+from fakes import FakeConnection
+
+
+class FakePool(ConnectionPool):
+    def __init__(self, *args, fail_connect=False, **kwargs):
+        self.opened = []
+        self.fail_connect = fail_connect
+        super().__init__(*args, **kwargs)
+
+    def _connect(self):
+        if self.fail_connect:
+            raise psycopg2.OperationalError("could not connect to server")
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+
+def test_checkout_times_out_when_every_connection_is_in_use():
+    pool = FakePool(minconn=0, maxconn=1, timeout=0.1)
+    held = pool.getconn()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert time.monotonic() - started >= 0.1
+    stats = pool.stats()
+    assert (stats["timeouts"], stats["waits"], stats["in_use"], stats["waiting"]) == (1, 1, 1, 0)
+    pool.putconn(held)
+
+
+def test_waiter_gets_the_returned_connection():
+    pool = FakePool(minconn=0, maxconn=1, timeout=2)
+    held = pool.getconn()
+    threading.Timer(0.05, pool.putconn, args=(held,)).start()
+    assert pool.getconn() is held
+    assert len(pool.opened) == 1
+
+
+def test_pool_never_opens_more_than_maxconn():
+    pool = FakePool(minconn=0, maxconn=3, timeout=2)
+    peak = []
+
+    def worker():
+        for _ in range(20):
+            conn = pool.getconn()
+            peak.append(pool.stats()["in_use"])
+            pool.putconn(conn)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(pool.opened) <= 3
+    assert max(peak) <= 3
+    assert pool.stats()["in_use"] == 0
+
+
+def test_stale_connection_is_replaced_after_failed_health_check():
+    pool = FakePool(minconn=1, maxconn=1, health_check_interval=0)
+    stale = pool.opened[0]
+    stale.broken = True
+    conn = pool.getconn()
+    assert conn is not stale and stale.closed
+    assert pool.stats()["health_check_failures"] == 1
+    assert pool.stats()["open"] == 1
+
+
+def test_recently_used_connection_skips_the_health_check():
+    pool = FakePool(minconn=1, maxconn=1, health_check_interval=60)
+    conn = pool.getconn()
+    assert conn.executed == []
+
+
+def test_failed_connect_gives_the_slot_back():
+    pool = FakePool(minconn=0, maxconn=1, timeout=0.1, fail_connect=True)
+    for _ in range(2):
+        with pytest.raises(psycopg2.OperationalError):
+            pool.getconn()
+    assert pool.stats()["open"] == 0
+
+
+def test_connection_lost_mid_block_is_discarded():
+    pool = FakePool(minconn=0, maxconn=1)
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection() as conn:
+            raise psycopg2.OperationalError("terminating connection")
+    assert conn.closed
+    assert pool.stats()["open"] == 0
+
+
+def test_open_transaction_is_rolled_back_on_return():
+    pool = FakePool(minconn=0, maxconn=1)
+    conn = pool.getconn()
+    conn.cursor().execute("SELECT 1")
+    pool.putconn(conn)
+    assert conn.rollbacks == 1 and not conn.closed
+
+
+def test_closed_pool_refuses_checkouts():
+    pool = FakePool(minconn=1, maxconn=1)
+    pool.closeall()
+    assert pool.opened[0].closed
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
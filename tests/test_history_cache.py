@@ -0,0 +1,148 @@
+"""Prompt history cached per worker stays in step with turns written by other workers."""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app as app_module
+from chat_context import HistoryCache
+
+SESSION = "11111111-1111-1111-1111-111111111111"
+EMAIL = "a@example.com"
+
+
+class Store:
+    """The shared database: chat_sessions, conversation_summaries and conversations."""
+
+    def __init__(self):
+        self.sessions = {}  # id -> last_message_at
+        self.summaries = {}  # id -> (summary, summarized_through_id)
+        self.messages = []  # (id, session_id, sender, message)
+        self.history_reads = 0
+        self.clock = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def write_turn(self, session_id, user_message, bot_reply):
+        self.clock += timedelta(seconds=1)
+        for sender, message in (("user", user_message), ("bot", bot_reply)):
+            self.messages.append((len(self.messages) + 1, session_id, sender, message))
+        self.sessions[session_id] = max(self.sessions.get(session_id, self.clock), self.clock)
+        return self.clock
+
+    def delete(self, session_id):
+        self.sessions.pop(session_id, None)
+        self.messages = [m for m in self.messages if m[1] != session_id]
+
+
+class Cursor:
+    def __init__(self, store):
+        self.store = store
+        self._rows = []
+
+    def execute(self, query, params=None):
+        if "FROM chat_sessions s" in query:
+            session_id = params[0]
+            if session_id in self.store.sessions:
+                through = self.store.summaries.get(session_id, (None, 0))[1]
+                self._rows = [(self.store.sessions[session_id], through)]
+            else:
+                self._rows = []
+        elif "FROM conversation_summaries" in query:
+            row = self.store.summaries.get(params[0])
+            self._rows = [row] if row else []
+        elif "SELECT sender, message" in query:
+            self.store.history_reads += 1
+            _, session_id, through_id, _, limit = params
+            rows = [(s, m) for i, sid, s, m in self.store.messages if sid == session_id and i > through_id]
+            self._rows = list(reversed(rows))[:limit]
+        else:
+            raise AssertionError(f"unexpected query: {query}")
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeTurnWriter:
+    def __init__(self, store):
+        self.store = store
+
+    def save(self, email, session_id, user_message, bot_reply, durable=False):
+        return self.store.write_turn(session_id, user_message, bot_reply)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = Store()
+
+    @contextmanager
+    def fake_cursor():
+        yield Cursor(store)
+
+    monkeypatch.setattr(app_module.db, "cursor", fake_cursor)
+    monkeypatch.setattr(app_module, "turn_writer", FakeTurnWriter(store))
+    return store
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    """Two app instances, each with the process-local history cache of its own worker."""
+    apps = {name: (app_module.create_app({"TESTING": True}), HistoryCache()) for name in ("a", "b")}
+
+    @contextmanager
+    def worker(name):
+        app, cache = apps[name]
+        with monkeypatch.context() as patch:
+            patch.setattr(app_module, "history_cache", cache)
+            with app.app_context():
+                yield
+
+    return worker
+
+
+def recent(worker):
+    with worker:
+        return app_module.get_recent_turns(EMAIL, SESSION)
+
+
+def save(worker, user_message, bot_reply):
+    with worker:
+        app_module.save_turn(EMAIL, SESSION, user_message, bot_reply)
+
+
+def test_own_turns_are_served_from_cache(store, workers):
+    recent(workers("a"))
+    save(workers("a"), "hi", "hello")
+    reads = store.history_reads
+    assert recent(workers("a")) == (None, [("user", "hi"), ("assistant", "hello")])
+    assert store.history_reads == reads
+
+
+def test_turns_written_by_another_worker_are_picked_up(store, workers):
+    save(workers("a"), "first", "reply 1")
+    recent(workers("a"))
+    save(workers("b"), "second", "reply 2")
+
+    _, turns = recent(workers("a"))
+    assert turns[-2:] == [("user", "second"), ("assistant", "reply 2")]
+
+
+def test_summary_written_elsewhere_replaces_cached_history(store, workers):
+    save(workers("a"), "first", "reply 1")
+    save(workers("a"), "second", "reply 2")
+    recent(workers("a"))
+    store.summaries[SESSION] = ("They said hello.", 2)
+
+    summary, turns = recent(workers("a"))
+    assert summary == "They said hello."
+    assert turns == [("user", "second"), ("assistant", "reply 2")]
+
+
+def test_chat_deleted_by_another_worker_is_not_sent_again(store, workers):
+    save(workers("a"), "private", "reply")
+    recent(workers("a"))
+    store.delete(SESSION)  # delete_chat on worker b
+
+    assert recent(workers("a")) == (None, [])
@@ -0,0 +1,197 @@
+"""JobQueue retries, backoff and dead-lettering, and mail delivery through it."""
+
+import socket
+import threading
+from functools import partial
+
+import pytest
+
+import jobs
+from bench import smtp_sink
+from fakes import wait_for
+from jobs import JobQueue
+
+
+class Flaky:
+    """Handler that raises for the first ``failures`` calls."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, **payload):
+        with self._lock:
+            self.calls.append(payload)
+            if len(self.calls) <= self.failures:
+                raise RuntimeError(f"failure {len(self.calls)}")
+
+
+class DeadLetters(list):
+    def __call__(self, name, payload, error, attempts):
+        self.append((name, payload, error, attempts))
+
+
+@pytest.fixture
+def dead():
+    return DeadLetters()
+
+
+def test_failed_job_is_retried_until_it_succeeds(dead):
+    queue = JobQueue(workers=1, max_attempts=5, backoff_base=0.01, dead_letter=dead)
+    handler = Flaky(failures=2)
+    queue.register("flaky", handler)
+    queue.enqueue("flaky", value=1)
+
+    assert wait_for(lambda: queue.stats()["succeeded"] == 1)
+    assert handler.calls == [{"value": 1}] * 3
+    assert queue.stats()["retried"] == 2
+    assert dead == []
+    queue.shutdown()
+
+
+def test_retries_back_off_exponentially(monkeypatch, dead):
+    delays = []
+
+    class ImmediateTimer:
+        def __init__(self, delay, function, args=()):
+            delays.append(delay)
+            self.function, self.args = function, args
+            self.daemon = False
+
+        def start(self):
+            self.function(*self.args)
+
+        def is_alive(self):
+            return False
+
+        def cancel(self):
+            pass
+
+    monkeypatch.setattr(jobs.threading, "Timer", ImmediateTimer)
+    queue = JobQueue(workers=1, max_attempts=4, backoff_base=2.0, dead_letter=dead)
+    queue.register("always_fails", Flaky(failures=10))
+    queue.enqueue("always_fails")
+
+    assert wait_for(lambda: queue.stats()["dead"] == 1)
+    assert delays == [2.0, 4.0, 8.0]
+    queue.shutdown()
+
+
+def test_job_is_dead_lettered_after_max_attempts(dead):
+    queue = JobQueue(workers=2, max_attempts=3, backoff_base=0.01, dead_letter=dead)
+    handler = Flaky(failures=10)
+    queue.register("always_fails", handler)
+    queue.enqueue("always_fails", recipient="a@example.com")
+
+    assert wait_for(lambda: len(dead) == 1)
+    name, payload, error, attempts = dead[0]
+    assert (name, payload, attempts) == ("always_fails", {"recipient": "a@example.com"}, 3)
+    assert "failure 3" in error
+    assert len(handler.calls) == 3
+    assert queue.stats()["dead"] == 1
+    queue.shutdown()
+
+
+def test_dead_letter_failure_does_not_kill_the_worker():
+    def broken_dead_letter(*args):
+        raise RuntimeError("database down")
+
+    queue = JobQueue(workers=1, max_attempts=1, dead_letter=broken_dead_letter)
+    queue.register("always_fails", Flaky(failures=10))
+    ok = Flaky(failures=0)
+    queue.register("ok", ok)
+    queue.enqueue("always_fails")
+    queue.enqueue("ok")
+
+    assert wait_for(lambda: len(ok.calls) == 1)
+    queue.shutdown()
+
+
+def test_shutdown_runs_pending_retries_once_more(dead):
+    queue = JobQueue(workers=1, max_attempts=5, backoff_base=60.0, dead_letter=dead)
+    handler = Flaky(failures=1)
+    queue.register("flaky", handler)
+    queue.enqueue("flaky")
+    assert wait_for(lambda: queue.stats()["retried"] == 1)
+
+    queue.shutdown(timeout=5)
+    assert len(handler.calls) == 2
+    assert queue.stats()["succeeded"] == 1
+
+
+def test_unknown_job_is_rejected():
+    with pytest.raises(KeyError):
+        JobQueue().enqueue("nope")
+
+
+# ----------------------------- Mail -----------------------------
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _mail_app(port: int):
+    import app as app_module
+
+    return app_module, app_module.create_app(
+        {
+            "MAIL_SERVER": "127.0.0.1",
+            "MAIL_PORT": port,
+            "MAIL_USE_TLS": False,
+            "MAIL_USERNAME": "cogi@example.com",
+            "MAIL_PASSWORD": None,
+        }
+    )
+
+
+def test_mail_job_delivers_to_smtp_server(dead):
+    sink = smtp_sink.start()
+    try:
+        app_module, app = _mail_app(sink.server_address[1])
+        queue = JobQueue(workers=1, max_attempts=3, backoff_base=0.01, dead_letter=dead)
+        queue.register("send_email", partial(app_module.send_email, app))
+        for i in range(3):
+            queue.enqueue("send_email", subject=f"Hello {i}", recipient="user@example.com", body="Welcome to Cogi")
+
+        assert wait_for(lambda: sink.messages == 3)
+        assert queue.stats()["succeeded"] == 3
+        assert dead == []
+        queue.shutdown()
+    finally:
+        sink.shutdown()
+        sink.server_close()
+
+
+def test_mail_job_retries_until_smtp_server_is_up(dead):
+    port = _free_port()
+    app_module, app = _mail_app(port)
+    queue = JobQueue(workers=1, max_attempts=10, backoff_base=1.2, dead_letter=dead)
+    queue.register("send_email", partial(app_module.send_email, app))
+    queue.enqueue("send_email", subject="Reset", recipient="user@example.com", body="link")
+
+    assert wait_for(lambda: queue.stats()["retried"] >= 1)
+    sink = smtp_sink.start(port=port)
+    try:
+        assert wait_for(lambda: sink.messages == 1, timeout=15)
+        assert dead == []
+    finally:
+        queue.shutdown()
+        sink.shutdown()
+        sink.server_close()
+
+
+def test_undeliverable_mail_is_dead_lettered(dead):
+    app_module, app = _mail_app(_free_port())  # nothing listens there
+    queue = JobQueue(workers=1, max_attempts=2, backoff_base=0.01, dead_letter=dead)
+    queue.register("send_email", partial(app_module.send_email, app))
+    queue.enqueue("send_email", subject="Confirm", recipient="user@example.com", body="link")
+
+    assert wait_for(lambda: len(dead) == 1)
+    name, payload, error, attempts = dead[0]
+    assert name == "send_email" and payload["recipient"] == "user@example.com" and attempts == 2
+    assert "Connection" in error or "refused" in error.lower()
+    queue.shutdown()
@@ -0,0 +1,145 @@
+"""CircuitBreaker transitions and LLMGateway failure paths, with fake clients."""
+
+import threading
+import time
+
+import openai
+import pytest
+
+from fakes import FakeClient
+from llm_gateway import CircuitBreaker, CircuitOpen, GatewayBusy, GatewayError, GatewayTimeout, LLMGateway
+
+
+def connection_error():
+    # The request is only used for the message; none is needed here.
+    return openai.APIConnectionError(request=None)
+
+
+def open_breaker(reset_timeout=0.05) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_threshold_and_allows_one_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # one trial at a time
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+
+def test_busy_gateway_gives_back_the_half_open_trial():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    gateway = LLMGateway(FakeClient(), max_in_flight=1, queue_timeout=0.05, breaker=breaker)
+    gateway._slots.acquire()  # another call holds the only slot
+    with pytest.raises(GatewayBusy):
+        gateway.complete(model="m", messages=[])
+    gateway._slots.release()
+
+    assert gateway.complete(model="m", messages=[]) == "hello there"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_empty_completion_is_a_gateway_error():
+    gateway = LLMGateway(FakeClient(content=None))
+    with pytest.raises(GatewayError, match="no content"):
+        gateway.complete(model="m", messages=[])
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_transient_errors_are_retried_then_open_the_breaker():
+    client = FakeClient(error=connection_error())
+    gateway = LLMGateway(
+        client, max_retries=2, backoff_base=0.001, breaker=CircuitBreaker(failure_threshold=1)
+    )
+    with pytest.raises(GatewayError):
+        gateway.complete(model="m", messages=[])
+    assert client.calls == 3
+    with pytest.raises(CircuitOpen):
+        gateway.complete(model="m", messages=[])
+    assert client.calls == 3
+
+
+def test_client_errors_are_not_retried_and_keep_the_breaker_closed():
+    client = FakeClient(error=openai.OpenAIError("bad request"))
+    gateway = LLMGateway(client, breaker=CircuitBreaker(failure_threshold=1))
+    with pytest.raises(GatewayError):
+        gateway.complete(model="m", messages=[])
+    assert client.calls == 1
+    assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_unexpected_client_exception_settles_the_trial():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    gateway = LLMGateway(FakeClient(error=ValueError("malformed response")), breaker=breaker)
+    with pytest.raises(GatewayError):
+        gateway.complete(model="m", messages=[])
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+    assert breaker.allow()  # a new trial is possible, the old one did not leak
+
+
+def test_deadline_covers_all_retries():
+    gateway = LLMGateway(
+        FakeClient(latency=0.05, error=connection_error()), timeout=0.1, max_retries=10, backoff_base=0.04
+    )
+    started = time.monotonic()
+    with pytest.raises(GatewayError):
+        gateway.complete(model="m", messages=[])
+    assert time.monotonic() - started < 0.5
+
+
+def test_timeout_when_deadline_is_already_spent():
+    gateway = LLMGateway(FakeClient(), timeout=0)
+    with pytest.raises(GatewayTimeout):
+        gateway.complete(model="m", messages=[])
+
+
+def test_stream_closed_by_consumer_releases_slot_and_trial():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    gateway = LLMGateway(FakeClient(content="one two three"), max_in_flight=1, breaker=breaker)
+    deltas = gateway.stream(model="m", messages=[])
+    assert next(deltas) == "one"
+    deltas.close()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_stream_error_mid_reply_is_a_gateway_error():
+    gateway = LLMGateway(FakeClient(content="one two", stream_error=ConnectionResetError("reset")))
+    deltas = gateway.stream(model="m", messages=[])
+    assert next(deltas) == "one"
+    with pytest.raises(GatewayError):
+        next(deltas)
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_drain_waits_for_in_flight_calls_and_refuses_new_ones():
+    gateway = LLMGateway(FakeClient(latency=0.1))
+    worker = threading.Thread(target=gateway.complete, kwargs={"model": "m", "messages": []})
+    worker.start()
+    time.sleep(0.02)
+    assert gateway.drain(timeout=2)
+    with pytest.raises(GatewayBusy):
+        gateway.complete(model="m", messages=[])
+    worker.join()
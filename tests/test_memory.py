@@ -0,0 +1,72 @@
+"""Memory index jobs on a temporary directory, with the database stubbed out."""
+
+from contextlib import contextmanager
+
+import pytest
+
+import memory
+from memory import HashingEmbedder, MemoryStore
+
+
+class Rows:
+    """Cursor returning ``batches`` one execute() at a time."""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self._rows = []
+
+    def execute(self, query, params=None):
+        self._rows = self.batches.pop(0) if self.batches else []
+
+    def fetchall(self):
+        return self._rows
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MemoryStore(HashingEmbedder(), str(tmp_path))
+
+
+def stub_db(monkeypatch, batches):
+    cursor = Rows(batches)
+
+    @contextmanager
+    def fake_cursor():
+        yield cursor
+
+    monkeypatch.setattr(memory.db, "cursor", fake_cursor)
+
+
+def test_backfill_for_user_without_messages_completes(store, monkeypatch):
+    stub_db(monkeypatch, [])
+    assert store.backfill("new@example.com") == 0
+    # Marked done: the second run does not query again.
+    stub_db(monkeypatch, [[(1, "s1", "should not be read")]])
+    assert store.backfill("new@example.com") == 0
+
+
+def test_backfill_indexes_earlier_messages(store, monkeypatch):
+    stub_db(monkeypatch, [[(1, "s1", "exams make me anxious"), (2, "s2", "I slept badly")], []])
+    assert store.backfill("a@example.com") == 2
+    hits = store._index("a@example.com").search(store.embedder.embed(["anxious about exams"])[0], 1)
+    assert hits[0][1] == "exams make me anxious"
+
+
+def test_forget_session_drops_its_rows_on_disk(store, tmp_path):
+    store.index_rows(
+        "a@example.com",
+        [[1, "s1", "exams make me anxious"], [2, "s2", "exams again"], [3, "s1", "sleep is hard"]],
+    )
+    store.forget_session("a@example.com", "s1")
+    assert len(store._index("a@example.com")) == 1
+
+    reopened = MemoryStore(HashingEmbedder(), str(tmp_path))
+    index = reopened._index("a@example.com")
+    assert len(index) == 1
+    assert index.search(reopened.embedder.embed(["exams"])[0], 5)[0][1] == "exams again"
+
+
+def test_forgetting_an_unknown_session_changes_nothing(store):
+    store.index_rows("a@example.com", [[1, "s1", "hello there"]])
+    store.forget_session("a@example.com", "missing")
+    assert len(store._index("a@example.com")) == 1
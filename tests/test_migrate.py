@@ -0,0 +1,65 @@
+"""Migration runner, with a fake connection and a temporary migrations directory."""
+
+import pytest
+
+import migrate
+from fakes import FakeConnection
+
+
+@pytest.fixture
+def migrations(tmp_path, monkeypatch):
+    monkeypatch.setattr(migrate, "MIGRATIONS_DIR", str(tmp_path))
+
+    def write(filename, sql):
+        (tmp_path / filename).write_text(sql, encoding="utf-8")
+
+    return write
+
+
+def test_no_transaction_migration_after_the_version_query(migrations):
+    # A database at 0001 upgrading to 0002, which must run outside a transaction.
+    migrations("0001_init.sql", "CREATE TABLE t (id int);")
+    migrations("0002_index.sql", "-- migrate: no-transaction\nCREATE INDEX CONCURRENTLY t_id ON t (id);")
+    with open(migrate.os.path.join(migrate.MIGRATIONS_DIR, "0001_init.sql"), encoding="utf-8") as f:
+        checksum = migrate.hashlib.sha256(f.read().encode("utf-8")).hexdigest()
+    conn = FakeConnection(results=[[], [("0001", checksum)]])
+
+    assert migrate.migrate(conn) == 1
+    assert "CREATE INDEX CONCURRENTLY t_id ON t (id)" in conn.executed
+    assert conn.autocommit is False
+
+
+def test_pending_migrations_run_in_order_with_their_record(migrations):
+    migrations("0002_second.sql", "SELECT 2;")
+    migrations("0001_first.sql", "SELECT 1;")
+    conn = FakeConnection()
+
+    assert migrate.migrate(conn) == 2
+    applied = [q for q in conn.executed if q.startswith("SELECT ") and "schema_migrations" not in q]
+    assert applied == ["SELECT 1;", "SELECT 2;"]
+
+
+def test_split_statements_skips_comments():
+    sql = "-- migrate: no-transaction\nCREATE INDEX a ON t (x);\n-- note\nCREATE INDEX b ON t (y);\n"
+    assert migrate.split_statements(sql) == ["CREATE INDEX a ON t (x)", "CREATE INDEX b ON t (y)"]
+
+
+def _search_plan(*conditions):
+    scans = [{"Node Type": "Bitmap Index Scan", "Index Cond": cond} for cond in conditions]
+    return [{"Plan": {"Node Type": "Bitmap Heap Scan", "Relation Name": "conversations_y2026m01", "Plans": scans}}]
+
+
+@pytest.mark.parametrize(
+    "conditions, ok",
+    [
+        (["((user_email)::text = 'a'::text) AND (search_vector @@ '''anxious'''::tsquery)"], True),
+        (["(search_vector @@ '''anxious'''::tsquery)"], False),
+        (["((user_email)::text = 'a'::text)", "(search_vector @@ '''anxious'''::tsquery)"], False),
+    ],
+)
+def test_check_requires_one_index_for_user_and_search(monkeypatch, conditions, ok):
+    search = [entry for entry in migrate.HOT_QUERIES if entry[0] == "message search"]
+    monkeypatch.setattr(migrate, "HOT_QUERIES", search)
+    conn = FakeConnection(results=[[], [(_search_plan(*conditions),)]])
+
+    assert migrate.check(conn) is ok
@@ -0,0 +1,93 @@
+"""ModelRouter hedging, fallback and failure handling against fake endpoints."""
+
+import time
+
+import pytest
+
+from fakes import FakeClient
+from llm_gateway import CircuitBreaker, GatewayError, GatewayTimeout, LLMGateway
+from model_router import Endpoint, ModelRouter
+
+
+def endpoint(name, **client_kwargs) -> Endpoint:
+    gateway = LLMGateway(FakeClient(**client_kwargs), max_retries=0, breaker=CircuitBreaker(failure_threshold=1))
+    return Endpoint(name, gateway, model=f"{name}-model")
+
+
+def test_complete_uses_the_first_endpoint_when_it_is_fast():
+    primary, backup = endpoint("primary", content="from primary"), endpoint("backup", content="from backup")
+    router = ModelRouter([primary, backup], slo_complete=1.0)
+    assert router.complete([{"role": "user", "content": "hi"}]) == "from primary"
+    assert backup.gateway.client.calls == 0
+
+
+def test_slow_endpoint_is_hedged_and_the_faster_reply_wins():
+    slow = endpoint("slow", content="slow reply", latency=1.0)
+    fast = endpoint("fast", content="fast reply", latency=0.01)
+    router = ModelRouter([slow, fast], slo_complete=0.05)
+    started = time.monotonic()
+    assert router.complete([]) == "fast reply"
+    assert time.monotonic() - started < 0.5
+    assert router.counters["hedged"] == 1 and router.counters["hedge_won"] == 1
+
+
+def test_hedged_stream_switches_to_the_first_token():
+    slow = endpoint("slow", content="slow reply", latency=1.0)
+    fast = endpoint("fast", content="fast reply")
+    router = ModelRouter([slow, fast], slo_first_token=0.05)
+    assert list(router.stream([])) == ["fast", "reply"]
+
+
+def test_failing_endpoint_falls_back_and_is_ranked_last():
+    broken = endpoint("broken", error=ConnectionError("refused"))
+    healthy = endpoint("healthy", content="ok")
+    router = ModelRouter([broken, healthy], slo_complete=0)
+    assert router.complete([]) == "ok"
+    assert router.counters["fallbacks"] == 1
+    assert [e.name for e in router.ranked("complete")] == ["healthy", "broken"]
+
+
+def test_all_endpoints_failing_raises_gateway_error():
+    router = ModelRouter([endpoint("a", error=ConnectionError("a")), endpoint("b", error=ConnectionError("b"))])
+    with pytest.raises(GatewayError):
+        router.complete([])
+
+
+def test_empty_completion_is_an_error_not_a_hang():
+    router = ModelRouter([endpoint("a", content=None)], timeout=5)
+    started = time.monotonic()
+    with pytest.raises(GatewayError):
+        router.complete([])
+    assert time.monotonic() - started < 1
+
+
+def test_raw_error_mid_stream_reaches_the_caller():
+    router = ModelRouter([endpoint("a", content="one two", stream_error=ConnectionResetError("reset"))], timeout=5)
+    deltas = router.stream([])
+    assert next(deltas) == "one"
+    with pytest.raises(GatewayError):
+        next(deltas)
+
+
+def test_unresponsive_endpoint_is_bounded_by_the_route_timeout():
+    router = ModelRouter([endpoint("stuck", latency=5)], slo_complete=0, timeout=0.2)
+    started = time.monotonic()
+    with pytest.raises(GatewayTimeout):
+        router.complete([])
+    assert time.monotonic() - started < 1
+
+
+def test_open_circuit_goes_last():
+    first, second = endpoint("first"), endpoint("second")
+    first.gateway.breaker.record_failure()
+    router = ModelRouter([first, second])
+    assert [e.name for e in router.ranked("stream")] == ["second", "first"]
+
+
+def test_stats_report_circuit_open_only_when_every_endpoint_is():
+    first, second = endpoint("first"), endpoint("second")
+    router = ModelRouter([first, second])
+    first.gateway.breaker.record_failure()
+    assert router.stats()["circuit"] == "closed"
+    second.gateway.breaker.record_failure()
+    assert router.stats()["circuit"] == "open"
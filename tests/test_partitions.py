@@ -0,0 +1,62 @@
+"""Archiving retries around the short detach transaction."""
+
+from datetime import datetime, timezone
+
+import psycopg2.errors
+import pytest
+
+import partitions
+from fakes import FakeConnection
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def steps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(partitions.time, "sleep", lambda seconds: None)
+
+    def export(conn, name, path):
+        calls.append("export")
+        return 10 + calls.count("export")
+
+    monkeypatch.setattr(partitions, "_export_partition", export)
+    return calls
+
+
+def detach_failing_with(steps, monkeypatch, errors):
+    errors = list(errors)
+
+    def detach(conn, name, start, path, row_count):
+        steps.append(("detach", row_count))
+        if errors:
+            raise errors.pop(0)
+
+    monkeypatch.setattr(partitions, "_detach_partition", detach)
+
+
+def test_export_happens_before_detach(steps, monkeypatch, tmp_path):
+    detach_failing_with(steps, monkeypatch, [])
+    assert partitions.archive_partition(FakeConnection(), "conversations_y2024m01", START, str(tmp_path)) == 11
+    assert steps == ["export", ("detach", 11)]
+
+
+def test_lock_timeout_retries_the_detach_only(steps, monkeypatch, tmp_path):
+    detach_failing_with(steps, monkeypatch, [psycopg2.errors.LockNotAvailable()])
+    conn = FakeConnection()
+    partitions.archive_partition(conn, "conversations_y2024m01", START, str(tmp_path))
+    assert steps == ["export", ("detach", 11), ("detach", 11)]
+    assert conn.rollbacks == 1
+
+
+def test_rows_written_after_export_cause_a_new_export(steps, monkeypatch, tmp_path):
+    detach_failing_with(steps, monkeypatch, [partitions.ArchiveChanged("conversations_y2024m01")])
+    assert partitions.archive_partition(FakeConnection(), "conversations_y2024m01", START, str(tmp_path)) == 12
+    assert steps == ["export", ("detach", 11), "export", ("detach", 12)]
+
+
+def test_gives_up_after_repeated_lock_timeouts(steps, monkeypatch, tmp_path):
+    errors = [psycopg2.errors.LockNotAvailable() for _ in range(partitions.DETACH_ATTEMPTS)]
+    detach_failing_with(steps, monkeypatch, errors)
+    with pytest.raises(psycopg2.errors.LockNotAvailable):
+        partitions.archive_partition(FakeConnection(), "conversations_y2024m01", START, str(tmp_path))
@@ -0,0 +1,76 @@
+"""Sliding-window limiter on the in-process backend."""
+
+import threading
+import time
+import types
+
+import rate_limit
+from rate_limit import LocalWindowBackend, SlidingWindowLimiter
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def limiter(monkeypatch, limit=3, window=60.0, backend=None):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "time", types.SimpleNamespace(time=clock.time))
+    return SlidingWindowLimiter(limit, window, backend), clock
+
+
+def test_key_is_limited_once_the_limit_is_reached(monkeypatch):
+    limit, clock = limiter(monkeypatch)
+    for expected in (1, 2):
+        assert limit.hit("login:acct:a") == expected
+        assert not limit.is_limited("login:acct:a")
+    limit.hit("login:acct:a")
+    assert limit.is_limited("login:acct:a")
+    assert not limit.is_limited("login:acct:b")
+
+
+def test_block_lifts_as_events_age_out(monkeypatch):
+    limit, clock = limiter(monkeypatch)
+    for _ in range(3):
+        limit.hit("k")
+        clock.now += 10
+    assert limit.is_limited("k")
+    clock.now += 31  # the first event is now older than the window
+    assert not limit.is_limited("k")
+    assert limit.hit("k") == 3
+
+
+def test_reset_clears_the_key(monkeypatch):
+    limit, clock = limiter(monkeypatch)
+    for _ in range(3):
+        limit.hit("k")
+    limit.reset("k")
+    assert not limit.is_limited("k")
+
+
+def test_concurrent_hits_are_all_counted():
+    backend = LocalWindowBackend()
+    limit = SlidingWindowLimiter(10_000, 3600, backend)
+
+    def worker():
+        for _ in range(250):
+            limit.hit("k")
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert backend.count("k", time.time(), 3600) == 2000
+
+
+def test_backend_forgets_the_stalest_key_when_full():
+    backend = LocalWindowBackend(max_keys=2)
+    backend.add("a", 1.0, 60)
+    backend.add("b", 2.0, 60)
+    backend.add("c", 3.0, 60)
+    assert backend.count("a", 3.0, 60) == 0
+    assert backend.count("b", 3.0, 60) == 1 and backend.count("c", 3.0, 60) == 1
@@ -0,0 +1,99 @@
+"""Server-side sessions: ids are renewed when privileges change, idle sessions expire."""
+
+import time
+from datetime import timedelta
+
+import pytest
+from flask import Flask, session
+
+from session_store import ServerSessionInterface
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.permanent_session_lifetime = timedelta(minutes=10)
+    app.session_interface = ServerSessionInterface(touch_interval=60, sweep_interval=3600)
+
+    @app.route("/visit")
+    def visit():
+        session["seen"] = True
+        return "ok"
+
+    @app.route("/login")
+    def login():
+        session.regenerate()
+        session["user"] = "a@example.com"
+        return "ok"
+
+    @app.route("/me")
+    def me():
+        return session.get("user", "anonymous")
+
+    @app.route("/logout")
+    def logout():
+        session.clear()
+        session.regenerate()
+        return "ok"
+
+    return app
+
+
+def sid(client):
+    cookie = client.get_cookie("session")
+    return cookie.value if cookie else None
+
+
+def test_login_issues_a_new_session_id(app):
+    client = app.test_client()
+    backend = app.session_interface.backend
+    client.get("/visit")
+    planted = sid(client)
+
+    client.get("/login")
+    assert sid(client) != planted
+    assert backend.load(planted) is None
+    assert client.get("/me").text == "a@example.com"
+
+
+def test_fixated_id_does_not_become_logged_in(app):
+    attacker = app.test_client()
+    attacker.get("/visit")
+    planted = sid(attacker)
+
+    victim = app.test_client()
+    victim.set_cookie("session", planted)
+    victim.get("/login")
+
+    attacker.set_cookie("session", planted)
+    assert attacker.get("/me").text == "anonymous"
+
+
+def test_logout_deletes_the_record_and_cookie(app):
+    client = app.test_client()
+    client.get("/login")
+    logged_in = sid(client)
+    client.get("/logout")
+    assert sid(client) is None
+    assert app.session_interface.backend.load(logged_in) is None
+    assert len(app.session_interface.backend) == 0
+
+
+def test_idle_session_expires(app):
+    client = app.test_client()
+    client.get("/login")
+    backend = app.session_interface.backend
+    data, _ = backend.load(sid(client))
+    backend.save(sid(client), data, time.time() - 3600, 600)
+    assert client.get("/me").text == "anonymous"
+    assert app.session_interface.counters["expired"] == 1
+
+
+def test_unchanged_session_is_not_rewritten(app):
+    client = app.test_client()
+    client.get("/login")
+    writes = app.session_interface.counters["writes"]
+    client.get("/me")
+    client.get("/me")
+    assert app.session_interface.counters["writes"] == writes
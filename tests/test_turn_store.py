@@ -0,0 +1,100 @@
+"""TurnWriter write-behind: batching, interval flushes, failures and close."""
+
+import threading
+
+import pytest
+
+from fakes import wait_for
+from turn_store import TurnWriter
+
+
+class Recorder:
+    """Replaces TurnWriter._write; fails while ``failing`` is set."""
+
+    def __init__(self):
+        self.batches = []
+        self.failing = False
+        self._lock = threading.Lock()
+
+    def __call__(self, turns):
+        if self.failing:
+            raise ConnectionError("database unavailable")
+        with self._lock:
+            self.batches.append([turn[2] for turn in turns])
+
+    @property
+    def messages(self):
+        with self._lock:
+            return [message for batch in self.batches for message in batch]
+
+
+def writer(**kwargs):
+    turn_writer = TurnWriter(**kwargs)
+    recorder = turn_writer._write = Recorder()
+    return turn_writer, recorder
+
+
+def test_unbuffered_writer_writes_every_turn_immediately():
+    turn_writer, recorder = writer(batch_size=0)
+    turn_writer.save("a@example.com", "s1", "hi", "hello")
+    assert recorder.batches == [["hi"]]
+
+
+def test_full_batch_is_flushed_by_the_background_thread():
+    turn_writer, recorder = writer(batch_size=3, flush_interval=30)
+    for i in range(3):
+        turn_writer.save("a@example.com", "s1", f"m{i}", "reply")
+    assert wait_for(lambda: recorder.batches == [["m0", "m1", "m2"]])
+    turn_writer.close()
+
+
+def test_partial_batch_is_flushed_after_the_interval():
+    turn_writer, recorder = writer(batch_size=100, flush_interval=0.05)
+    turn_writer.save("a@example.com", "s1", "only", "reply")
+    assert wait_for(lambda: recorder.messages == ["only"], timeout=2)
+    turn_writer.close()
+
+
+def test_durable_save_is_written_before_returning():
+    turn_writer, recorder = writer(batch_size=100, flush_interval=30)
+    turn_writer.save("a@example.com", "s1", "buffered", "reply")
+    turn_writer.save("a@example.com", "s1", "durable", "reply", durable=True)
+    assert recorder.messages == ["buffered", "durable"]
+    turn_writer.close()
+
+
+def test_failed_flush_keeps_turns_queued_in_order():
+    turn_writer, recorder = writer(batch_size=100, flush_interval=30)
+    turn_writer.save("a@example.com", "s1", "first", "reply")
+    recorder.failing = True
+    with pytest.raises(ConnectionError):
+        turn_writer.flush()
+    turn_writer.save("a@example.com", "s1", "second", "reply")
+    assert turn_writer.pending() == 2
+
+    recorder.failing = False
+    turn_writer.flush()
+    assert recorder.messages == ["first", "second"]
+    assert turn_writer.pending() == 0
+    turn_writer.close()
+
+
+def test_overflowing_buffer_writes_synchronously_and_surfaces_errors():
+    turn_writer, recorder = writer(batch_size=100, flush_interval=30, max_buffer=2)
+    recorder.failing = True
+    turn_writer.save("a@example.com", "s1", "m0", "reply")
+    turn_writer.save("a@example.com", "s1", "m1", "reply")
+    with pytest.raises(ConnectionError):
+        turn_writer.save("a@example.com", "s1", "m2", "reply")
+    recorder.failing = False
+    turn_writer.close()
+    assert recorder.messages == ["m0", "m1"]
+
+
+def test_close_writes_what_is_left_and_later_saves_go_straight_through():
+    turn_writer, recorder = writer(batch_size=100, flush_interval=30)
+    turn_writer.save("a@example.com", "s1", "pending", "reply")
+    turn_writer.close()
+    assert recorder.messages == ["pending"]
+    turn_writer.save("a@example.com", "s1", "after close", "reply")
+    assert recorder.messages == ["pending", "after close"]
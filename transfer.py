@@ -0,0 +1,404 @@
+"""
+Bulk export and import of users and conversations.
+
+Exports stream one user's messages (every session, or a single one) as
+NDJSON or CSV. Rows come from a server-side cursor ``EXPORT_CHUNK_ROWS`` at a
+time, so memory stays flat however long the history is. The same generator
+backs the ``/export`` endpoint and the CLI. A download lasts as long as the
+client takes to read it, so the cursor runs on a connection of its own
+rather than one from the request pool. The endpoint allows at most
+``EXPORT_MAX_CONCURRENT`` downloads per process (``export_slots``). Months that were archived (see
+partitions.py) are not included until the session is restored.
+
+Imports stream a JSON, NDJSON or CSV file into a temporary staging table
+with ``COPY``. A few set-based statements then move the rows into place:
+
+* users: e-mails are lowercased, as the app does at sign-up; new ones are
+  inserted, existing ones are skipped, or updated with ``--on-conflict update``. Passwords must already be hashed and are
+  never overwritten;
+* conversations: messages of unknown users, of sessions owned by someone
+  else, and exact duplicates of stored messages (same session, timestamp,
+  sender and text) are skipped. ``chat_sessions`` is created or widened, and
+  monthly partitions are created for the imported range.
+
+Everything happens in one transaction: a failed import leaves no trace.
+Conversation files use the export's columns, so an export can be imported
+into another database. ``users.json`` in the old ``{email: {...}}`` layout is
+accepted too.
+
+Usage:
+    python transfer.py export <email> [--format ndjson|csv] [--session <id>] [--output <path>]
+    python transfer.py import users <file> [--on-conflict skip|update]
+    python transfer.py import conversations <file>
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import db
+import partitions
+
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", 1000))
+EXPORT_MAX_CONCURRENT = int(os.environ.get("EXPORT_MAX_CONCURRENT", 4))
+export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+PROGRESS_EVERY = 100_000
+
+EXPORT_COLUMNS = ["user_email", "session_id", "title", "id", "sender", "message", "timestamp"]
+USER_COLUMNS = ["email", "password", "first_name", "last_name", "gender", "dob", "confirmed"]
+CONVERSATION_COLUMNS = ["user_email", "session_id", "title", "sender", "message", "timestamp"]
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+# ----------------------------- Export -----------------------------
+
+def export_rows(email: str, session_id: str = None, chunk_size: int = EXPORT_CHUNK_ROWS):
+    """Yield the user's messages as dicts, session by session, oldest message first."""
+    query = """
+        SELECT c.user_email, c.session_id, s.title, c.id, c.sender, c.message, c."timestamp"
+        FROM conversations c
+        JOIN chat_sessions s ON s.id = c.session_id
+        WHERE c.user_email = %s
+    """
+    params = [email]
+    if session_id:
+        query += " AND c.session_id = %s"
+        params.append(session_id)
+    # Backward scan of conversations_user_session_ts_id_idx.
+    query += ' ORDER BY c.session_id DESC, c."timestamp", c.id'
+    with db.dedicated_connection() as conn:
+        with conn.cursor(name="cogi_export") as cur:
+            cur.itersize = chunk_size
+            cur.execute(query, params)
+            for row in cur:
+                record = dict(zip(EXPORT_COLUMNS, row))
+                record["session_id"] = str(record["session_id"])
+                record["timestamp"] = record["timestamp"].isoformat()
+                yield record
+
+
+def export_stream(email: str, fmt: str = "ndjson", session_id: str = None, chunk_size: int = EXPORT_CHUNK_ROWS):
+    """Yield the export as text, ``chunk_size`` rows per chunk."""
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f"unknown export format: {fmt}")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    for record in export_rows(email, session_id, chunk_size):
+        if writer:
+            writer.writerow([record[column] for column in EXPORT_COLUMNS])
+        else:
+            buffer.write(json.dumps(record, ensure_ascii=False) + "\n")
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# ----------------------------- Reading import files -----------------------------
+
+class _JsonStream:
+    """Incremental reader for a top-level JSON array or object, one element at a time."""
+
+    def __init__(self, f, read_size: int = 1 << 16):
+        self._f = f
+        self._read_size = read_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._f.read(self._read_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _next_char(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buf):
+                char = self._buf[self._pos]
+                self._pos += 1
+                return char
+            if not self._fill():
+                raise ValueError("unexpected end of JSON input")
+
+    def _value(self):
+        self._next_char()
+        self._pos -= 1
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next chunk.
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def items(self):
+        """Yield (key, value) for an object, or (None, value) for an array."""
+        opening = self._next_char()
+        if opening not in "[{":
+            raise ValueError("expected a JSON array or object")
+        closing = "]" if opening == "[" else "}"
+        first = True
+        while True:
+            char = self._next_char()
+            if char == closing and first:
+                return
+            if not first:
+                if char == closing:
+                    return
+                if char != ",":
+                    raise ValueError(f"expected ',' or '{closing}' in JSON input")
+            else:
+                self._pos -= 1
+            first = False
+            key = None
+            if opening == "{":
+                key = self._value()
+                if self._next_char() != ":":
+                    raise ValueError("expected ':' in JSON input")
+            yield key, self._value()
+
+
+def read_records(path: str, key_field: str = None):
+    """Yield dicts from a CSV, NDJSON (``.ndjson``/``.jsonl``) or JSON file without loading it whole.
+
+    In a JSON object, each key is stored under ``key_field`` (``users.json``
+    maps e-mail to user).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8", newline="") as f:
+        if extension == ".csv":
+            yield from csv.DictReader(f)
+        elif extension in (".ndjson", ".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension == ".json":
+            for key, value in _JsonStream(f).items():
+                if key is not None and key_field:
+                    value = {key_field: key, **value}
+                yield value
+        else:
+            raise ValueError(f"unsupported file type: {path}")
+
+
+# ----------------------------- Import -----------------------------
+
+def _csv_field(value) -> str:
+    """Quote a value for COPY ... CSV; None stays unquoted so it is read as NULL."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        value = "true" if value else "false"
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class CopySource:
+    """File-like object feeding ``records`` to ``COPY ... FROM STDIN`` as CSV, as it is read."""
+
+    def __init__(self, records, columns, progress=None):
+        self._records = iter(records)
+        self._columns = columns
+        self._progress = progress
+        self._buffer = ""
+        self.rows = 0
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            record = next(self._records, None)
+            if record is None:
+                break
+            values = [record.get(column) for column in self._columns]
+            # CSV exports write NULL as an empty field.
+            values = [None if value == "" and column != "message" else value for value, column in zip(values, self._columns)]
+            self._buffer += ",".join(map(_csv_field, values)) + "\n"
+            self.rows += 1
+            if self._progress and self.rows % PROGRESS_EVERY == 0:
+                self._progress(f"read {self.rows} rows")
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _stage(cur, table: str, columns, records, progress) -> int:
+    cur.execute(f"CREATE TEMPORARY TABLE {table} ({', '.join(f'{c} text' for c in columns)}) ON COMMIT DROP")
+    source = CopySource(records, columns, progress)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", source, size=1 << 16)
+    progress(f"staged {source.rows} rows")
+    return source.rows
+
+
+def import_users(path: str, on_conflict: str = "skip", progress=print) -> dict:
+    """Load users from ``path``; returns {"read": n, "inserted": n, "updated": n}."""
+    if on_conflict not in ("skip", "update"):
+        raise ValueError(f"unknown conflict policy: {on_conflict}")
+    started = time.monotonic()
+    with db.cursor() as cur:
+        read = _stage(cur, "import_users", USER_COLUMNS, read_records(path, key_field="email"), progress)
+        cur.execute(
+            """
+            CREATE TEMPORARY TABLE import_users_clean ON COMMIT DROP AS
+            SELECT DISTINCT ON (lower(email)) lower(email) AS email, password, first_name, last_name, gender,
+                   dob::date AS dob, COALESCE(confirmed::boolean, false) AS confirmed
+            FROM import_users
+            WHERE email IS NOT NULL AND password IS NOT NULL
+            ORDER BY lower(email)
+            """
+        )
+        updated = 0
+        if on_conflict == "update":
+            cur.execute(
+                """
+                UPDATE users u
+                SET first_name = COALESCE(i.first_name, u.first_name),
+                    last_name = COALESCE(i.last_name, u.last_name),
+                    gender = COALESCE(i.gender, u.gender),
+                    dob = COALESCE(i.dob, u.dob),
+                    confirmed = u.confirmed OR i.confirmed
+                FROM import_users_clean i
+                WHERE u.email = i.email
+                """
+            )
+            updated = cur.rowcount
+        cur.execute(
+            """
+            INSERT INTO users (email, password, first_name, last_name, gender, dob, confirmed)
+            SELECT email, password, first_name, last_name, gender, dob, confirmed
+            FROM import_users_clean
+            ON CONFLICT (email) DO NOTHING
+            """
+        )
+        inserted = cur.rowcount
+    progress(f"users: {inserted} inserted, {updated} updated, {read - inserted - updated} skipped "
+             f"in {time.monotonic() - started:.1f}s")
+    return {"read": read, "inserted": inserted, "updated": updated}
+
+
+def import_conversations(path: str, progress=print) -> dict:
+    """Load messages from ``path``; returns {"read": n, "inserted": n, "sessions": n}."""
+    started = time.monotonic()
+    with db.cursor() as cur:
+        read = _stage(cur, "import_conversations", CONVERSATION_COLUMNS, read_records(path), progress)
+        cur.execute(
+            """
+            CREATE TEMPORARY TABLE import_messages ON COMMIT DROP AS
+            SELECT DISTINCT lower(i.user_email) AS user_email, i.session_id::uuid AS session_id, i.title, i.sender,
+                   i.message, i."timestamp"::timestamptz AS "timestamp"
+            FROM import_conversations i
+            JOIN users u ON u.email = lower(i.user_email)
+            WHERE i.session_id IS NOT NULL AND i.sender IN ('user', 'bot')
+              AND i.message IS NOT NULL AND i."timestamp" IS NOT NULL
+            """
+        )
+        cur.execute('SELECT MIN("timestamp"), MAX("timestamp") FROM import_messages')
+        first, last = cur.fetchone()
+        if first is not None:
+            for name in partitions.ensure_range(cur, first, last):
+                progress(f"created partition {name}")
+
+        cur.execute(
+            """
+            INSERT INTO chat_sessions (id, user_email, title, created_at, last_message_at)
+            SELECT session_id, MIN(user_email),
+                   (ARRAY_AGG(title ORDER BY "timestamp") FILTER (WHERE title IS NOT NULL))[1],
+                   MIN("timestamp"), MAX("timestamp")
+            FROM import_messages
+            GROUP BY session_id
+            ON CONFLICT (id) DO UPDATE
+            SET created_at = LEAST(chat_sessions.created_at, EXCLUDED.created_at),
+                last_message_at = GREATEST(chat_sessions.last_message_at, EXCLUDED.last_message_at),
+                title = COALESCE(chat_sessions.title, EXCLUDED.title)
+            WHERE chat_sessions.user_email = EXCLUDED.user_email
+            """
+        )
+        sessions = cur.rowcount
+        cur.execute(
+            """
+            INSERT INTO conversations (user_email, message, sender, session_id, "timestamp")
+            SELECT i.user_email, i.message, i.sender, i.session_id, i."timestamp"
+            FROM import_messages i
+            JOIN chat_sessions s ON s.id = i.session_id AND s.user_email = i.user_email
+            WHERE NOT EXISTS (
+                SELECT 1 FROM conversations c
+                WHERE c.user_email = i.user_email AND c.session_id = i.session_id
+                  AND c."timestamp" = i."timestamp" AND c.sender = i.sender AND c.message = i.message
+            )
+            ORDER BY i."timestamp"
+            """
+        )
+        inserted = cur.rowcount
+    progress(f"conversations: {inserted} messages inserted, {read - inserted} skipped, "
+             f"{sessions} sessions created or updated in {time.monotonic() - started:.1f}s")
+    return {"read": read, "inserted": inserted, "sessions": sessions}
+
+
+# ----------------------------- CLI -----------------------------
+
+def main(argv) -> int:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="transfer.py", description="Bulk export and import of Cogi data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="stream a user's conversations")
+    export.add_argument("email")
+    export.add_argument("--format", choices=sorted(CONTENT_TYPES), default="ndjson")
+    export.add_argument("--session", help="export a single session")
+    export.add_argument("--output", help="file to write (default: stdout)")
+
+    load = commands.add_parser("import", help="bulk-load a JSON, NDJSON or CSV file")
+    load.add_argument("kind", choices=["users", "conversations"])
+    load.add_argument("path")
+    load.add_argument("--on-conflict", choices=["skip", "update"], default="skip", help="for users")
+
+    args = parser.parse_args(argv[1:])
+
+    def progress(message: str) -> None:
+        print(f"{datetime.now():%H:%M:%S} {message}", file=sys.stderr)
+
+    if args.command == "export":
+        out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+        try:
+            for chunk in export_stream(args.email, args.format, args.session):
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+    elif args.kind == "users":
+        import_users(args.path, args.on_conflict, progress)
+    else:
+        import_conversations(args.path, progress)
+    db.close_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,159 @@
+"""
+Persistence of chat turns (a user message and the bot's reply).
+
+A turn is written as one multi-row INSERT into ``conversations`` plus one
+upsert of its ``chat_sessions`` row, in a single transaction. Optionally,
+turns are buffered and written in batches (write-behind): the buffer is
+flushed when it reaches ``batch_size`` turns, after ``flush_interval``
+seconds, and on shutdown.
+
+An ``on_written`` callback sees every committed message with its new id
+(used to index user messages for long-term memory, see memory.py).
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from psycopg2.extras import execute_values
+
+import db
+
+log = logging.getLogger(__name__)
+
+
+def write_turns(cur, turns) -> list:
+    """Insert ``turns`` — (email, session_id, user_message, bot_reply, at) tuples — using ``cur``.
+
+    Returns the inserted messages as (email, session_id, id, sender, message) tuples.
+    """
+    rows = []
+    sessions = {}
+    for email, session_id, user_message, bot_reply, at in turns:
+        rows.append((email, user_message, "user", session_id, at))
+        rows.append((email, bot_reply, "bot", session_id, at))
+        # One row per session: ON CONFLICT cannot update the same row twice.
+        first = sessions.setdefault(session_id, [email, at, at])
+        first[2] = max(first[2], at)
+
+    ids = execute_values(
+        cur,
+        'INSERT INTO conversations (user_email, message, sender, session_id, "timestamp") VALUES %s RETURNING id',
+        rows,
+        fetch=True,
+    )
+    execute_values(
+        cur,
+        """
+        INSERT INTO chat_sessions (id, user_email, created_at, last_message_at) VALUES %s
+        ON CONFLICT (id) DO UPDATE
+        SET last_message_at = GREATEST(chat_sessions.last_message_at, EXCLUDED.last_message_at)
+        """,
+        [(sid, email, created, last) for sid, (email, created, last) in sessions.items()],
+    )
+    return [(email, sid, row_id, sender, message) for (email, message, sender, sid, _), (row_id,) in zip(rows, ids)]
+
+
+class TurnWriter:
+    """Writes turns either immediately or through a write-behind buffer.
+
+    With ``batch_size`` 0 (the default) every ``save`` is written before it
+    returns. Otherwise turns are queued for a background flusher; if the
+    buffer grows past ``max_buffer`` (e.g. while Postgres is unreachable),
+    ``save`` writes synchronously so failures reach the caller.
+    """
+
+    def __init__(self, batch_size: int = 0, flush_interval: float = 1.0, max_buffer: int = 1000, on_written=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.on_written = on_written
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, on_written=None):
+        return cls(
+            batch_size=int(os.environ.get("TURN_BATCH_SIZE", 0)),
+            flush_interval=float(os.environ.get("TURN_FLUSH_INTERVAL", 1)),
+            on_written=on_written,
+        )
+
+    def _write(self, turns) -> None:
+        with db.cursor() as cur:
+            written = write_turns(cur, turns)
+        if self.on_written is not None:
+            try:
+                self.on_written(written)
+            except Exception as exc:
+                log.error("Error in on_written callback: %s", exc)
+
+    def save(self, email: str, session_id: str, user_message: str, bot_reply: str, durable: bool = False):
+        """Persist one turn and return its timestamp; ``durable=True`` returns only once it is committed."""
+        at = datetime.now(timezone.utc)
+        turn = (email, session_id, user_message, bot_reply, at)
+        if self.batch_size <= 0 or self._closed:
+            self._write([turn])
+            return at
+        with self._cond:
+            # Started on first use, so a writer built before a fork (gunicorn
+            # --preload) gets its flusher in the worker process.
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="turn-writer", daemon=True)
+                self._thread.start()
+            overflow = len(self._buffer) >= self.max_buffer
+            if not overflow:
+                self._buffer.append(turn)
+                if len(self._buffer) >= self.batch_size:
+                    self._cond.notify()
+        if overflow:
+            self._write([turn])
+        elif durable:
+            self.flush()
+        return at
+
+    def flush(self) -> None:
+        """Write everything buffered so far; on failure the turns stay queued."""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            try:
+                self._write(batch)
+            except Exception:
+                with self._cond:
+                    self._buffer[:0] = batch
+                raise
+
+    def _run(self) -> None:
+        while not self._closed:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._buffer) < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            try:
+                self.flush()
+            except Exception as exc:
+                log.error("Error flushing chat turns: %s", exc)
+
+    def close(self) -> None:
+        """Stop the flusher and write any remaining turns."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._buffer)